@@ -6,6 +6,7 @@ import sys
 import json
 import os
 import math
+import time
 import webbrowser
 import requests
 from PyQt6.QtWidgets import (
@@ -14,9 +15,12 @@ from PyQt6.QtWidgets import (
     QPushButton, QLabel, QTableWidget, QTableWidgetItem,
     QHeaderView, QComboBox, QTextEdit
 )
-from PyQt6.QtGui import QAction, QColor, QBrush, QPen, QPainter, QPixmap, QFontMetrics, QFont, QTextOption
+from PyQt6.QtGui import QAction, QColor, QBrush, QPen, QPainter, QFontMetrics, QFont, QTextOption
 from PyQt6.QtCore import Qt, QTimer, QRectF, QPointF
 
+from icon_cache import ICONS
+from magistral_geometry import load_magistrals, set_waypoints
+from spatial_index import GridIndex
 from widgets import SwitchInfoDialog, PlanSwitchInfoDialog, AddPlanedSwitch, SwitchEditDialog, AddSwitchDialog
 
 
@@ -70,6 +74,8 @@ class MapCanvas(QGraphicsView):
             "map": {"name": "Unnamed", "width": "1200", "height": "800"},
             "switches": [], "plan_switches": [], "users": [], "soaps": [], "legends": [], "magistrals": []
         }
+        # Точки магистралей — списками чисел, а не строками "[x;y]..."
+        load_magistrals(self.map_data)
 
         self.setStyleSheet("border-radius: 12px; border: 3px solid #3d3d3d;")
         self.setSceneRect(0, 0, int(self.map_data["map"].get("width", "1200")), int(self.map_data["map"].get("height", "800")))
@@ -93,7 +99,21 @@ class MapCanvas(QGraphicsView):
         self._moved_during_rmb = False
 
         self.node_items = {}
-        self.magistral_items = []
+        # (id, тип) -> (иконка, оверлей, mayakup), как они нарисованы: по нему — точечные обновления статусов
+        self.drawn_status = {}
+        # Сколько элементов сцены изменило последнее точечное обновление
+        self.last_update_touched = 0
+        # Прямоугольники узлов и легенд для поиска под курсором и выделения рамкой
+        self.spatial = GridIndex()
+        # id магистрали -> {"lines", "labels"}: элементы сцены одной магистрали, при сдвиге узла
+        # переносятся на месте (update_link_geometry), а не рисуются заново
+        self.link_items = {}
+        # id узла -> входящие в него магистрали: сдвиг узла трогает только их
+        self.links_by_node = {}
+        self.links_by_id = {}
+        self.magistral_nodes = {}
+        # Магистрали, ждущие перерисовки, пока групповой сдвиг переставляет их точки
+        self.pending_links = None
         
         self.magistral_points = {}
 
@@ -117,6 +137,8 @@ class MapCanvas(QGraphicsView):
         # Флаг загрузки данных
         self.is_data_loaded = False
         self.loading_text_item = None
+        # Плашка «данные из снимка» — пока сервер не прислал актуальную карту
+        self.stale_label = None
 
     # === КООРДИНАТЫ — ЕДИНЫЙ ИСТОЧНИК: xy["x"], xy["y"] ===
     def get_node_xy(self, node, ntype):
@@ -152,17 +174,18 @@ class MapCanvas(QGraphicsView):
         return tx, ty
 
     # === НОВЫЙ МЕТОД: Установка данных карты ===
-    def set_map_data(self, map_data):
-        """Устанавливает данные карты и запускает рендеринг"""
+    def set_map_data(self, map_data, render=True):
+        """Устанавливает данные карты и запускает рендеринг (render=False — отрисует вызывающий)"""
         if map_data and "map" in map_data:
-            self.map_data = map_data
+            self.map_data = load_magistrals(map_data)
             self.is_data_loaded = True
             # Обновляем размеры сцены
             self.setSceneRect(0, 0, 
                 int(self.map_data["map"].get("width", "1200")), 
                 int(self.map_data["map"].get("height", "800")))
             # Рендерим карту
-            self.render_map()
+            if render:
+                self.render_map()
         else:
             print("Warning: Invalid map_data provided")
             self.show_loading_indicator()
@@ -182,9 +205,10 @@ class MapCanvas(QGraphicsView):
         self.is_data_loaded = True
 
         self.scene.clear()
-        self.magistral_items = []
+        self.link_items = {}
         self.magistral_points.clear()  # Очищаем словарь точек при полной перерисовке
         self.node_items.clear()
+        self.drawn_status.clear()
         self.selection_graphics.clear()
         self.scene.setBackgroundBrush(QBrush(QColor("#008080")))
 
@@ -234,47 +258,13 @@ class MapCanvas(QGraphicsView):
                 items = []
 
                 # ——— ОПРЕДЕЛЕНИЕ ИКОНКИ И ОВЕРЛЕЯ ———
-                image_path = None
-                overlay_path = None
-
-                if node_type == "switch":
-                    image_path = "canvas/Router.png"
-                    overlay_path = None
-
-                    # 1. ПИНГ — САМЫЙ ВЫСОКИЙ ПРИОРИТЕТ
-                    if str(node.get("pingok", "")).lower() in ("false", "0", "", "none"):
-                        image_path = "canvas/Router_off.png"
-                        overlay_path = "canvas/other/ping_failed.png"
-
-                    # 2. Не установлен
-                    elif node.get("notinstalled") == "-1":
-                        image_path = "canvas/Router_off.png"
-                        overlay_path = "canvas/other/not_install.png"
-
-                    # 3. Установлен, но не настроен
-                    elif node.get("notsettings") == "-1":
-                        image_path = "canvas/Router.png"
-                        overlay_path = "canvas/other/not_settings.png"
-                    
-                    # 4. НОВОЕ: Копия (copyid установлен и не "none")
-                    elif node.get("copyid") and node.get("copyid") not in ["none", ""]:
-                        # Если нет других overlay, показываем copy.png
-                        if not overlay_path:
-                            overlay_path = "canvas/other/copy.png"
-
-                elif node_type == "plan_switch":
-                    image_path = "canvas/Router_plan.png"
-
-                elif node_type == "user":
-                    image_path = "canvas/Computer.png"
-
-                elif node_type == "soap":
-                    image_path = "canvas/Switch.png"
+                status = self.node_status(node, node_type)
+                image_path, overlay_path, _ = status
 
                 # ——— РИСОВАНИЕ ОСНОВНОЙ ИКОНКИ ———
                 w = h = 0
-                if image_path and os.path.exists(image_path):
-                    pixmap = QPixmap(image_path)
+                pixmap = ICONS.get(image_path) if image_path else None
+                if pixmap is not None:
                     pixmap_item = self.scene.addPixmap(pixmap)
                     w, h = pixmap.width(), pixmap.height()
                     pixmap_item.setPos(x - w/2, y - h/2)
@@ -293,41 +283,16 @@ class MapCanvas(QGraphicsView):
                     w, h = 50, 50
 
                 # ——— ОВЕРЛЕЙ (если есть) ———
-                if overlay_path and os.path.exists(overlay_path):
-                    overlay = QPixmap(overlay_path)
+                overlay = ICONS.get(overlay_path) if overlay_path else None
+                if overlay is not None:
                     overlay_item = self.scene.addPixmap(overlay)
                     overlay_item.setPos(x - w/2, y - h/2)
                     overlay_item.setZValue(3)
                     items.append(overlay_item)
                 # ——— ИНДИКАТОР MAYAKUP (только для switch) ———
                 if node_type == "switch" and "mayakup" in node:
-                    mayakup_value = node.get("mayakup")
-                    # Определяем цвет: зеленый если true, красный если false
-                    if mayakup_value is True:
-                        indicator_color = QColor("#00ff00")  # Зеленый
-                    elif mayakup_value is False:
-                        indicator_color = QColor("#ff0000")  # Красный
-                    else:
-                        indicator_color = None
-                    
-                    # Рисуем круг только если цвет определен
-                    if indicator_color:
-                        # Радиус 5px, диаметр 10px
-                        radius = 5
-                        # Позиция: правый верхний угол иконки
-                        circle_x = x
-                        circle_y = y
-                        
-                        # Создаем круг
-                        circle_item = self.scene.addEllipse(
-                            circle_x - radius, 
-                            circle_y - radius, 
-                            radius * 2, 
-                            radius * 2,
-                            pen=QPen(indicator_color, 1),
-                            brush=QBrush(indicator_color)
-                        )
-                        circle_item.setZValue(5)  # Поверх всего
+                    circle_item = self.add_mayakup_indicator(x, y, node.get("mayakup"))
+                    if circle_item:
                         items.append(circle_item)
 
                 # ——— ПОДПИСЬ ———
@@ -348,9 +313,172 @@ class MapCanvas(QGraphicsView):
                 items.append(text_item)
 
                 self.node_items[key] = items
+                self.drawn_status[key] = status
 
+        self.rebuild_spatial_index()
         self.update_selection_graphics()
 
+    # === ПРОСТРАНСТВЕННЫЙ ИНДЕКС ===
+    def node_lists(self, with_legends=True):
+        """(список, тип, ключ map_data) в порядке, в котором узлы перебираются при поиске и выделении"""
+        lists = [
+            (self.map_data.get("switches", []), "switch", "switches"),
+            (self.map_data.get("plan_switches", []), "plan_switch", "plan_switches"),
+            (self.map_data.get("users", []), "user", "users"),
+            (self.map_data.get("soaps", []), "soap", "soaps"),
+        ]
+        if with_legends:
+            lists.append((self.map_data.get("legends", []), "legend", "legends"))
+        return lists
+
+    def spatial_rect(self, node, ntype):
+        r = self.get_node_rect(node, ntype)
+        return r.left(), r.top(), r.right(), r.bottom()
+
+    def rebuild_spatial_index(self):
+        self.spatial.clear()
+        for items, ntype, key in self.node_lists():
+            for item in items:
+                self.spatial.insert((item["id"], ntype), self.spatial_rect(item, ntype), (item, ntype, key))
+
+    # === СТАТУСЫ УЗЛОВ ===
+    def node_status(self, node, ntype):
+        """(иконка, оверлей, mayakup) — всё, что в виде узла зависит от его статуса"""
+        image_path = None
+        overlay_path = None
+
+        if ntype == "switch":
+            image_path = "canvas/Router.png"
+
+            # 1. ПИНГ — САМЫЙ ВЫСОКИЙ ПРИОРИТЕТ
+            if str(node.get("pingok", "")).lower() in ("false", "0", "", "none"):
+                image_path = "canvas/Router_off.png"
+                overlay_path = "canvas/other/ping_failed.png"
+
+            # 2. Не установлен
+            elif node.get("notinstalled") == "-1":
+                image_path = "canvas/Router_off.png"
+                overlay_path = "canvas/other/not_install.png"
+
+            # 3. Установлен, но не настроен
+            elif node.get("notsettings") == "-1":
+                image_path = "canvas/Router.png"
+                overlay_path = "canvas/other/not_settings.png"
+
+            # 4. Копия (copyid установлен и не "none")
+            elif node.get("copyid") and node.get("copyid") not in ["none", ""]:
+                overlay_path = "canvas/other/copy.png"
+
+        elif ntype == "plan_switch":
+            image_path = "canvas/Router_plan.png"
+
+        elif ntype == "user":
+            image_path = "canvas/Computer.png"
+
+        elif ntype == "soap":
+            image_path = "canvas/Switch.png"
+
+        mayakup = node.get("mayakup") if ntype == "switch" else None
+        return image_path, overlay_path, mayakup
+
+    def add_mayakup_indicator(self, x, y, mayakup_value):
+        """Круг MAYAKUP в центре иконки: зелёный — true, красный — false, иначе не рисуется"""
+        if mayakup_value is True:
+            indicator_color = QColor("#00ff00")
+        elif mayakup_value is False:
+            indicator_color = QColor("#ff0000")
+        else:
+            return None
+        radius = 5
+        circle_item = self.scene.addEllipse(
+            x - radius, y - radius, radius * 2, radius * 2,
+            pen=QPen(indicator_color, 1),
+            brush=QBrush(indicator_color)
+        )
+        circle_item.setZValue(5)  # Поверх всего
+        return circle_item
+
+    def update_node_statuses(self, nodes, ntype="switch"):
+        """Приводит вид узлов к их статусу без перестройки сцены.
+
+        Для каждого узла сравнивает node_status с нарисованным и меняет только
+        отличающиеся элементы node_items[(id, ntype)]: иконку, оверлей, круг
+        MAYAKUP. Возвращает число затронутых элементов сцены.
+        """
+        touched = 0
+        for node in nodes:
+            key = (node.get("id"), ntype)
+            items = self.node_items.get(key)
+            if not items:
+                continue
+            status = self.node_status(node, ntype)
+            drawn = self.drawn_status.get(key, (None, None, None))
+            if status == drawn:
+                continue
+            touched += self._apply_node_status(node, ntype, items, drawn, status)
+            self.drawn_status[key] = status
+            # Иконка другого размера меняет и прямоугольник узла
+            self.spatial.move(key, self.spatial_rect(node, ntype))
+        self.last_update_touched = touched
+        return touched
+
+    def _apply_node_status(self, node, ntype, items, drawn, status):
+        x, y = self.get_node_xy(node, ntype)
+        image_path, overlay_path, mayakup = status
+        touched = 0
+
+        # Основная иконка — всегда первый элемент узла (запасной прямоугольник от статуса не зависит)
+        main_item = items[0]
+        if isinstance(main_item, QGraphicsPixmapItem):
+            pixmap = ICONS.get(image_path) if image_path and image_path != drawn[0] else None
+            if pixmap is not None:
+                main_item.setPixmap(pixmap)
+                main_item.setPos(x - pixmap.width() / 2, y - pixmap.height() / 2)
+                touched += 1
+            w, h = main_item.pixmap().width(), main_item.pixmap().height()
+        else:
+            w, h = 50, 50
+
+        if overlay_path != drawn[1]:
+            overlay_item = next((i for i in items[1:] if isinstance(i, QGraphicsPixmapItem)), None)
+            overlay = ICONS.get(overlay_path) if overlay_path else None
+            if overlay is not None:
+                if overlay_item is None:
+                    overlay_item = self.scene.addPixmap(overlay)
+                    overlay_item.setZValue(3)
+                    items.insert(1, overlay_item)
+                else:
+                    overlay_item.setPixmap(overlay)
+                overlay_item.setPos(x - w / 2, y - h / 2)
+                touched += 1
+            elif overlay_item is not None:
+                self.scene.removeItem(overlay_item)
+                items.remove(overlay_item)
+                touched += 1
+
+        if mayakup != drawn[2]:
+            circle_item = next((i for i in items if isinstance(i, QGraphicsEllipseItem)), None)
+            if circle_item is not None:
+                self.scene.removeItem(circle_item)
+                items.remove(circle_item)
+                touched += 1
+            circle_item = self.add_mayakup_indicator(x, y, mayakup)
+            if circle_item:
+                items.insert(len(items) - 1, circle_item)  # перед подписью, как при полной отрисовке
+                touched += 1
+        return touched
+
+    def set_edit_mode(self, is_edit_mode):
+        """Режим правки меняет на сцене только желтые точки магистралей — добавляются или убираются лишь они"""
+        if is_edit_mode == self.is_edit_mode:
+            return 0
+        self.is_edit_mode = is_edit_mode
+        if is_edit_mode:
+            self.last_update_touched = self.draw_magistral_points()
+        else:
+            self.last_update_touched = self.clear_magistral_points()
+        return self.last_update_touched
+
     def show_loading_indicator(self):
         """Показывает индикатор загрузки"""
         if not self.loading_text_item:
@@ -372,12 +500,47 @@ class MapCanvas(QGraphicsView):
             )
             self.loading_text_item.setZValue(1000)
 
+    def set_loading_progress(self, received, total):
+        """Ход загрузки карты (потоковая передача): процент и объём в индикаторе загрузки"""
+        if self.is_data_loaded:
+            return
+        self.show_loading_indicator()
+        if total:
+            text = f"Загрузка данных карты... {received * 100 // total}% ({received / 1048576:.1f} из {total / 1048576:.1f} МБ)"
+        else:
+            text = f"Загрузка данных карты... {received / 1048576:.1f} МБ"
+        self.loading_text_item.setPlainText(text)
+        rect = self.sceneRect()
+        text_rect = self.loading_text_item.boundingRect()
+        self.loading_text_item.setPos(
+            rect.center().x() - text_rect.width() / 2,
+            rect.center().y() - text_rect.height() / 2
+        )
+
     def hide_loading_indicator(self):
         """Убирает индикатор загрузки"""
         if self.loading_text_item:
             self.scene.removeItem(self.loading_text_item)
             self.loading_text_item = None
 
+    def set_stale(self, saved_at=None):
+        """Показывает плашку устаревших данных (карта из локального снимка от saved_at) или убирает её"""
+        if saved_at is None:
+            if self.stale_label:
+                self.stale_label.hide()
+            return
+        if not self.stale_label:
+            # Виджет поверх viewport, а не элемент сцены: не пропадает при scene.clear() и прокрутке
+            self.stale_label = QLabel(self)
+            self.stale_label.setStyleSheet(
+                "background-color: rgba(51, 51, 51, 200); color: #FFC107; font-weight: bold;"
+                "padding: 4px 8px; border: 1px solid #FFC107; border-radius: 4px;")
+            self.stale_label.move(12, 12)
+        saved = time.strftime("%d.%m %H:%M", time.localtime(saved_at))
+        self.stale_label.setText(f"Устаревшие данные: снимок от {saved}, ждём сервер")
+        self.stale_label.adjustSize()
+        self.stale_label.show()
+
     def update_node_graphics(self, node, ntype):
         key = (node["id"], ntype)
         if key not in self.node_items:
@@ -419,91 +582,103 @@ class MapCanvas(QGraphicsView):
             if text_item:
                 text_item.setPos(x - text_item.boundingRect().width()/2, y + h/2 + 15)
 
-    def update_magistral_point_data(self, link_id, idx, x, y):
-        """Обновляет координаты точки магистрали в данных"""
-        for link in self.map_data.get("magistrals", []):
-            if link["id"] == link_id:
-                import re
-                pts = []
-                if link.get("nodes"):
-                    pts = [(float(a), float(b)) for a, b in re.findall(r'([+-]?\d+(?:\.\d+)?)\s*;\s*([+-]?\d+(?:\.\d+)?)', str(link["nodes"]))]
-                
-                while len(pts) < idx:
-                    pts.append((0.0, 0.0))
-                
-                pts[idx - 1] = (x, y)
-                link["nodes"] = "".join(f"[{x:.1f};{y:.1f}]" for x, y in pts)
-                break
-        
-        # Перерисовываем магистрали без рекурсии
-        self.refresh_magistrals_only()
+        self.spatial.move(key, self.spatial_rect(node, ntype))
 
-    def refresh_magistrals_only(self):
-        """Обновляет только линии магистралей без пересоздания точек"""
-        # Удаляем линии, прямоугольники и текстовые элементы, но НЕ точки (MagistralPoint)
-        for item in self.magistral_items[:]:
-            try:
-                if not isinstance(item, MagistralPoint) and item.scene():
-                    self.scene.removeItem(item)
-            except (RuntimeError, AttributeError):
-                # Объект уже удалён
-                pass
-        
-        # Фильтруем список, сохраняя только точки
-        self.magistral_items = [item for item in self.magistral_items if isinstance(item, MagistralPoint)]
-        
-        # Перерисовываем линии
-        import re
-        nodes_by_id = {}
-        for lst, typ in [
-            (self.map_data.get("switches", []), "switch"),
-            (self.map_data.get("plan_switches", []), "plan_switch"),
-            (self.map_data.get("users", []), "user"),
-            (self.map_data.get("soaps", []), "soap"),
-            (self.map_data.get("legends", []), "legend")
-        ]:
+    # === МАГИСТРАЛИ ===
+    def index_magistrals(self):
+        """Индексы магистралей: узлы по id, магистрали по id и по id узла на каждом конце"""
+        self.magistral_nodes = {}
+        for lst, typ, _key in self.node_lists():
             for node in lst:
-                nodes_by_id[node["id"]] = (node, typ)
-
-        def parse_nodes(s):
-            if not s: return []
-            return [(float(a), float(b)) for a, b in re.findall(r'([+-]?\d+(?:\.\d+)?)\s*;\s*([+-]?\d+(?:\.\d+)?)', str(s))]
-
+                self.magistral_nodes[node["id"]] = (node, typ)
+        self.links_by_id = {}
+        self.links_by_node = {}
         for link in self.map_data.get("magistrals", []):
-            start = nodes_by_id.get(link.get("startid"))
-            end = nodes_by_id.get(link.get("endid"))
-            if not start or not end:
-                continue
-
-            sx, sy = self.get_node_xy(*start)
-            ex, ey = self.get_node_xy(*end)
-            intermediate = parse_nodes(link.get("nodes", ""))
-            points = [(sx, sy)] + intermediate + [(ex, ey)]
+            self.links_by_id[link["id"]] = link
+            self.links_by_node.setdefault(link.get("startid"), []).append(link)
+            if link.get("endid") != link.get("startid"):
+                self.links_by_node.setdefault(link.get("endid"), []).append(link)
+
+    def link_points(self, link):
+        """Вершины ломаной магистрали: центр начального узла, промежуточные точки, центр конечного (None — узла нет)"""
+        start = self.magistral_nodes.get(link.get("startid"))
+        end = self.magistral_nodes.get(link.get("endid"))
+        if not start or not end:
+            return None
+        return [self.get_node_xy(*start)] + (link.get("nodes") or []) + [self.get_node_xy(*end)]
+
+    def link_pen(self, link):
+        pen = QPen(QColor(link.get("color", "#000000")), float(link.get("width", 1)))
+        if link.get("style") == "psdot":
+            pen.setDashPattern([5, 5])
+        return pen
 
-            pen = QPen(QColor(link.get("color", "#000000")), float(link.get("width", 1)))
-            if link.get("style") == "psdot":
-                pen.setDashPattern([5, 5])
-
-            for i in range(len(points) - 1):
-                line = self.scene.addLine(points[i][0], points[i][1], points[i+1][0], points[i+1][1], pen)
-                line.setZValue(0)
-                self.magistral_items.append(line)
-            
-            # НОВОЕ: Отображение номеров портов на магистралях
-            self.draw_magistral_port_labels(link, points)
-
-    def update_magistrals(self):
-        # Очистка старого
-        for item in self.magistral_items[:]:
-            try:
-                if item.scene():
-                    self.scene.removeItem(item)
-            except RuntimeError:
-                # Объект уже удалён
-                pass
-        self.magistral_items.clear()
-
-        # Безопасная очистка точек
+    def update_magistral_point_data(self, link_id, idx, x, y):
+        """Обновляет координаты точки магистрали в данных"""
+        link = self.links_by_id.get(link_id)
+        if link is None:
+            return
+        pts = link.get("nodes") or []
+        while len(pts) < idx:
+            pts.append([0.0, 0.0])
+        pts[idx - 1] = [x, y]
+        # В строку точки собираются только при сохранении (dump_magistrals)
+        set_waypoints(link, pts)
+
+        # Перерисовываем только эту магистраль; при групповом сдвиге — один раз после всех точек
+        if self.pending_links is not None:
+            self.pending_links[link_id] = link
+        else:
+            self.update_link_geometry(link)
+
+    def update_links_for_nodes(self, node_ids, links=None):
+        """Перерисовывает магистрали, входящие в узлы node_ids (и links: id -> магистраль); возвращает их число"""
+        links = {} if links is None else links
+        for node_id in node_ids:
+            for link in self.links_by_node.get(node_id, ()):
+                links[link["id"]] = link
+        for link in links.values():
+            self.update_link_geometry(link)
+        return len(links)
+
+    def update_link_geometry(self, link):
+        """Переносит линии и подписи портов одной магистрали на текущие координаты её концов и точек"""
+        items = self.link_items.get(link["id"])
+        points = self.link_points(link)
+        if items is None or points is None:
+            return
+        lines = items["lines"]
+        if len(lines) == len(points) - 1:
+            for line, (x1, y1), (x2, y2) in zip(lines, points, points[1:]):
+                line.setLine(x1, y1, x2, y2)
+        else:
+            # Число промежуточных точек изменилось — сегменты создаются заново
+            for line in lines:
+                self.scene.removeItem(line)
+            items["lines"] = self.draw_link_lines(link, points)
+
+        for item in items["labels"]:
+            self.scene.removeItem(item)
+        items["labels"] = self.draw_magistral_port_labels(link, points)
+
+    def clear_magistrals(self):
+        """Убирает со сцены все элементы магистралей; возвращает их число"""
+        removed = 0
+        for items in self.link_items.values():
+            for item in items["lines"] + items["labels"]:
+                try:
+                    if item.scene():
+                        self.scene.removeItem(item)
+                except RuntimeError:
+                    # Объект уже удалён
+                    pass
+                removed += 1
+        self.link_items = {}
+        return removed + self.clear_magistral_points()
+
+    def clear_magistral_points(self):
+        """Безопасная очистка желтых точек; возвращает их число"""
+        removed = 0
         for key, dot in list(self.magistral_points.items()):
             try:
                 if dot and dot.scene():
@@ -511,70 +686,53 @@ class MapCanvas(QGraphicsView):
             except (RuntimeError, AttributeError):
                 # Объект уже удалён
                 pass
-        
-        if not self.is_edit_mode:
-            self.magistral_points.clear()
-
-        import re
+            removed += 1
+        self.magistral_points.clear()
+        return removed
 
-        nodes_by_id = {}
-        for lst, typ in [
-            (self.map_data.get("switches", []), "switch"),
-            (self.map_data.get("plan_switches", []), "plan_switch"),
-            (self.map_data.get("users", []), "user"),
-            (self.map_data.get("soaps", []), "soap"),
-            (self.map_data.get("legends", []), "legend")
-        ]:
-            for node in lst:
-                nodes_by_id[node["id"]] = (node, typ)
-
-        def parse_nodes(s):
-            if not s: return []
-            return [(float(a), float(b)) for a, b in re.findall(r'([+-]?\d+(?:\.\d+)?)\s*;\s*([+-]?\d+(?:\.\d+)?)', str(s))]
+    def update_magistrals(self):
+        """Полная перерисовка магистралей (после render_map и смены набора узлов)"""
+        self.clear_magistrals()
+        self.index_magistrals()
 
         for link in self.map_data.get("magistrals", []):
-            start = nodes_by_id.get(link.get("startid"))
-            end = nodes_by_id.get(link.get("endid"))
-            if not start or not end:
+            points = self.link_points(link)
+            if points is None:
                 continue
+            self.link_items[link["id"]] = {
+                "lines": self.draw_link_lines(link, points),
+                # НОВОЕ: Отображение номеров портов на магистралях
+                "labels": self.draw_magistral_port_labels(link, points),
+            }
 
-            sx, sy = self.get_node_xy(*start)
-            ex, ey = self.get_node_xy(*end)
-            intermediate = parse_nodes(link.get("nodes", ""))
-            points = [(sx, sy)] + intermediate + [(ex, ey)]
-
-            # Линии
-            pen = QPen(QColor(link.get("color", "#000000")), float(link.get("width", 1)))
-            if link.get("style") == "psdot":
-                pen.setDashPattern([5, 5])
-
-            for i in range(len(points) - 1):
-                line = self.scene.addLine(points[i][0], points[i][1], points[i+1][0], points[i+1][1], pen)
-                line.setZValue(0)
-                self.magistral_items.append(line)
-
-            # НОВОЕ: Отображение номеров портов на магистралях
-            self.draw_magistral_port_labels(link, points)
-
-            # ЖЕЛТЫЕ ТОЧКИ — ИСПРАВЛЕНО: используем новый класс MagistralPoint
-            if self.is_edit_mode and len(points) > 2:
-                for idx in range(1, len(points) - 1):
-                    px, py = points[idx]
-                    
-                    # Создаём точку с использованием нового класса
-                    dot = MagistralPoint(px, py, link, idx, self)
-                    
-                    # Добавляем в сцену
-                    self.scene.addItem(dot)
-                    
-                    # Сохраняем
-                    self.magistral_points[(link["id"], idx)] = dot
-                    self.magistral_items.append(dot)
+        if self.is_edit_mode:
+            self.draw_magistral_points()
+
+    def draw_link_lines(self, link, points):
+        pen = self.link_pen(link)
+        lines = []
+        for (x1, y1), (x2, y2) in zip(points, points[1:]):
+            line = self.scene.addLine(x1, y1, x2, y2, pen)
+            line.setZValue(0)
+            lines.append(line)
+        return lines
+
+    def draw_magistral_points(self):
+        """ЖЕЛТЫЕ ТОЧКИ промежуточных вершин магистралей (режим правки); возвращает их число"""
+        for link in self.map_data.get("magistrals", []):
+            if link["id"] not in self.link_items:
+                continue
+            for idx, (px, py) in enumerate(link.get("nodes") or [], start=1):
+                dot = MagistralPoint(px, py, link, idx, self)
+                self.scene.addItem(dot)
+                self.magistral_points[(link["id"], idx)] = dot
+        return len(self.magistral_points)
     
     def draw_magistral_port_labels(self, link, points):
-        """Отрисовка подписей портов на магистралях"""
+        """Отрисовка подписей портов на магистралях; возвращает созданные элементы"""
+        labels = []
         if len(points) < 2:
-            return
+            return labels
         
         # Получаем данные портов
         start_port = link.get("startport", "")
@@ -589,7 +747,7 @@ class MapCanvas(QGraphicsView):
         
         # Если нет данных о портах, ничего не рисуем
         if not start_port and not end_port:
-            return
+            return labels
         
         # ИСПРАВЛЕНИЕ 2: Используем цвет порта из startportcolor/endportcolor
         start_color = link.get("startportcolor", "#FFC107")
@@ -600,7 +758,7 @@ class MapCanvas(QGraphicsView):
         
         # Рисуем подпись начального порта
         if start_port:
-            self.draw_port_label(
+            labels += self.draw_port_label(
                 start_port, 
                 points[0], 
                 points[1], 
@@ -611,7 +769,7 @@ class MapCanvas(QGraphicsView):
         
         # Рисуем подпись конечного порта
         if end_port:
-            self.draw_port_label(
+            labels += self.draw_port_label(
                 end_port, 
                 points[-1], 
                 points[-2], 
@@ -619,6 +777,7 @@ class MapCanvas(QGraphicsView):
                 end_far, 
                 is_start=False
             )
+        return labels
     
     def draw_port_label(self, port_text, pos, neighbor_pos, color, distance, is_start=True):
         """Рисует подпись порта с прямоугольником"""
@@ -628,7 +787,7 @@ class MapCanvas(QGraphicsView):
         length = math.sqrt(dx*dx + dy*dy)
         
         if length == 0:
-            return
+            return []
         
         # Нормализуем направление
         dx /= length
@@ -682,9 +841,7 @@ class MapCanvas(QGraphicsView):
         )
         text_item.setZValue(11)
 
-        # Сохраняем элементы
-        self.magistral_items.append(rect_item)
-        self.magistral_items.append(text_item)
+        return [rect_item, text_item]
 
     # === МЫШЬ ===
     def mousePressEvent(self, event):
@@ -784,6 +941,8 @@ class MapCanvas(QGraphicsView):
         if self.drag_group:
             dx = scene_pos.x() - self.drag_start_pos.x()
             dy = scene_pos.y() - self.drag_start_pos.y()
+            moved_ids = []
+            self.pending_links = {}
             for (node, ntype, key_data), (ox, oy) in zip(self.selected_nodes, self.group_drag_offset):
                 new_x = self.drag_start_pos.x() - ox + dx
                 new_y = self.drag_start_pos.y() - oy + dy
@@ -796,7 +955,9 @@ class MapCanvas(QGraphicsView):
                     # Обычные узлы
                     self.set_node_xy(node, ntype, new_x, new_y)
                     self.update_node_graphics(node, ntype)
-            self.update_magistrals()
+                    moved_ids.append(node["id"])
+            links, self.pending_links = self.pending_links, None
+            self.update_links_for_nodes(moved_ids, links)
             self.update_selection_graphics()
             event.accept()
             return
@@ -805,7 +966,7 @@ class MapCanvas(QGraphicsView):
             x, y = scene_pos.x(), scene_pos.y()
             self.set_node_xy(self.dragged_node, self.dragged_type, x, y)
             self.update_node_graphics(self.dragged_node, self.dragged_type)
-            self.update_magistrals()
+            self.update_links_for_nodes([self.dragged_node["id"]])
             self.update_selection_graphics()
             event.accept()
             return
@@ -898,18 +1059,9 @@ class MapCanvas(QGraphicsView):
 
     # === ВЫДЕЛЕНИЕ ===
     def update_selection_from_rect(self, rect):
-        self.selected_nodes = []
-        for items, ntype, key in [
-            (self.map_data.get("switches", []), "switch", "switches"),
-            (self.map_data.get("plan_switches", []), "plan_switch", "plan_switches"),
-            (self.map_data.get("users", []), "user", "users"),
-            (self.map_data.get("soaps", []), "soap", "soaps"),
-            (self.map_data.get("legends", []), "legend", "legends")
-        ]:
-            for item in items:
-                item_rect = self.get_node_rect(item, ntype)
-                if rect.contains(item_rect):
-                    self.selected_nodes.append((item, ntype, key))
+        # Из индекса — только узлы целиком внутри рамки, без перебора всей карты
+        found = self.spatial.query_rect((rect.left(), rect.top(), rect.right(), rect.bottom()), contained=True)
+        self.selected_nodes = [value for _key, value in found]
         
         # ИСПРАВЛЕНИЕ: Добавляем точки магистралей в выделение
         if self.is_edit_mode:
@@ -966,31 +1118,17 @@ class MapCanvas(QGraphicsView):
         closest = None
         min_dist = float('inf')
 
-        # Обычные узлы
-        for items, ntype, key in [
-            (self.map_data.get("switches", []), "switch", "switches"),
-            (self.map_data.get("plan_switches", []), "plan_switch", "plan_switches"),
-            (self.map_data.get("users", []), "user", "users"),
-            (self.map_data.get("soaps", []), "soap", "soaps")
-        ]:
-            for item in items:
-                rect = self.get_node_rect(item, ntype)
-                if rect.contains(pos):
-                    x, y = self.get_node_xy(item, ntype)
-                    dist = math.hypot(pos.x() - x, pos.y() - y)
-                    if dist < min_dist:
-                        min_dist = dist
-                        closest = (item, ntype, key)
-
-        # Легенды — только по периметру
-        for item in self.map_data.get("legends", []):
-            rect = self.get_node_rect(item, "legend")
-            if self.is_on_perimeter(pos, rect):
-                x, y = self.get_node_xy(item, "legend")
-                dist = math.hypot(pos.x() - x, pos.y() - y)
-                if dist < min_dist:
-                    min_dist = dist
-                    closest = (item, "legend", "legends")
+        # Кандидаты — только прямоугольники под точкой, из пространственного индекса
+        for _key, (item, ntype, key) in self.spatial.query_point(pos.x(), pos.y()):
+            rect = self.get_node_rect(item, ntype)
+            # Легенды — только по периметру
+            if ntype == "legend" and not self.is_on_perimeter(pos, rect):
+                continue
+            x, y = self.get_node_xy(item, ntype)
+            dist = math.hypot(pos.x() - x, pos.y() - y)
+            if dist < min_dist:
+                min_dist = dist
+                closest = (item, ntype, key)
 
         return closest
 
@@ -1036,10 +1174,9 @@ class MapCanvas(QGraphicsView):
         if hasattr(self.parent, "edit_button"):
             self.parent.edit_button.click()
         else:
-            self.is_edit_mode = not self.is_edit_mode
+            self.set_edit_mode(not self.is_edit_mode)
             if not self.is_edit_mode:
                 self.show_status_saved()
-            self.render_map()
 
     def trigger_parent_settings_button(self):
         QTimer.singleShot(0, self._open_settings)
@@ -0,0 +1,52 @@
+# file_writer.py — запись локальных файлов состояния (журнал записи, кеш карт, снимки) в фоновом потоке
+#
+# Данные сериализуются вызывающим в GUI-потоке (pickle.dumps — это и есть снимок, который
+# дальше не меняется), а открытие, запись, fsync и подмена файла идут в одном фоновом
+# потоке: сохранение карты не подвешивает интерфейс на диске. Поток один, поэтому записи
+# в один и тот же файл ложатся в порядке постановки.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="file-writer")
+
+
+def write_atomic(path, blob, fsync=False):
+    """Пишет blob во временный файл и подменяет path, чтобы сбой посреди записи не испортил файл"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(blob)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+def _write_logged(path, blob, fsync):
+    try:
+        write_atomic(path, blob, fsync)
+    except Exception as e:
+        print(f"Ошибка записи {path}: {e}")
+
+
+def write_later(path, blob, fsync=False):
+    """Ставит запись blob в path в очередь фонового потока"""
+    return _executor.submit(_write_logged, path, blob, fsync)
+
+
+def remove_later(path):
+    """Удаляет path в том же потоке — после уже поставленных записей в него"""
+    def remove():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return _executor.submit(remove)
+
+
+def flush(timeout=10):
+    """Ждёт, пока все поставленные записи дойдут до диска (при выходе)"""
+    _executor.submit(lambda: None).result(timeout)
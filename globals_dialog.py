@@ -881,21 +881,17 @@ class GlobalIssuesDialog(QDialog):
             self.show_message("Нет связи с сервером", "error")
             return
 
-        request_id = self.ws_client.send_request(
-            "csv_write",
-            path="globals/issues.csv",
-            data=self.issues
-        )
-
-        if request_id:
-            def on_response(data):
-                if data.get("success"):
-                    self.load_issues()
-                    self.show_message("Сохранено успешно", "success")
-                else:
-                    self.show_message(f"Ошибка сохранения: {data.get('error')}", "error")
+        def on_response(data):
+            if data.get("success"):
+                self.load_issues()
+                self.show_message("Сохранено успешно", "success")
+            else:
+                self.show_message(f"Ошибка сохранения: {data.get('error')}", "error")
 
-            self.parent_window.pending_requests[request_id] = on_response
+        # Через журнал записи главного окна: без связи изменения не теряются
+        sent = self.parent_window.write_journal.submit("csv_write", "globals/issues.csv", self.issues, on_response)
+        if not sent:
+            self.show_message("Нет связи: изменения сохранены локально и будут отправлены при подключении", "info")
 
     def export_csv(self):
         """Экспортирует данные в CSV файл"""
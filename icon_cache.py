@@ -0,0 +1,96 @@
+# icon_cache.py — общий на процесс кеш QPixmap: иконки узлов карты, оверлеи статусов, картинки моделей
+#
+# Все вкладки MapCanvas берут одни и те же QPixmap (Qt делит их данные неявно),
+# поэтому каждый файл читается и декодируется с диска один раз за запуск.
+
+import os
+import time
+
+from PyQt6.QtGui import QPixmap
+
+# Иконки и оверлеи, нужные почти любой карте: грузятся при старте (preload)
+NODE_ICONS = (
+    "canvas/Router.png",
+    "canvas/Router_off.png",
+    "canvas/Router_plan.png",
+    "canvas/Computer.png",
+    "canvas/Switch.png",
+    "canvas/other/ping_failed.png",
+    "canvas/other/not_install.png",
+    "canvas/other/not_settings.png",
+    "canvas/other/copy.png",
+)
+
+
+class IconCache:
+    """QPixmap по ключу: путь к файлу или "image:<имя>" для картинки с сервера.
+
+    Отсутствующий файл тоже запоминается (как None), чтобы не проверять
+    диск при каждой отрисовке. Отсутствие картинки на сервере помнится
+    только MISSING_TTL секунд: её могут загрузить, пока программа открыта.
+    QPixmap создаются только после QApplication, поэтому кеш заполняется
+    лениво или через preload() из main().
+    """
+    MISSING_TTL = 60.0
+
+    def __init__(self):
+        self._pixmaps = {}  # ключ -> QPixmap или None (файла нет)
+        self._missing_until = {}  # ключ картинки с сервера -> time.monotonic(), до которого верим в её отсутствие
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, path):
+        """QPixmap файла path или None, если файла нет или он не читается"""
+        if path in self._pixmaps:
+            self.stats["hits"] += 1
+            return self._pixmaps[path]
+        self.stats["misses"] += 1
+        pixmap = QPixmap(path) if os.path.exists(path) else None
+        if pixmap is not None and pixmap.isNull():
+            pixmap = None
+        self._pixmaps[path] = pixmap
+        return pixmap
+
+    def preload(self, paths=NODE_ICONS):
+        """Загружает иконки заранее; возвращает, сколько из них нашлось"""
+        return sum(1 for path in paths if self.get(path) is not None)
+
+    def remembered(self, key):
+        """(известна ли картинка, QPixmap или None) — для картинок, скачиваемых с сервера"""
+        if key in self._missing_until and self._missing_until[key] <= time.monotonic():
+            self.forget(key)
+        if key in self._pixmaps:
+            self.stats["hits"] += 1
+            return True, self._pixmaps[key]
+        self.stats["misses"] += 1
+        return False, None
+
+    def put_data(self, key, data):
+        """Запоминает картинку из байтов (None — на сервере её нет); возвращает QPixmap или None"""
+        pixmap = None
+        if data:
+            pixmap = QPixmap()
+            if not pixmap.loadFromData(data):
+                pixmap = None
+        self._pixmaps[key] = pixmap
+        if pixmap is None:
+            self._missing_until[key] = time.monotonic() + self.MISSING_TTL
+        else:
+            self._missing_until.pop(key, None)
+        return pixmap
+
+    def forget(self, key):
+        """Сбрасывает ключ (например, картинка модели заменена на сервере)"""
+        self._pixmaps.pop(key, None)
+        self._missing_until.pop(key, None)
+
+    def memory_bytes(self):
+        """Оценка памяти под пиксели: ширина × высота × глубина цвета"""
+        return sum(p.width() * p.height() * p.depth() // 8 for p in self._pixmaps.values() if p is not None)
+
+    def summary(self):
+        return (f"Кеш иконок: {len(self._pixmaps)} шт., попаданий {self.stats['hits']}, "
+                f"промахов {self.stats['misses']}, ~{self.memory_bytes() // 1024} КБ")
+
+
+# Один кеш на процесс: его используют все холсты и диалоги
+ICONS = IconCache()
@@ -0,0 +1,132 @@
+# json_patch.py — структурная разница JSON-документов в формате JSON Patch (RFC 6902)
+#
+# Используются операции add / remove / replace; путь — JSON Pointer ("/switches/12/xy/x").
+# make_patch() строит разницу на клиенте, apply_patch() применяет её на сервере.
+
+import copy
+import marshal
+
+
+def escape_token(token):
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def unescape_token(token):
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def make_patch(old, new):
+    """Список операций, превращающих old в new"""
+    ops = []
+    _diff(old, new, "", ops)
+    return ops
+
+
+# marshal без ссылок (версия 2): одинаковые данные дают одинаковые байты независимо от того,
+# какие объекты в документах общие
+_MARSHAL_VERSION = 2
+
+
+def _same(old, new):
+    """Равенство в смысле JSON: 1, 1.0 и True для == равны, а в документе — разные значения"""
+    if type(old) is not type(new) or old != new:
+        return False
+    # Внутри равных по == контейнеров тип мог смениться; marshal различает 1 / 1.0 / True и тоже
+    # работает в C. Другой порядок ключей даст False — тогда просто сравним поэлементно
+    return (not isinstance(old, (dict, list))
+            or marshal.dumps(old, _MARSHAL_VERSION) == marshal.dumps(new, _MARSHAL_VERSION))
+
+
+def _diff(old, new, path, ops):
+    # Контейнеры сравниваются по детям: каждый ребёнок целиком проверяется в C (_same),
+    # и спуск идёт только в изменённые поддеревья
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{escape_token(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{escape_token(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": copy.deepcopy(value)})
+            elif not _same(old[key], value):
+                _diff(old[key], value, child, ops)
+    elif isinstance(old, list) and isinstance(new, list):
+        common = min(len(old), len(new))
+        for index in range(common):
+            if not _same(old[index], new[index]):
+                _diff(old[index], new[index], f"{path}/{index}", ops)
+        # Хвост: новые элементы дописываются, лишние удаляются с конца, чтобы индексы не съезжали
+        for index in range(common, len(new)):
+            ops.append({"op": "add", "path": f"{path}/-", "value": copy.deepcopy(new[index])})
+        for index in range(len(old) - 1, common - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{index}"})
+    elif not _same(old, new):
+        ops.append({"op": "replace", "path": path, "value": copy.deepcopy(new)})
+
+
+def _parent(doc, path):
+    """(контейнер, последний токен) для пути; ValueError, если путь не существует"""
+    if not path.startswith("/"):
+        raise ValueError(f"Недопустимый путь: {path!r}")
+    tokens = [unescape_token(token) for token in path[1:].split("/")]
+    target = doc
+    for token in tokens[:-1]:
+        target = _child(target, token, path)
+    return target, tokens[-1]
+
+
+def _child(target, token, path):
+    try:
+        if isinstance(target, list):
+            return target[int(token)]
+        return target[token]
+    except (KeyError, IndexError, ValueError, TypeError):
+        raise ValueError(f"Путь не найден: {path}")
+
+
+def _index(target, token, path, insert=False):
+    if insert and token == "-":
+        return len(target)
+    try:
+        index = int(token)
+    except ValueError:
+        raise ValueError(f"Недопустимый индекс: {path}")
+    if not 0 <= index <= len(target) - (0 if insert else 1):
+        raise ValueError(f"Индекс вне списка: {path}")
+    return index
+
+
+def apply_patch(doc, ops):
+    """Применяет операции к doc на месте и возвращает результат (корень может смениться)"""
+    for op in ops:
+        kind, path = op.get("op"), op.get("path", "")
+        if path == "":
+            if kind not in ("add", "replace"):
+                raise ValueError(f"Операция {kind} над корнем документа")
+            doc = op["value"]
+            continue
+        parent, token = _parent(doc, path)
+        if kind == "add":
+            if isinstance(parent, list):
+                parent.insert(_index(parent, token, path, insert=True), op["value"])
+            elif isinstance(parent, dict):
+                parent[token] = op["value"]
+            else:
+                raise ValueError(f"Путь не найден: {path}")
+        elif kind == "remove":
+            if isinstance(parent, list):
+                del parent[_index(parent, token, path)]
+            elif isinstance(parent, dict) and token in parent:
+                del parent[token]
+            else:
+                raise ValueError(f"Путь не найден: {path}")
+        elif kind == "replace":
+            if isinstance(parent, list):
+                parent[_index(parent, token, path)] = op["value"]
+            elif isinstance(parent, dict) and token in parent:
+                parent[token] = op["value"]
+            else:
+                raise ValueError(f"Путь не найден: {path}")
+        else:
+            raise ValueError(f"Неподдерживаемая операция: {kind}")
+    return doc
@@ -7,78 +7,30 @@ from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
     QPushButton, QStatusBar, QWidget, QCheckBox, QApplication
 )
-from PyQt6.QtCore import Qt, QTimer, pyqtSignal, QThread, QSettings
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal, QSettings
 from PyQt6.QtGui import QPixmap
-import asyncio
-import websockets
-from websockets.protocol import State
-
-class WebSocketLoginClient(QThread):
-    connected = pyqtSignal(bool)
-    login_response = pyqtSignal(dict)
-
-    def __init__(self, uri="ws://192.168.0.56:8081"):
-        super().__init__()
-        self.uri = uri
-        self.websocket = None
-        self.loop = None
-        self.running = True
-
-    def run(self):
-        self.loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.loop)
-        self.loop.run_until_complete(self._main())
-
-    async def _main(self):
-        while self.running:
-            try:
-                async with websockets.connect(
-                    self.uri,
-                    ping_interval=20,
-                    ping_timeout=10,
-                    close_timeout=10
-                ) as ws:
-                    self.websocket = ws
-                    self.connected.emit(True)
-
-                    while self.running and ws.state == State.OPEN:
-                        await asyncio.sleep(1)
+from ws_client import WebSocketClient
 
-            except Exception as e:
-                self.connected.emit(False)
-                if self.running:
-                    await asyncio.sleep(2)
-            finally:
-                self.websocket = None
-                self.connected.emit(False)
-
-    def send_login(self, login, password_hash):
-        if self.websocket and self.isRunning():
-            asyncio.run_coroutine_threadsafe(
-                self._send_login(login, password_hash), self.loop
-            )
-
-    async def _send_login(self, login, password_hash):
-        try:
-            request = {
-                "action": "auth_login",
-                "login": login,
-                "password_hash": password_hash
-            }
-            await self.websocket.send(json.dumps(request))
-            response = await self.websocket.recv()
-            data = json.loads(response)
-            self.login_response.emit(data)
-        except Exception as e:
-            self.login_response.emit({"success": False, "error": str(e)})
+SESSION_FILE = "session.pkl"
+
+
+def read_saved_ticket(session_file=SESSION_FILE):
+    """Билет сеанса из session.pkl (если пользователь просил запомнить вход), иначе None"""
+    try:
+        if os.path.exists(session_file):
+            with open(session_file, "rb") as f:
+                session_data = pickle.load(f)
+            if isinstance(session_data, dict) and session_data.get("remember_me"):
+                return session_data.get("ticket")
+    except Exception as e:
+        print(f"Ошибка чтения билета из {session_file}: {e}")
+    return None
 
-    def stop(self):
-        self.running = False
 
 class LoginDialog(QDialog):
     login_successful = pyqtSignal(dict)
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, ws_client=None, prefetch=None, startup_timer=None):
         super().__init__(parent)
         self.setWindowTitle("Вход в систему")
         self.setFixedSize(350, 540)
@@ -90,14 +42,26 @@ class LoginDialog(QDialog):
         # Переменные для сохраненных данных
         self.saved_login = ""
         self.saved_password_hash = ""
-
-        self.ws_client = WebSocketLoginClient()
+        # Пользователь, чей сеанс сервер восстановил по билету при подключении
+        self.resumed_user = None
+
+        # Соединение после входа переходит в MainWindow; своё создаём, только если его не передали
+        self.owns_client = ws_client is None
+        self.ws_client = ws_client or WebSocketClient()
+        self.prefetch = prefetch
+        self.startup_timer = startup_timer
         self.ws_client.connected.connect(self.on_connection_changed)
-        self.ws_client.login_response.connect(self.on_login_response)
-        self.ws_client.start()
+        self.ws_client.server_ready.connect(self.on_server_ready)
+        self.ws_client.session_resumed.connect(self.on_session_resumed)
+        if self.owns_client:
+            self.ws_client.start()
 
         self.is_connected = False
         self.setup_ui()
+        if self.ws_client.is_ready():
+            self.on_connection_changed(True)
+        if self.ws_client.is_negotiated():
+            self.on_server_ready(sorted(self.ws_client.server_features))
 
         # Загрузка сохраненных учетных данных (БЕЗ автологина)
         self.load_saved_credentials()
@@ -185,6 +149,17 @@ class LoginDialog(QDialog):
         self.is_connected = is_connected
         self.login_button.setEnabled(is_connected)
         self.update_status()
+        if is_connected and self.startup_timer:
+            self.startup_timer.mark("соединение")
+
+    def on_server_ready(self, _features):
+        # Пока пользователь вводит пароль, по этому же соединению грузим список карт и открытые карты;
+        # после hello — чтобы крупные карты шли потоком с докачкой
+        if self.prefetch:
+            self.prefetch.start()
+
+    def on_session_resumed(self, resume):
+        self.resumed_user = resume.get("user") if resume.get("success") else None
 
     def update_status(self):
         if self.is_connected:
@@ -195,7 +170,7 @@ class LoginDialog(QDialog):
     def load_saved_credentials(self):
         """Загружает сохраненные учетные данные из session.pkl или QSettings"""
         # Приоритет: session.pkl > QSettings
-        session_file = "session.pkl"
+        session_file = SESSION_FILE
         
         try:
             if os.path.exists(session_file):
@@ -229,14 +204,15 @@ class LoginDialog(QDialog):
             self.remember_checkbox.setChecked(True)
             print(f"Загружены учетные данные из QSettings для пользователя: {self.saved_login}")
 
-    def save_credentials(self, login, password_hash):
-        """Сохраняет учетные данные в session.pkl и QSettings"""
+    def save_credentials(self, login, password_hash, ticket=None):
+        """Сохраняет учетные данные (и билет сеанса) в session.pkl и QSettings"""
         if self.remember_checkbox.isChecked():
             # Сохранение в session.pkl (основной способ)
-            session_file = "session.pkl"
+            session_file = SESSION_FILE
             session_data = {
                 "login": login,
                 "password_hash": password_hash,
+                "ticket": ticket,
                 "remember_me": True
             }
             
@@ -254,7 +230,7 @@ class LoginDialog(QDialog):
             self.settings.sync()
         else:
             # Если чекбокс не отмечен, удаляем сохраненные данные
-            session_file = "session.pkl"
+            session_file = SESSION_FILE
             if os.path.exists(session_file):
                 try:
                     os.remove(session_file)
@@ -288,11 +264,16 @@ class LoginDialog(QDialog):
             # Хешируем введенный пароль
             password_hash = hashlib.sha256(password.encode()).hexdigest()
 
+        # Сеанс этого пользователя уже восстановлен по билету — повторный вход не нужен
+        if password_hash == self.saved_password_hash and self.resumed_user and self.resumed_user.get("login") == login:
+            self.on_login_response({"success": True, "user": dict(self.resumed_user), "ticket": self.ws_client.session_ticket})
+            return
+
         self.login_input.setEnabled(False)
         self.password_input.setEnabled(False)
         self.login_button.setEnabled(False)
 
-        self.ws_client.send_login(login, password_hash)
+        self.ws_client.request("auth_login", self.on_login_response, owner=self, login=login, password_hash=password_hash)
 
     def on_login_response(self, response):
         self.login_input.setEnabled(True)
@@ -310,9 +291,15 @@ class LoginDialog(QDialog):
 
         if response.get("success"):
             self.status_bar.showMessage("Вход успешен", 5000)
+            if self.startup_timer:
+                self.startup_timer.mark("вход")
+
+            # Билет сеанса: с ним переподключение (и следующий запуск) обходятся без повторного входа
+            if response.get("ticket"):
+                self.ws_client.session_ticket = response["ticket"]
 
             # Сохранение учетных данных при успешном входе
-            self.save_credentials(current_login, password_hash)
+            self.save_credentials(current_login, password_hash, self.ws_client.session_ticket)
 
             user_data = response.get("user", {})
             user_data["login"] = current_login
@@ -337,11 +324,19 @@ class LoginDialog(QDialog):
         
         return login, password_hash
 
+    def release_client(self):
+        """Отдаёт соединение главному окну: окно входа больше не реагирует на его сигналы"""
+        self.ws_client.connected.disconnect(self.on_connection_changed)
+        self.ws_client.server_ready.disconnect(self.on_server_ready)
+        self.ws_client.session_resumed.disconnect(self.on_session_resumed)
+        return self.ws_client
+
     def get_user_login(self):
         """Возвращает логин пользователя"""
         return self.login_input.text().strip()
 
     def closeEvent(self, event):
-        self.ws_client.stop()
-        self.ws_client.wait()
+        if self.owns_client:
+            self.ws_client.stop()
+            self.ws_client.wait()
         super().closeEvent(event)
@@ -0,0 +1,66 @@
+# magistral_geometry.py — промежуточные точки магистралей: строка "[x;y][x;y]..." <-> список [[x, y], ...]
+#
+# В файле карты и на сервере точки хранятся строкой link["nodes"] (старый формат, его читают
+# и пишут и другие клиенты). В памяти — списком чисел: load_magistrals() разбирает строки
+# один раз при установке карты на холст, dump_magistrals() собирает их обратно перед отправкой.
+# Исходная строка запоминается и уходит на сервер без изменений, пока точки магистрали не
+# двигали, — иначе первое же сохранение переписало бы формат чисел во всех магистралях
+# и разница (JSON Patch) разрослась бы на всю карту.
+
+import re
+
+WAYPOINT_RE = re.compile(r'([+-]?\d+(?:\.\d+)?)\s*;\s*([+-]?\d+(?:\.\d+)?)')
+
+# Исходная строка точек, пока магистраль не правили; на сервер этот ключ не уходит
+NODES_TEXT = "_nodes_text"
+
+
+def parse_waypoints(value):
+    """Точки магистрали из строки "[x;y][x;y]..." (или уже разобранного списка) -> [[x, y], ...]"""
+    if not value:
+        return []
+    if isinstance(value, list):
+        return [[float(x), float(y)] for x, y in value]
+    return [[float(x), float(y)] for x, y in WAYPOINT_RE.findall(str(value))]
+
+
+def format_waypoints(points):
+    """[[x, y], ...] -> "[x;y][x;y]..." с одним знаком после запятой, как писал редактор карт"""
+    return "".join(f"[{x:.1f};{y:.1f}]" for x, y in points)
+
+
+def load_magistrals(map_doc):
+    """Переводит link["nodes"] всех магистралей карты в списки чисел (на месте; повторный вызов ничего не делает)"""
+    for link in map_doc.get("magistrals", []):
+        nodes = link.get("nodes")
+        if isinstance(nodes, str):
+            link[NODES_TEXT] = nodes
+            link["nodes"] = parse_waypoints(nodes)
+    return map_doc
+
+
+def set_waypoints(link, points):
+    """Новые точки магистрали: исходная строка больше не соответствует им"""
+    link["nodes"] = points
+    link.pop(NODES_TEXT, None)
+
+
+def dump_magistrals(map_doc):
+    """Копия карты для сохранения: точки снова строкой, служебный ключ убран.
+
+    Копируются только словари магистралей, остальной документ общий с map_doc.
+    """
+    magistrals = map_doc.get("magistrals")
+    if not magistrals:
+        return map_doc
+    dumped = []
+    for link in magistrals:
+        nodes = link.get("nodes")
+        if not isinstance(nodes, list):
+            dumped.append(link)
+            continue
+        link = dict(link)
+        text = link.pop(NODES_TEXT, None)
+        link["nodes"] = text if text is not None else format_waypoints(nodes)
+        dumped.append(link)
+    return {**map_doc, "magistrals": dumped}
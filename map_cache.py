@@ -0,0 +1,150 @@
+# map_cache.py — локальный кеш документов карт с номером версии сервера
+#
+# file_get карты уходит с "known_version" — версией из кеша. Если на сервере та же
+# версия, он отвечает {"success": true, "not_modified": true, "version"} без данных,
+# и документ берётся из кеша: повторное открытие вкладки или загрузка после
+# переподключения стоят одного короткого обмена вместо скачивания и разбора JSON.
+# Версии ведёт каждый сервер сам, поэтому кеш раздельный для каждого набора адресов
+# сервера (set_server): одинаковый номер версии на другом сервере — другой документ.
+#
+# MapSnapshots — последние показанные документы открытых карт вместе со статусами pingok:
+# при запуске вкладки рисуются из снимка сразу, ещё до ответа сервера.
+
+import hashlib
+import os
+import pickle
+import time
+
+from file_writer import remove_later, write_later
+
+CACHE_DIR = "map_cache"
+SNAPSHOT_DIR = "map_snapshots"
+
+# Как часто сохраняются снимки изменившихся карт, с (и ещё раз при выходе)
+SNAPSHOT_INTERVAL = 60
+
+
+def server_key(server):
+    """Имя подкаталога кеша для адреса или списка адресов сервера"""
+    uris = [server] if isinstance(server, str) else list(server)
+    return hashlib.sha1("\n".join(uris).encode()).hexdigest()[:12]
+
+
+class MapCache:
+    """Документы карт по пути файла (maps/map_<id>.json) и версии.
+
+    Хранится pickle документа: в памяти — для вкладок, открытых в этом
+    запуске, на диске — для следующего запуска. Каждая выдача — новая копия,
+    поэтому правки открытой карты кеш не портят. Карты без версии (сервер
+    не ведёт версии) не кешируются.
+    """
+
+    def __init__(self, directory=CACHE_DIR, server=None):
+        self.base_directory = directory
+        self.stats = {"hits": 0, "misses": 0, "stored": 0}
+        self.set_server(server)
+
+    def set_server(self, server):
+        """Переключает кеш на другой сервер (адрес или список адресов; None — общий каталог)"""
+        self.server = server
+        self.directory = os.path.join(self.base_directory, server_key(server)) if server else self.base_directory
+        self._items = {}  # path -> (version, pickle документа)
+
+    def version(self, path):
+        item = self._get(path)
+        return item[0] if item else None
+
+    def request_params(self, path):
+        """Параметры file_get: с known_version, если карта есть в кеше"""
+        version = self.version(path)
+        return {"path": path, "known_version": version} if version else {"path": path}
+
+    def resolve(self, path, response):
+        """Ответ file_get -> ответ с данными: not_modified заполняется из кеша, свежая карта кладётся в кеш.
+
+        None — сервер ответил not_modified, а карты этой версии в кеше уже нет:
+        её надо запросить заново без known_version.
+        """
+        if response.get("not_modified"):
+            item = self._get(path)
+            if item is None or item[0] != response.get("version"):
+                return None
+            self.stats["hits"] += 1
+            return {**response, "data": pickle.loads(item[1])}
+        data = response.get("data")
+        if response.get("success") and isinstance(data, dict):
+            self.stats["misses"] += 1
+            self.put(path, data.get("version", 0), data)
+        return response
+
+    def put(self, path, version, data):
+        """Запоминает версию карты (после загрузки или подтверждённого сохранения)"""
+        if not version:
+            return
+        blob = pickle.dumps({**data, "version": version}, protocol=pickle.HIGHEST_PROTOCOL)
+        self._items[path] = (version, blob)
+        self.stats["stored"] += 1
+        # На диск — в фоновом потоке; blob уже готов, здесь он только оборачивается
+        write_later(self._file(path), pickle.dumps((version, blob), protocol=pickle.HIGHEST_PROTOCOL))
+
+    def drop(self, path):
+        self._items.pop(path, None)
+        remove_later(self._file(path))
+
+    def _get(self, path):
+        item = self._items.get(path)
+        if item is None and os.path.exists(self._file(path)):
+            try:
+                with open(self._file(path), "rb") as f:
+                    item = pickle.load(f)
+                self._items[path] = item
+            except Exception as e:
+                print(f"Ошибка чтения кеша карты {path}: {e}")
+        return item
+
+    def _file(self, path):
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.directory, f"{name}.pkl")
+
+    def summary(self):
+        return (f"Кеш карт: из кеша {self.stats['hits']}, загружено {self.stats['misses']}, "
+                f"записано {self.stats['stored']}")
+
+
+class MapSnapshots:
+    """Снимки открытых карт на диске: map_id -> {"saved_at", "data"}.
+
+    В отличие от MapCache, снимок — это то, что было на экране: с последними
+    статусами pingok и без гарантии, что сервер подтвердил эту версию.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR):
+        self.directory = directory
+
+    def save(self, map_id, data):
+        # Сериализация — здесь (это снимок живого документа), запись файла — в фоновом потоке
+        try:
+            blob = pickle.dumps({"saved_at": time.time(), "data": data}, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            print(f"Ошибка записи снимка карты {map_id}: {e}")
+            return
+        write_later(self._file(map_id), blob)
+
+    def load(self, map_id):
+        """{"saved_at", "data"} или None"""
+        snapshot_file = self._file(map_id)
+        if not os.path.exists(snapshot_file):
+            return None
+        try:
+            with open(snapshot_file, "rb") as f:
+                snapshot = pickle.load(f)
+        except Exception as e:
+            print(f"Ошибка чтения снимка карты {map_id}: {e}")
+            return None
+        data = snapshot.get("data") if isinstance(snapshot, dict) else None
+        return snapshot if isinstance(data, dict) and "map" in data else None
+
+    def _file(self, map_id):
+        # id карты — имя, заданное пользователем; в имя файла берём безопасную форму
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in str(map_id))
+        return os.path.join(self.directory, f"map_{safe}.pkl")
@@ -0,0 +1,151 @@
+# ping_subscriptions.py — подписка на изменения pingok открытых карт (сервер присылает только изменения)
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+
+class PingSubscriptions(QObject):
+    """Подписки на push-обновления pingok по картам.
+
+    Для каждой карты хранится номер последнего применённого обновления
+    (seq). После переподключения подписка возобновляется с этого номера,
+    и сервер досылает пропущенное; если истории не хватает — присылает
+    полный снимок (full). Разрыв в номерах push-сообщений обрабатывается
+    так же: повторной подпиской с последнего seq.
+
+    Пока сервер не объявил "push" в hello, active() возвращает False,
+    и MainWindow продолжает опрашивать check_ping_updates.
+
+    Текущие seq передаются клиенту (resume_subscriptions): при возобновлении
+    сеанса сервер восстанавливает подписки прямо в ответе на hello, и
+    отдельные запросы subscribe не нужны.
+    """
+    # map_id, список {"id", "index", "pingok"}, полный ли это снимок
+    updates_received = pyqtSignal(str, list, bool)
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+        self.seqs = {}          # map_id -> последний применённый seq (None — ещё не было)
+        self._active = set()    # карты, подписка на которые подтверждена в текущем соединении
+        self._pending = {}      # map_id -> RequestFuture запроса subscribe
+        self.stats = {"pushes": 0, "updates": 0, "gaps": 0, "resubscribes": 0}
+        self.attach(client)
+
+    def attach(self, client):
+        """Привязка к (новому) клиенту; подписки переносятся при его подключении"""
+        self.client = client
+        self._active.clear()
+        self._pending.clear()
+        client.session_resumed.connect(self.on_session_resumed)
+        client.server_ready.connect(self.on_server_ready)
+        client.push_received.connect(self.on_pushes)
+        client.connected.connect(self.on_connection_changed)
+        self._publish_seqs()
+
+    def available(self):
+        return "push" in self.client.server_features
+
+    def active(self, map_id):
+        return map_id in self._active
+
+    def subscribe(self, map_id, full=False):
+        """Подписка на карту; full=True — заново получить полный снимок (после перезагрузки карты)"""
+        if full:
+            self.seqs[map_id] = None
+            self._active.discard(map_id)
+        elif map_id in self.seqs and (map_id in self._active or map_id in self._pending):
+            return
+        self.seqs.setdefault(map_id, None)
+        self._publish_seqs()
+        self._send_subscribe(map_id)
+
+    def unsubscribe(self, map_id):
+        self.seqs.pop(map_id, None)
+        self._publish_seqs()
+        self._active.discard(map_id)
+        future = self._pending.pop(map_id, None)
+        if future is not None:
+            future.cancel()
+        if self.available() and self.client.is_ready():
+            self.client.request("unsubscribe", map_id=map_id)
+
+    def on_session_resumed(self, resume):
+        # Сервер уже подписал соединение на карты из билета — применяем догоняющие ответы
+        for map_id, result in (resume.get("subscriptions") or {}).items():
+            if map_id not in self.seqs:
+                continue
+            self._active.add(map_id)
+            self._apply(map_id, result.get("seq", 0), result.get("updates", []), bool(result.get("full")))
+
+    def on_server_ready(self, features):
+        # Новое соединение: возобновляем подписки с последнего seq (кроме восстановленных с сеансом)
+        if "push" in features:
+            for map_id in self.seqs:
+                if map_id not in self._active:
+                    self._send_subscribe(map_id)
+
+    def on_connection_changed(self, connected):
+        if not connected:
+            self._active.clear()
+            self._pending.clear()
+
+    def on_pushes(self, pushes):
+        for push in pushes:
+            if push.get("topic") != "pingok":
+                continue
+            map_id = push.get("map_id")
+            if map_id not in self._active:
+                continue
+            self.stats["pushes"] += 1
+            seq = push.get("seq")
+            last = self.seqs.get(map_id)
+            if last is not None and seq <= last:
+                continue  # уже применено (пришло в догоняющем ответе subscribe)
+            if last is not None and seq != last + 1:
+                # Пропуск в номерах — догоняем с последнего применённого
+                self.stats["gaps"] += 1
+                self._active.discard(map_id)
+                self._send_subscribe(map_id)
+                continue
+            self._apply(map_id, seq, push.get("updates", []), False)
+
+    def _send_subscribe(self, map_id):
+        if not self.available() or not self.client.is_ready():
+            return
+        if map_id in self._pending:
+            if self.seqs.get(map_id) is not None:
+                return
+            # Нужен полный снимок — прежний запрос мог быть догоняющим
+            self._pending.pop(map_id).cancel()
+        since = self.seqs.get(map_id)
+        if since is not None:
+            self.stats["resubscribes"] += 1
+
+        def on_subscribed(data):
+            if self._pending.get(map_id) is future:
+                del self._pending[map_id]
+            if map_id not in self.seqs:
+                return  # карту закрыли, пока ждали ответа
+            if not data.get("success"):
+                print(f"Подписка на карту '{map_id}' не удалась: {data.get('error')}")
+                return
+            self._active.add(map_id)
+            self._apply(map_id, data.get("seq", 0), data.get("updates", []), bool(data.get("full")))
+
+        future = self.client.request("subscribe", on_subscribed, map_id=map_id, since_seq=since)
+        self._pending[map_id] = future
+
+    def _apply(self, map_id, seq, updates, full):
+        self.seqs[map_id] = seq
+        self._publish_seqs()
+        if updates or full:
+            self.stats["updates"] += len(updates)
+            self.updates_received.emit(map_id, updates, full)
+
+    def _publish_seqs(self):
+        # Новый словарь целиком: WS-поток читает его при отправке hello
+        self.client.resume_subscriptions = dict(self.seqs)
+
+    def summary(self):
+        return (f"Подписки pingok: {len(self._active)}/{len(self.seqs)}, push {self.stats['pushes']}, "
+                f"изменений {self.stats['updates']}, разрывов {self.stats['gaps']}")
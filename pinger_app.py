@@ -12,73 +12,18 @@ from PyQt6.QtGui import QAction, QColor, QBrush, QPen, QPainter, QPixmap, QIcon
 from PyQt6.QtCore import Qt, QTimer, QRectF, QPointF, QThread, pyqtSignal, QSettings
 import pickle
 import re
+import time
 from datetime import datetime
-import asyncio
-import websockets
-import uuid
-from websockets.protocol import State
-
-# === WebSocket Client ===
-class WebSocketClient(QThread):
-    connected = pyqtSignal(bool)
-    message_received = pyqtSignal(dict)
-
-    def __init__(self, uri="ws://192.168.0.56:8081"):
-        super().__init__()
-        self.uri = uri
-        self.websocket = None
-        self.loop = None
-        self.running = True
-        self.pending_requests = {}
-        # Флаги для отложенной загрузки карт до установления WS-соединения
-        self.open_maps_loaded = False      # true после первой полной попытки загрузки
-        self.load_open_maps_pending = False
-
-    def run(self):
-        self.loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.loop)
-        self.loop.run_until_complete(self._main())
-
-    async def _main(self):
-        while self.running:
-            try:
-                async with websockets.connect(self.uri, ping_interval=20, ping_timeout=10) as ws:
-                    self.websocket = ws
-                    self.connected.emit(True)
-
-                    while self.running and ws.state == State.OPEN:
-                        await asyncio.sleep(1)
-                        try:
-                            response = await asyncio.wait_for(ws.recv(), timeout=1.0)
-                            data = json.loads(response)
-                            self.message_received.emit(data)
-                        except asyncio.TimeoutError:
-                            continue
-                        except Exception as e:
-                            print(f"[WS] Error receiving: {e}")
-                            break
-
-            except Exception as e:
-                print(f"[WS] Connection error: {e}")
-                self.connected.emit(False)
-                if self.running:
-                    await asyncio.sleep(2)
-            finally:
-                self.websocket = None
-                self.connected.emit(False)
-
-    def send_request(self, action, **kwargs):
-        if self.websocket and self.isRunning():
-            request_id = str(uuid.uuid4())
-            request = {"action": action, "request_id": request_id, **kwargs}
-            asyncio.run_coroutine_threadsafe(
-                self.websocket.send(json.dumps(request)), self.loop
-            )
-            return request_id
-        return None
-
-    def stop(self):
-        self.running = False
+from ws_client import WebSocketClient, load_servers, save_servers
+import file_writer
+from icon_cache import ICONS
+from magistral_geometry import dump_magistrals
+from map_cache import SNAPSHOT_INTERVAL, MapCache, MapSnapshots
+from startup import PREFETCH_MAX_AGE, MapPrefetch, StartupTimer, read_open_maps
+from write_journal import WriteJournal
+from ping_subscriptions import PingSubscriptions
+from ws_protocol import health_summary
+from traffic_log import TrafficRecorder
 
 class MapNameDialog(QDialog):
     def __init__(self, parent=None):
@@ -188,13 +133,14 @@ class OpenMapDialog(QDialog):
             return
 
         for row, map_file in enumerate(self.map_files):
-            req_id = self.ws_client.send_request(
+            # owner=self — незавершённые запросы снимаются при закрытии диалога
+            future = self.ws_client.request(
                 "file_get",
+                self.on_metadata_received,
+                owner=self,
                 path=f"maps/{map_file}"
             )
-            if req_id:
-                self.pending_requests[req_id] = row
-                self.parent_window.pending_requests[req_id] = self.on_metadata_received
+            self.pending_requests[future.request_id] = row
 
     def on_metadata_received(self, data):
         req_id = data.get("request_id")
@@ -271,7 +217,7 @@ from canvas import *
 from globals_dialog import GlobalIssuesDialog
 
 class MainWindow(QMainWindow):
-    def __init__(self, user_login=None):
+    def __init__(self, user_login=None, ws_client=None, prefetch=None, startup_timer=None, map_cache=None):
         super().__init__()
         self.setWindowIcon(QIcon("icon.ico"))
         self.open_maps = []
@@ -286,12 +232,49 @@ class MainWindow(QMainWindow):
         self.settings = QSettings("Network Management System", "UserSession")
 
         # WebSocket client - ИНИЦИАЛИЗИРУЕМ ДО load_open_maps()
-        self.ws_client = WebSocketClient()
+        # Обычно это уже авторизованное соединение из окна входа
+        self.ws_client = ws_client or WebSocketClient()
         self.ws_client.connected.connect(self.on_ws_connected)
-        self.ws_client.message_received.connect(self.on_ws_message)
-        self.ws_client.start()
-        self.ws_connected = False
-        self.pending_requests = {}
+        self.ws_client.server_ready.connect(self.on_ws_ready)
+        self.ws_client.messages_received.connect(self.on_ws_messages)
+        self.ws_client.health_changed.connect(self.on_ws_health)
+        self.ws_client.session_resumed.connect(self.on_session_resumed)
+        # Список карт из ответа на возобновление сеанса: (time.monotonic(), files)
+        self.resumed_map_list = None
+        self.connection_health = self.ws_client.health_snapshot()
+        if not self.ws_client.isRunning():
+            self.ws_client.start()
+        self.ws_connected = self.ws_client.is_ready()
+        self._ping_check = None
+
+        # Сохранения сначала пишутся в локальный журнал и досылаются после обрыва или перезапуска
+        self.write_journal = WriteJournal(self.ws_client)
+        self.ws_client.connected.connect(self.write_journal.on_connection_changed)
+        self.ws_client.server_ready.connect(self.write_journal.on_server_ready)
+        self.write_journal.pending_changed.connect(self.on_journal_changed)
+        self.write_journal.conflict.connect(self.on_journal_conflict)
+
+        # Локальный кеш карт по версиям: неизменённая карта не скачивается заново
+        self.map_cache = map_cache or MapCache()
+        self.write_journal.confirmed.connect(self.map_cache.put)
+
+        # Снимки открытых карт со статусами: при запуске вкладки рисуются сразу, до ответа сервера
+        self.map_snapshots = MapSnapshots()
+        self.stale_maps = {}  # map_id -> время снимка, пока карта показана из него
+        self.snapshot_dirty = set()
+        self.snapshot_timer = QTimer(self)
+        self.snapshot_timer.timeout.connect(self.save_snapshots)
+        self.snapshot_timer.start(SNAPSHOT_INTERVAL * 1000)
+        QApplication.instance().aboutToQuit.connect(self.flush_local_state)
+
+        # Ответы, запрошенные ещё во время входа, и замер времени до первой карты
+        self.prefetch = prefetch
+        self.startup_timer = startup_timer or StartupTimer()
+        self.startup_report = ""
+
+        # Изменения pingok присылает сервер по подписке; если он этого не умеет — опрос ниже
+        self.ping_subscriptions = PingSubscriptions(self.ws_client)
+        self.ping_subscriptions.updates_received.connect(self.on_ping_pushed)
 
         # Умная синхронизация pingok каждые 12 секунд
         self.ping_sync_timer = QTimer(self)
@@ -371,6 +354,9 @@ class MainWindow(QMainWindow):
             """)
 
         self.tabs = QTabWidget()
+        # Холсты по id карты и карты, чьи холсты надо перерисовать перед показом
+        self.canvases = {}
+        self.unrendered = set()
         self.tabs.setTabsClosable(True)
         self.tabs.tabCloseRequested.connect(self.close_tab)
         self.tabs.currentChanged.connect(self.switch_tab)
@@ -406,16 +392,20 @@ class MainWindow(QMainWindow):
             }
         """)
         self.status_bar.addPermanentWidget(self.connection_indicator)
-        self.update_connection_indicator(False)  # Изначально нет связи
+        self.update_connection_indicator(self.ws_connected)
 
         # ИСПРАВЛЕНИЕ: Загрузка открытых карт ПОСЛЕ создания status_bar
         self.load_open_maps()
 
+        # Записи, не отправленные в прошлом сеансе
+        if self.ws_connected:
+            self.write_journal.replay()
+
     def update_connection_indicator(self, connected):
         """Обновляет индикатор связи с сервером"""
         if connected:
             # Зеленый кружок Unicode: ●
-            self.connection_indicator.setText("● Связь с сервером")
+            self.connection_indicator.setText("● Связь с сервером" + self.health_suffix(True) + self.journal_suffix())
             self.connection_indicator.setStyleSheet("""
                 QLabel {
                     color: #00ff00;
@@ -426,7 +416,7 @@ class MainWindow(QMainWindow):
             """)
         else:
             # Красный кружок Unicode: ●
-            self.connection_indicator.setText("● Нет связи")
+            self.connection_indicator.setText("● Нет связи" + self.health_suffix(False) + self.journal_suffix())
             self.connection_indicator.setStyleSheet("""
                 QLabel {
                     color: #ff0000;
@@ -436,29 +426,71 @@ class MainWindow(QMainWindow):
                 }
             """)
 
+    def health_suffix(self, connected):
+        health = self.connection_health
+        if connected:
+            return f" · {health['rtt_ms']:.0f} мс" if health.get("rtt_ms") is not None else ""
+        # Счётчик текущего обрыва: после восстановления связи он снова с нуля
+        return f" · попытка {health['outage_failures']}" if health.get("outage_failures") else ""
+
+    def on_ws_health(self, health):
+        """Показатели соединения из WS-потока: RTT в индикаторе, подробности в подсказке"""
+        self.connection_health = health
+        self.update_connection_indicator(self.ws_connected)
+        self.update_indicator_tooltip()
+
+    def update_indicator_tooltip(self):
+        parts = [self.startup_report, health_summary(self.connection_health),
+                 self.ws_client.summary(), self.write_journal.summary(), self.map_cache.summary(),
+                 self.ping_subscriptions.summary(), ICONS.summary()]
+        self.connection_indicator.setToolTip("\n".join(part for part in parts if part))
+
+    def journal_suffix(self):
+        pending = len(self.write_journal)
+        return f" (не отправлено: {pending})" if pending else ""
+
     def on_ws_connected(self, connected):
         self.ws_connected = connected
         self.update_connection_indicator(connected)
         if connected:
-            self.status_bar.showMessage("Подключено к серверу", 3000)
-            # Если есть отложенные open_maps — запускаем загрузку сейчас
-            if getattr(self, "load_open_maps_pending", False) and not getattr(self, "open_maps_loaded", False):
-                self.load_open_maps_pending = False
-                # Запустить загрузку всех карт
-                if self.open_maps:
-                    self.maps_to_load = len(self.open_maps)
-                    for map_info in self.open_maps:
-                        self.open_map(map_info["id"], is_initial_load=True)
-                    self.open_maps_loaded = True
-                    print("WS подключен — начата отложенная загрузка карт")
+            self.status_bar.showMessage(f"Подключено к серверу {self.ws_client.uri}", 3000)
         else:
             self.status_bar.showMessage("Нет связи с сервером", 3000)
 
-    def on_ws_message(self, data):
-        request_id = data.get("request_id")
-        if request_id in self.pending_requests:
-            callback = self.pending_requests.pop(request_id)
-            callback(data)
+    def on_ws_ready(self, _features):
+        """Ответ на hello получен: карты грузятся с потоковой передачей и докачкой, если сервер их умеет"""
+        # Если есть отложенные open_maps — запускаем загрузку сейчас
+        if getattr(self, "load_open_maps_pending", False) and not getattr(self, "open_maps_loaded", False):
+            self.load_open_maps_pending = False
+            # Запустить загрузку всех карт
+            if self.open_maps:
+                self.maps_to_load = len(self.open_maps)
+                for map_info in self.open_maps:
+                    self.open_map(map_info["id"], is_initial_load=True)
+                self.open_maps_loaded = True
+                print("WS готов — начата отложенная загрузка карт")
+
+    def on_session_resumed(self, resume):
+        if resume.get("success"):
+            self.resumed_map_list = (time.monotonic(), resume.get("files", []))
+
+    @property
+    def pending_requests(self):
+        """Таблица ожидающих запросов текущего WS-клиента (для pending_requests[req_id] = callback)"""
+        return self.ws_client.requests
+
+    def on_journal_changed(self, pending):
+        self.update_connection_indicator(self.ws_connected)
+        if not pending:
+            self.status_bar.showMessage("Все изменения отправлены на сервер", 3000)
+
+    def on_journal_conflict(self, path, error):
+        # Карту изменил другой пользователь — его правки не затираем, решает оператор
+        self.show_toast(f"{error}. Откройте карту заново и повторите правку", "error")
+
+    def on_ws_messages(self, batch):
+        """Ответы уже разобраны RequestManager — обновляем сводку в подсказке индикатора"""
+        self.update_indicator_tooltip()
 
     def update_status_bar(self):
         if self.active_map_id:
@@ -481,17 +513,16 @@ class MainWindow(QMainWindow):
         if not self.ws_connected or not self.active_map_id:
             return
 
-        current_hashes = self.get_current_ping_hashes()
-
-        request_id = self.ws_client.send_request(
-            "check_ping_updates",
-            map_id=self.active_map_id,
-            hashes=current_hashes
-        )
+        # Карта на подписке — изменения и так приходят от сервера
+        if self.ping_subscriptions.active(self.active_map_id):
+            return
 
-        if not request_id:
+        # Предыдущая проверка ещё не ответила — не копим запросы
+        if self._ping_check and not self._ping_check.done():
             return
 
+        current_hashes = self.get_current_ping_hashes()
+
         def on_updates_response(data):
             if not data.get("success"):
                 return
@@ -501,7 +532,7 @@ class MainWindow(QMainWindow):
                 return  # ничего не изменилось
 
             switches = self.map_data[self.active_map_id]["switches"]
-            updated = False
+            changed = []
 
             for upd in updates:
                 idx = upd["index"]
@@ -510,57 +541,77 @@ class MainWindow(QMainWindow):
                     new = upd["pingok"]
                     if old != new:
                         switches[idx]["pingok"] = new
-                        updated = True
+                        changed.append(switches[idx])
+
+            if changed:
+                self.snapshot_dirty.add(self.active_map_id)
+                touched = self.update_canvas_statuses(self.active_map_id, changed)
+                self.status_bar.showMessage(f"Обновлено статусов: {len(changed)}, элементов карты: {touched}", 2000)
 
-            if updated:
-                current_tab = self.tabs.currentWidget()
-                if current_tab:
-                    current_tab.render_map()
-                self.status_bar.showMessage(f"Обновлено статусов: {len(updates)}", 2000)
+        self._ping_check = self.ws_client.request(
+            "check_ping_updates",
+            on_updates_response,
+            map_id=self.active_map_id,
+            hashes=current_hashes
+        )
 
-        self.pending_requests[request_id] = on_updates_response
+    def on_ping_pushed(self, map_id, updates, full):
+        """Применяет изменения pingok, присланные по подписке (full — полный снимок карты)"""
+        switches = self.map_data.get(map_id, {}).get("switches")
+        if not switches:
+            return
+        by_id = {str(s.get("id")): s for s in switches}
+        changed = []
+        for upd in updates:
+            switch = by_id.get(str(upd.get("id")))
+            if switch is None:
+                idx = upd.get("index")
+                if not isinstance(idx, int) or idx >= len(switches):
+                    continue
+                switch = switches[idx]
+            if switch.get("pingok") != upd["pingok"]:
+                switch["pingok"] = upd["pingok"]
+                changed.append(switch)
+
+        if changed:
+            self.snapshot_dirty.add(map_id)
+            touched = self.update_canvas_statuses(map_id, changed)
+            if map_id == self.active_map_id:
+                self.status_bar.showMessage(f"Обновлено статусов: {len(changed)}, элементов карты: {touched}", 2000)
 
     def load_open_maps(self):
         """Читает open_maps.pkl и только подготавливает список карт.
            Если WS уже подключён — сразу начинает загрузку; иначе помечает флаг ожидания."""
         try:
-            pickle_file = "open_maps.pkl"
-            if not os.path.exists(pickle_file):
-                self.open_maps = []
-                return
-
-            with open(pickle_file, "rb") as f:
-                loaded_data = pickle.load(f)
-
-            # Нормализуем список: допускаем и строковые, и объектные записи
-            new_open = []
-            if isinstance(loaded_data, list):
-                for item in loaded_data:
-                    if isinstance(item, dict) and "id" in item and "name" in item:
-                        new_open.append(item)
-                    elif isinstance(item, str):
-                        new_open.append({"id": item, "name": item})
-            else:
-                # некорректный формат — игнорируем
-                new_open = []
-
-            self.open_maps = new_open
+            self.open_maps = read_open_maps()
 
             if not self.open_maps:
                 return
 
+            # Тёплый старт: вкладки сразу из снимков; сервер их потом подтвердит или заменит
+            for map_info in self.open_maps:
+                snapshot = self.map_snapshots.load(map_info["id"])
+                if snapshot and map_info["id"] not in self.map_data:
+                    self.map_data[map_info["id"]] = snapshot["data"]
+                    self.stale_maps[map_info["id"]] = snapshot["saved_at"]
+            if self.stale_maps:
+                self.active_map_id = self.open_maps[-1]["id"]
+                self.update_tabs()
+                self.update_status_bar()
+                print(f"Тёплый старт: {len(self.stale_maps)} карт из локальных снимков")
+
             # Устанавливаем счётчик ожидаемых загрузок карт
             self.maps_to_load = len(self.open_maps)
             self.maps_loaded_data = {}
 
-            # Если ws подключён — начинаем загрузку, иначе отмечаем, что нужно загрузить при подключении
-            if self.ws_connected and self.ws_client and self.ws_client.isRunning():
+            # Если ws готов (hello обработан) — начинаем загрузку, иначе отмечаем, что нужно загрузить по server_ready
+            if self.ws_client and self.ws_client.is_negotiated():
                 for map_info in self.open_maps:
                     self.open_map(map_info["id"], is_initial_load=True)
                 self.open_maps_loaded = True
                 print(f"Начата загрузка {len(self.open_maps)} открытых карт (WS ready)")
             else:
-                # Отложенная загрузка — выполнится при on_ws_connected(True)
+                # Отложенная загрузка — выполнится в on_ws_ready
                 self.load_open_maps_pending = True
                 print(f"Список открытых карт подготовлен ({len(self.open_maps)}), ожидаем WS-подключения")
         except Exception as e:
@@ -568,6 +619,20 @@ class MainWindow(QMainWindow):
             self.open_maps = []
 
 
+    def flush_local_state(self):
+        """При выходе: снимки, журнал и кеш дописываются на диск до завершения процесса"""
+        self.save_snapshots()
+        self.write_journal.flush()
+        file_writer.flush()
+
+    def save_snapshots(self):
+        """Пишет снимки изменившихся открытых карт (по таймеру и при выходе)"""
+        open_ids = {m["id"] for m in self.open_maps}
+        for map_id in self.snapshot_dirty:
+            if map_id in open_ids and map_id in self.map_data:
+                self.map_snapshots.save(map_id, self.map_data[map_id])
+        self.snapshot_dirty.clear()
+
     def save_open_maps(self):
         """Сохраняет открытые карты в файл open_maps.pkl"""
         try:
@@ -585,22 +650,81 @@ class MainWindow(QMainWindow):
             print(f"Ошибка сохранения открытых карт: {e}")
 
     def update_tabs(self):
-        """ИСПРАВЛЕНО: Обновляет вкладки с проверкой наличия данных"""
+        """Приводит вкладки к open_maps, не пересоздавая холсты.
+
+        Холст карты создаётся один раз и живёт до закрытия вкладки; вкладка
+        появляется, как только у карты есть данные. Рисуется только видимая
+        вкладка, остальные — при первом показе.
+        """
         self.tabs.blockSignals(True)
-        self.tabs.clear()
+        open_ids = [m["id"] for m in self.open_maps]
+        for map_id in [m for m in self.canvases if m not in open_ids]:
+            canvas = self.canvases.pop(map_id)
+            self.tabs.removeTab(self.tabs.indexOf(canvas))
+            canvas.deleteLater()
+            self.unrendered.discard(map_id)
+
+        position = 0
         for map_info in self.open_maps:
-            map_data = self.map_data.get(map_info["id"], {})
-            canvas = MapCanvas(map_data, self)
-            canvas.is_edit_mode = self.is_edit_mode
-            self.tabs.addTab(canvas, map_info["name"])
-            if map_info["id"] == self.active_map_id:
-                self.tabs.setCurrentWidget(canvas)
-            # ИСПРАВЛЕНИЕ: Рендерим только если данные есть
-            if map_data and "map" in map_data:
-                canvas.render_map()
+            map_id = map_info["id"]
+            map_data = self.map_data.get(map_id)
+            if not map_data or "map" not in map_data:
+                continue
+            canvas = self.canvases.get(map_id)
+            if canvas is None:
+                canvas = self.canvases[map_id] = MapCanvas(map_data, self)
+                self.unrendered.add(map_id)
+            elif canvas.map_data is not map_data:
+                # Документ заменён (например, серверной версией вместо снимка) — тот же холст, новые данные
+                canvas.set_map_data(map_data, render=False)
+                self.unrendered.add(map_id)
+            canvas.set_stale(self.stale_maps.get(map_id))
+            index = self.tabs.indexOf(canvas)
+            if index == -1:
+                self.tabs.insertTab(position, canvas, map_info["name"])
+            elif index != position:
+                self.tabs.tabBar().moveTab(index, position)
+            position += 1
+        self.apply_edit_mode()
+
+        if self.active_map_id in self.canvases:
+            self.tabs.setCurrentWidget(self.canvases[self.active_map_id])
+        current_id = self.tab_map_id(self.tabs.currentIndex())
+        if current_id in self.unrendered:
+            self.render_canvas(current_id)
         self.tabs.blockSignals(False)
         self.settings_button.setEnabled(self.is_edit_mode and bool(self.active_map_id))
 
+    def tab_map_id(self, index):
+        """id карты во вкладке index (порядок вкладок не совпадает с open_maps, пока не все карты загружены)"""
+        widget = self.tabs.widget(index)
+        return next((map_id for map_id, canvas in self.canvases.items() if canvas is widget), None)
+
+    def render_canvas(self, map_id):
+        self.canvases[map_id].render_map()
+        self.unrendered.discard(map_id)
+        if map_id == self.active_map_id:
+            self.report_first_map()
+
+    def update_canvas_statuses(self, map_id, switches):
+        """Статусы устройств карты изменились — меняем только их иконки и оверлеи.
+
+        Возвращает число затронутых элементов сцены; ещё не нарисованный холст
+        возьмёт статусы при первой отрисовке.
+        """
+        canvas = self.canvases.get(map_id)
+        if canvas is None or map_id in self.unrendered:
+            return 0
+        return canvas.update_node_statuses(switches)
+
+    def apply_edit_mode(self):
+        """Переносит режим правки на холсты: у нарисованных перестраиваются только магистрали"""
+        for map_id, canvas in self.canvases.items():
+            if map_id in self.unrendered:
+                canvas.is_edit_mode = self.is_edit_mode
+            else:
+                canvas.set_edit_mode(self.is_edit_mode)
+
     def show_create_map_dialog(self):
         dialog = MapNameDialog(self)
         dialog.setModal(False)
@@ -641,9 +765,6 @@ class MainWindow(QMainWindow):
             self.show_toast("Нет связи с сервером", "error")
             return
 
-        # Request list of maps from server
-        request_id = self.ws_client.send_request("list_maps")
-
         def on_list_response(data):
             if data.get("success"):
                 map_files = data.get("files", [])
@@ -654,7 +775,16 @@ class MainWindow(QMainWindow):
             else:
                 self.show_toast(f"Ошибка загрузки списка карт: {data.get('error')}", "error")
 
-        self.pending_requests[request_id] = on_list_response
+        # Список карт, запрошенный при входе, используем один раз; дальше — свежий запрос
+        prefetched = self.prefetch.take_map_list() if self.prefetch else None
+        resumed, self.resumed_map_list = self.resumed_map_list, None
+        if prefetched is not None:
+            prefetched.add_done_callback(on_list_response)
+        elif resumed is not None and time.monotonic() - resumed[0] <= PREFETCH_MAX_AGE:
+            # Список пришёл вместе с возобновлением сеанса
+            on_list_response({"success": True, "files": resumed[1]})
+        else:
+            self.ws_client.request("list_maps", on_list_response)
 
     def on_open_map_accepted(self, dialog, map_files):
         if dialog.table.currentRow() >= 0:
@@ -688,22 +818,16 @@ class MainWindow(QMainWindow):
         if not self.active_map_id:
             self.show_toast("Нет активной карты для сохранения", "info")
             return
-
-        if not self.ws_connected:
-            self.show_toast("Нет связи с сервером", "error")
+        if self.active_map_id in self.stale_maps:
+            # Для снимка у журнала нет подтверждённой версии: запись целиком затёрла бы серверную
+            self.status_bar.showMessage("Карта ещё не загружена с сервера: сохранение недоступно", 5000)
             return
 
         try:
             # Обновляем время и пользователя
             self.map_data[self.active_map_id]["map"]["mod_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             self.map_data[self.active_map_id]["map"]["last_adm"] = self.current_user
-
-            # Send to server
-            request_id = self.ws_client.send_request(
-                "file_put",
-                path=f"maps/map_{self.active_map_id}.json",
-                data=self.map_data[self.active_map_id]
-            )
+            self.snapshot_dirty.add(self.active_map_id)
 
             def on_save_response(data):
                 if data.get("success"):
@@ -713,7 +837,16 @@ class MainWindow(QMainWindow):
                     self.status_bar.showMessage(f"Ошибка сохранения: {data.get('error')}", 3000)
                     QTimer.singleShot(3000, self.update_status_bar)
 
-            self.pending_requests[request_id] = on_save_response
+            # Через журнал: без связи карта сохранится локально и уйдёт на сервер при подключении.
+            # Точки магистралей уходят в прежнем строковом формате
+            sent = self.write_journal.submit(
+                "file_put",
+                f"maps/map_{self.active_map_id}.json",
+                dump_magistrals(self.map_data[self.active_map_id]),
+                on_save_response
+            )
+            if not sent:
+                self.status_bar.showMessage("Нет связи с сервером: изменения сохранены локально и будут отправлены при подключении", 5000)
 
         except Exception as e:
             self.status_bar.showMessage("Ошибка сохранения карты", 3000)
@@ -757,7 +890,8 @@ class MainWindow(QMainWindow):
             self.show_toast("Нет связи с сервером", "error")
             return
 
-        switches = self.map_data[self.active_map_id]["switches"]
+        map_id = self.active_map_id
+        switches = self.map_data[map_id]["switches"]
         if not switches:
             self.show_toast("На карте нет устройств", "error")
             return
@@ -773,17 +907,6 @@ class MainWindow(QMainWindow):
             self.show_toast("Нет устройств с IP-адресами", "error")
             return
 
-        # Отправляем запрос серверу
-        request_id = self.ws_client.send_request(
-            "ping_switches",
-            ping_data=ping_data,
-            timeout_ms=3000  # можно взять из CONFIG клиента, если добавите
-        )
-
-        if not request_id:
-            self.show_toast("Не удалось отправить запрос", "error")
-            return
-
         def on_ping_response(data):
             if not data.get("success"):
                 self.show_toast(f"Ошибка пинга: {data.get('error', 'unknown')}", "error")
@@ -796,21 +919,31 @@ class MainWindow(QMainWindow):
             for idx in result_map:
                 if idx < len(switches):
                     switches[idx]["pingok"] = result_map[idx]
+            self.snapshot_dirty.add(map_id)
 
-            # Перерисовываем только текущую карту (не пересоздаём все табы)
-            current_tab = self.tabs.currentWidget()
-            if current_tab:
-                current_tab.render_map()
+            # Меняем только иконки устройств, чей статус изменился
+            touched = self.update_canvas_statuses(map_id, [switches[idx] for idx in result_map if idx < len(switches)])
+            print(f"Пинг карты '{map_id}': изменено элементов карты {touched}")
 
             self.update_status_bar()
             self.status_bar.showMessage("Пинг устройств завершён", 3000)
             QTimer.singleShot(3000, self.update_status_bar)
 
-        self.pending_requests[request_id] = on_ping_response
+        # Отправляем запрос серверу
+        self.ws_client.request(
+            "ping_switches",
+            on_ping_response,
+            ping_data=ping_data,
+            timeout_ms=3000  # можно взять из CONFIG клиента, если добавите
+        )
 
         self.status_bar.showMessage("Пинг устройств в процессе...", 5000)
 
     def toggle_edit_mode(self):
+        if not self.is_edit_mode and self.active_map_id in self.stale_maps:
+            # Правка снимка ушла бы на сервер поверх версии, которой мы ещё не видели
+            self.show_toast("Карта показана из локального снимка: редактирование — после загрузки с сервера", "info")
+            return
         self.is_edit_mode = not self.is_edit_mode
         self.edit_button.setStyleSheet("""
             QPushButton {
@@ -837,10 +970,7 @@ class MainWindow(QMainWindow):
         """)
         self.settings_button.setEnabled(self.is_edit_mode and bool(self.active_map_id))
         self.show_toast(f"Режим редактирования: {'включен' if self.is_edit_mode else 'выключен'}", "info")
-        for index in range(self.tabs.count()):
-            tab = self.tabs.widget(index)
-            tab.is_edit_mode = self.is_edit_mode
-            tab.render_map()
+        self.apply_edit_mode()
         if not self.is_edit_mode:
             self.save_map()
 
@@ -871,19 +1001,18 @@ class MainWindow(QMainWindow):
         """)
         self.settings_button.setEnabled(self.is_edit_mode and bool(self.active_map_id))
         self.show_toast(f"Режим редактирования: {'включен' if self.is_edit_mode else 'выключен'}", "info")
-        for index in range(self.tabs.count()):
-            tab = self.tabs.widget(index)
-            tab.is_edit_mode = self.is_edit_mode
-            tab.render_map()
+        self.apply_edit_mode()
         if not self.is_edit_mode:
             self.save_map()
 
     def close_tab(self, index):
-        if index < 0 or index >= len(self.open_maps):
+        map_id = self.tab_map_id(index)
+        if map_id is None:
             return
-        map_id = self.open_maps[index]["id"]
-        self.open_maps.pop(index)
+        self.open_maps = [m for m in self.open_maps if m["id"] != map_id]
         self.save_open_maps()
+        self.ping_subscriptions.unsubscribe(map_id)
+        self.write_journal.drop_base(f"maps/map_{map_id}.json")
         if self.active_map_id == map_id:
             self.active_map_id = self.open_maps[0]["id"] if self.open_maps else None
             if self.active_map_id:
@@ -891,11 +1020,10 @@ class MainWindow(QMainWindow):
         self.update_tabs()
 
     def switch_tab(self, index):
-        if index < 0 or index >= len(self.open_maps):
+        new_map_id = self.tab_map_id(index)
+        if new_map_id is None:
             return
 
-        new_map_id = self.open_maps[index]["id"]
-
         # --- Если переключаем вкладку и был включён edit mode ---
         if self.is_edit_mode:
             # 1) Выключаем режим редактирования
@@ -931,8 +1059,8 @@ class MainWindow(QMainWindow):
         self.active_map_id = map_id
 
         if not self.ws_connected:
-            # Fallback to empty map
-            self.map_data[map_id] = {
+            # Fallback: неотправленная локальная версия, уже показанная (в т.ч. из снимка) или пустая карта
+            self.map_data[map_id] = self.write_journal.pending_data("file_put", f"maps/map_{map_id}.json") or self.map_data.get(map_id) or {
                 "map": {"name": map_id, "width": "1200", "height": "800"},
                 "switches": [],
                 "plan_switches": [],
@@ -941,24 +1069,48 @@ class MainWindow(QMainWindow):
                 "legends": [],
                 "magistrals": []
             }
-            # Если это начальная загрузка, уменьшаем счетчик
             if is_initial_load and hasattr(self, 'maps_to_load'):
                 self.maps_to_load -= 1
-                if self.maps_to_load == 0:
-                    self.update_tabs()
-                    self.update_status_bar()
+            self.update_tabs()
+            self.update_status_bar()
             return
 
-        # Request from server
-        request_id = self.ws_client.send_request(
-            "file_get",
-            path=f"maps/map_{map_id}.json"
-        )
+        path = f"maps/map_{map_id}.json"
+
+        def request_map(params):
+            self.ws_client.stream_request("file_get", on_load_response,
+                                          progress=lambda received, total: self.on_map_progress(map_id, received, total),
+                                          **params)
 
         def on_load_response(data):
-            if data.get("success"):
-                self.map_data[map_id] = data.get("data")
-                print(f"✓ Данные карты '{map_id}' загружены успешно")
+            # Ответ "не изменилась" превращается в документ из кеша
+            resolved = self.map_cache.resolve(path, data)
+            if resolved is None:
+                # Кеш пропал, пока шёл запрос, — берём карту целиком
+                print(f"Карта '{map_id}': версии {data.get('version')} нет в кеше, запрашиваем заново")
+                request_map({"path": path})
+                return
+            data = resolved
+            if data.get("success") and isinstance(data.get("data"), dict):
+                # От этой версии сервера сохранения пойдут разницей, а не всей картой
+                self.write_journal.set_base(path, data["data"].get("version", 0), data["data"])
+            # Неотправленная локальная версия новее серверной
+            pending = self.write_journal.pending_data("file_put", path)
+            if pending is not None:
+                self.map_data[map_id] = pending
+                print(f"✓ Карта '{map_id}' взята из журнала неотправленных изменений")
+            elif data.get("success"):
+                shown = self.map_data.get(map_id)
+                version = data["data"].get("version")
+                if map_id in self.stale_maps and shown and version and shown.get("version") == version:
+                    # Снимок той же версии уже на экране — документ оставляем, статусы догонит подписка
+                    print(f"✓ Карта '{map_id}': снимок совпадает с версией {version} на сервере")
+                else:
+                    self.map_data[map_id] = data.get("data")
+                    print(f"✓ Данные карты '{map_id}' загружены успешно")
+            elif data.get("transport_error"):
+                # Ответа нет (таймаут/обрыв) — пустую карту не подставляем, чтобы не затереть её при сохранении
+                self.show_toast(f"Не удалось загрузить карту '{map_id}': {data.get('error')}", "error")
             else:
                 self.map_data[map_id] = {
                     "map": {"name": map_id, "width": "1200", "height": "800"},
@@ -971,21 +1123,45 @@ class MainWindow(QMainWindow):
                 }
                 if not is_initial_load:
                     self.show_toast(f"Карта '{map_id}' не найдена на сервере, создана новая", "info")
+
+            if pending is not None or not data.get("transport_error"):
+                # Ответ сервера получен — снимок больше не выдаём за текущие данные
+                self.stale_maps.pop(map_id, None)
+                self.snapshot_dirty.add(map_id)
+            if map_id in self.map_data and (pending is not None or data.get("success")):
+                # Статусы в файле карты могут отставать — берём полный снимок по подписке
+                self.ping_subscriptions.subscribe(map_id, full=True)
             
-            # ИСПРАВЛЕНИЕ: Обновляем табы только когда все карты загружены
             if is_initial_load and hasattr(self, 'maps_to_load'):
                 self.maps_to_load -= 1
                 print(f"Загружена карта '{map_id}', осталось: {self.maps_to_load}")
-                if self.maps_to_load == 0:
-                    print("✓ Все карты загружены, обновляем интерфейс")
-                    self.update_tabs()
-                    self.update_status_bar()
-            else:
-                # Для карт, открытых вручную, обновляем сразу
-                self.update_tabs()
-                self.update_status_bar()
+            # Вкладка карты появляется сразу, не дожидаясь остальных
+            self.update_tabs()
+            self.update_status_bar()
 
-        self.pending_requests[request_id] = on_load_response
+        # Карта могла быть запрошена ещё из окна входа
+        prefetched = self.prefetch.take_map(map_id) if self.prefetch else None
+        if prefetched is not None:
+            prefetched.add_done_callback(on_load_response)
+        else:
+            request_map(self.map_cache.request_params(path))
+
+    def on_map_progress(self, map_id, received, total):
+        """Ход потоковой загрузки карты — в индикатор загрузки её вкладки или в статус-бар"""
+        canvas = self.canvases.get(map_id)
+        if canvas is not None and not canvas.is_data_loaded:
+            canvas.set_loading_progress(received, total)
+            return
+        if total:
+            self.status_bar.showMessage(f"Загрузка карты '{map_id}': {received * 100 // total}%", 1000)
+
+    def report_first_map(self):
+        """Время от запуска до первой отрисованной карты — в консоль и подсказку индикатора"""
+        report = self.startup_timer.finish("первая карта")
+        if report:
+            prefetch = f"\nПредзагрузка: {self.prefetch.stats}" if self.prefetch else ""
+            self.startup_report = f"Старт: {report}{prefetch}"
+            self.update_indicator_tooltip()
 
     def show_toast(self, message, toast_type="info"):
         self.status_bar.showMessage(message, 3000)
@@ -1016,22 +1192,37 @@ class MainWindow(QMainWindow):
         dialog.exec()
     
     def show_server_settings_dialog(self):
-        """Показывает диалог настройки адреса сервера"""
+        """Показывает диалог настройки адресов сервера"""
         dialog = ServerSettingsDialog(self, self.ws_client)
         if dialog.exec():
-            new_uri = dialog.get_server_uri()
-            if new_uri:
+            new_uris = dialog.get_server_uris()
+            if new_uris:
+                save_servers(new_uris)
+                # Версии карт у другого сервера свои: кеш и базы разниц от прежнего не годятся
+                self.map_cache.set_server(new_uris)
+                self.write_journal.clear_bases()
                 # Останавливаем текущее подключение
                 self.ws_client.stop()
                 self.ws_client.wait()
                 
-                # Создаем новое подключение с новым адресом
-                self.ws_client = WebSocketClient(uri=new_uri)
+                # Создаем новое подключение с новым адресом; предзагрузка относилась к старому
+                self.prefetch = None
+                ticket = self.ws_client.session_ticket
+                self.ws_client = WebSocketClient(uri=new_uris, recorder=self.ws_client.recorder)
+                self.ws_client.session_ticket = ticket
+                self.resumed_map_list = None
                 self.ws_client.connected.connect(self.on_ws_connected)
-                self.ws_client.message_received.connect(self.on_ws_message)
+                self.ws_client.server_ready.connect(self.on_ws_ready)
+                self.ws_client.messages_received.connect(self.on_ws_messages)
+                self.ws_client.health_changed.connect(self.on_ws_health)
+                self.ws_client.session_resumed.connect(self.on_session_resumed)
+                self.ping_subscriptions.attach(self.ws_client)
+                self.write_journal.client = self.ws_client
+                self.ws_client.connected.connect(self.write_journal.on_connection_changed)
+                self.ws_client.server_ready.connect(self.write_journal.on_server_ready)
                 self.ws_client.start()
                 
-                self.status_bar.showMessage(f"Подключение к {new_uri}...", 3000)
+                self.status_bar.showMessage(f"Подключение к {', '.join(new_uris)}...", 3000)
     
     def keyPressEvent(self, event):
         """Обработка горячих клавиш"""
@@ -1051,27 +1242,28 @@ class MainWindow(QMainWindow):
 
 
 class ServerSettingsDialog(QDialog):
-    """Диалог настройки адреса сервера"""
+    """Диалог настройки адресов сервера (основной и резервные)"""
     def __init__(self, parent=None, ws_client=None):
         super().__init__(parent)
         self.setWindowTitle("Настройка сервера")
-        self.setFixedSize(450, 180)
+        self.setFixedSize(450, 200)
         self.ws_client = ws_client
         
         layout = QVBoxLayout()
         
         # Заголовок
-        title = QLabel("Укажите адрес WebSocket сервера")
+        title = QLabel("Укажите адреса WebSocket сервера")
         title.setStyleSheet("font-size: 14px; font-weight: bold; color: #FFC107; padding: 10px;")
         layout.addWidget(title)
         
         # Поле ввода адреса
-        layout.addWidget(QLabel("Адрес сервера (например, ws://127.0.0.1:8081):"))
+        layout.addWidget(QLabel("Адреса через запятую (например, ws://127.0.0.1:8081, ws://127.0.0.1:8082).\n"
+                                "Клиент подключается к самому быстрому и переключается при обрыве:"))
         self.server_input = QLineEdit()
         
-        # Получаем текущий адрес из ws_client
+        # Получаем текущие адреса из ws_client
         if ws_client:
-            self.server_input.setText(ws_client.uri)
+            self.server_input.setText(", ".join(ws_client.pool.uris))
         else:
             self.server_input.setText("ws://127.0.0.1:8081")
         
@@ -1112,34 +1304,57 @@ class ServerSettingsDialog(QDialog):
             QPushButton:hover { background-color: #555; }
         """)
     
-    def get_server_uri(self):
-        """Возвращает введенный адрес сервера"""
-        uri = self.server_input.text().strip()
+    def get_server_uris(self):
+        """Возвращает список введенных адресов сервера"""
+        uris = [uri.strip() for uri in re.split(r"[,\s]+", self.server_input.text()) if uri.strip()]
         # Базовая валидация
-        if not uri.startswith("ws://") and not uri.startswith("wss://"):
-            QMessageBox.warning(self, "Ошибка", "Адрес должен начинаться с ws:// или wss://")
+        for uri in uris:
+            if not uri.startswith("ws://") and not uri.startswith("wss://"):
+                QMessageBox.warning(self, "Ошибка", f"Адрес должен начинаться с ws:// или wss://: {uri}")
+                return None
+        if not uris:
+            QMessageBox.warning(self, "Ошибка", "Укажите хотя бы один адрес")
             return None
-        return uri
+        return uris
 
 
 def main():
     app = QApplication(sys.argv)
 
+    # Одно соединение на весь сеанс: открывается до окна входа, после входа переходит в MainWindow
+    startup_timer = StartupTimer()
+    # PINGER_RECORD=<файл> — записывать трафик сеанса (см. traffic_log.py, tools/replay.py)
+    recorder = TrafficRecorder.from_env()
+    if recorder is not None:
+        app.aboutToQuit.connect(recorder.close)
+    from login_dialog import LoginDialog, read_saved_ticket
+    ws_client = WebSocketClient(recorder=recorder)
+    # Билет прошлого сеанса: если он ещё действует, сеанс восстановится в ответе на hello
+    ws_client.session_ticket = read_saved_ticket()
+    ws_client.start()
+    # Иконки карты грузятся, пока идёт подключение и вход: первой отрисовке диск уже не нужен
+    ICONS.preload()
+    map_cache = MapCache(server=load_servers())
+    prefetch = MapPrefetch(ws_client, startup_timer, cache=map_cache)
+
     # Показать диалог логина
-    from login_dialog import LoginDialog
-    login_dialog = LoginDialog()
+    login_dialog = LoginDialog(ws_client=ws_client, prefetch=prefetch, startup_timer=startup_timer)
 
     if login_dialog.exec() == QDialog.DialogCode.Accepted:
         # Логин успешен, получаем логин пользователя
         user_login = login_dialog.get_user_login()
 
         # Показываем главное окно с логином пользователя
-        window = MainWindow(user_login=user_login)
+        window = MainWindow(user_login=user_login, ws_client=login_dialog.release_client(),
+                            prefetch=prefetch, startup_timer=startup_timer, map_cache=map_cache)
         window.showMaximized()
         window.show()
         sys.exit(app.exec())
     else:
         # Логин отменен
+        prefetch.cancel()
+        ws_client.stop()
+        ws_client.wait()
         sys.exit(0)
 
 if __name__ == "__main__":
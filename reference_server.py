@@ -0,0 +1,744 @@
+# reference_server.py — эталонный WebSocket-сервер для разработки и проверки клиента
+#
+# Реализует протокол, на который рассчитан WebSocketClient: hello с выбором кодека,
+# склейку кадров action=chunk и пакеты action=batch. Данные лежат в каталоге --root
+# в той же раскладке, что и на боевом сервере (lists/, models/, operators/, maps/ ...).
+#
+# Пинг имитируется (SimulatedPinger): у каждого IP своё устойчивое состояние и RTT,
+# которые изредка меняются, так что клиент видит правдоподобную картину без сети.
+#
+# Запуск:
+#   python reference_server.py --root server_data --seed BACKUP --port 8081
+#   python reference_server.py --ping-interval 10 --ping-loss 0.1 --delay-ms 40
+#   python reference_server.py --port 8081 8082 8083   # несколько адресов для проверки переключения
+
+import argparse
+import asyncio
+import collections
+import csv
+import hashlib
+import io
+import json
+import os
+import random
+import secrets
+import shutil
+import time
+import traceback
+
+import websockets
+
+from json_patch import apply_patch
+from ws_protocol import (CODECS, JSON_CODEC, STREAM_CHUNK, STREAM_FIELDS, STREAM_UPLOADS, blob_version,
+                         decode_blob, decode_frame, encode_blob, pack_bytes, unpack_bytes)
+
+# Возможности сервера, которые он объявляет в ответе на hello
+SERVER_FEATURES = ("chunked", "batch", "push", "stream", "patch")
+
+# Сколько последних обновлений pingok карты хранится для догоняющей подписки
+PING_HISTORY = 1000
+
+# Сколько хранится недовыгруженный поток клиента, с
+UPLOAD_TTL = 3600
+
+# Сколько действует билет сеанса после отключения клиента, с
+SESSION_TTL = 900
+
+# Сколько имитированных пингов выполняется одновременно (как у fping)
+PING_PARALLEL = 64
+
+# Списки, которые клиент сохраняет целиком: действие -> (поле запроса, файл)
+SAVE_LISTS = {
+    "save_operators": ("operators", "operators/users.json"),
+    "save_groups": ("groups", "operators/groups.json"),
+    "save_masters": ("masters", "lists/masters.json"),
+    "save_engineers": ("engineers", "lists/engineers.json"),
+    "save_firmwares": ("firmwares", "lists/firmware.json"),
+    "save_mngmt_vlan": ("vlans", "lists/mngmtvlan.json"),
+}
+
+
+def pack_message(message, codec):
+    """bytes верхнего уровня — как есть для бинарного кодека, base64 для JSON"""
+    if codec.binary:
+        return message
+    return {k: pack_bytes(v, codec) if isinstance(v, (bytes, bytearray)) else v for k, v in message.items()}
+
+
+class Connection:
+    """Состояние одного подключения: кодек и недособранные передачи"""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.codec = JSON_CODEC
+        self.features = set()
+        self.user = None
+        self.ticket = None
+        self.transfers = {}  # transfer_id -> {seq: data}
+        self.send_lock = asyncio.Lock()
+
+    async def send(self, message):
+        frame = self.codec.encode(pack_message(message, self.codec))
+        async with self.send_lock:
+            await self.ws.send(frame)
+
+
+class SimulatedPinger:
+    """Имитация ICMP-пинга.
+
+    Начальное состояние и базовый RTT адреса выводятся из хеша IP и seed,
+    поэтому при одинаковых параметрах картина воспроизводится. При каждой
+    проверке адрес с вероятностью flap меняет состояние. Недоступный адрес
+    отвечает только по истечении таймаута — как настоящий пинг.
+    """
+
+    def __init__(self, loss=0.05, flap=0.01, rtt_ms=2.0, seed=0):
+        self.loss = loss
+        self.flap = flap
+        self.rtt_ms = rtt_ms
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.hosts = {}  # ip -> {"up", "rtt"}
+        self.semaphore = None
+        self.stats = {"probes": 0, "lost": 0}
+
+    def _host(self, ip):
+        host = self.hosts.get(ip)
+        if host is None:
+            digest = hashlib.sha256(f"{self.seed}:{ip}".encode("utf-8")).digest()
+            host = {
+                "up": digest[0] / 256 >= self.loss,
+                "rtt": self.rtt_ms * (0.5 + digest[1] / 128),
+            }
+            self.hosts[ip] = host
+        return host
+
+    async def ping(self, ip, timeout_ms=1000):
+        """(доступен ли ip, RTT в мс или None)"""
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(PING_PARALLEL)
+        host = self._host(ip)
+        if self.random.random() < self.flap:
+            host["up"] = not host["up"]
+        async with self.semaphore:
+            self.stats["probes"] += 1
+            rtt = host["rtt"] * self.random.uniform(0.8, 1.5)
+            if not host["up"] or rtt > timeout_ms:
+                self.stats["lost"] += 1
+                await asyncio.sleep(timeout_ms / 1000)
+                return False, None
+            await asyncio.sleep(rtt / 1000)
+            return True, round(rtt, 2)
+
+    async def ping_many(self, ips, timeout_ms=1000):
+        return await asyncio.gather(*(self.ping(ip, timeout_ms) for ip in ips))
+
+
+class PingHub:
+    """Текущие pingok карт, история изменений с номерами и подписчики.
+
+    Каждое изменение статусов карты получает следующий seq и рассылается
+    подписчикам кадром action=push. Подписка с since_seq досылает всё, что
+    случилось после этого номера, если оно ещё есть в истории, иначе —
+    полный снимок.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.maps = {}  # map_id -> состояние, см. _state()
+
+    def _state(self, map_id):
+        state = self.maps.get(map_id)
+        if state is None:
+            map_doc = self.server.read_json(f"maps/map_{map_id}.json", {})
+            switches = map_doc.get("switches", [])
+            state = {
+                "seq": 0,
+                "history": collections.deque(maxlen=PING_HISTORY),  # (seq, [updates])
+                "status": {str(s.get("id")): bool(s.get("pingok")) for s in switches},
+                "index": {str(s.get("id")): i for i, s in enumerate(switches)},
+                "ips": {str(s.get("id")): s.get("ip") for s in switches if s.get("ip")},
+                "subscribers": set(),
+            }
+            self.maps[map_id] = state
+        return state
+
+    def _update(self, state, switch_id):
+        return {"id": switch_id, "index": state["index"].get(switch_id), "pingok": state["status"][switch_id]}
+
+    def subscribe(self, conn, map_id, since_seq=None):
+        state = self._state(map_id)
+        state["subscribers"].add(conn)
+        history = state["history"]
+        oldest = history[0][0] if history else state["seq"] + 1
+        if since_seq is not None and oldest <= since_seq + 1 and since_seq <= state["seq"]:
+            # Догоняем: последние значения всех изменившихся после since_seq свитчей
+            changed = {}
+            for seq, updates in history:
+                if seq > since_seq:
+                    for upd in updates:
+                        changed[upd["id"]] = upd
+            return {"seq": state["seq"], "full": False, "updates": list(changed.values())}
+        updates = [self._update(state, switch_id) for switch_id in state["status"]]
+        return {"seq": state["seq"], "full": True, "updates": updates}
+
+    def unsubscribe(self, conn, map_id):
+        state = self.maps.get(map_id)
+        if state:
+            state["subscribers"].discard(conn)
+
+    def drop(self, conn):
+        for state in self.maps.values():
+            state["subscribers"].discard(conn)
+
+    def statuses(self, map_id):
+        """pingok по индексу свитча (для опроса check_ping_updates)"""
+        state = self._state(map_id)
+        return {state["index"][switch_id]: pingok for switch_id, pingok in state["status"].items()}
+
+    async def publish(self, map_id, changes):
+        """changes: {switch_id: pingok}; рассылает только реально изменившиеся"""
+        state = self._state(map_id)
+        updates = []
+        for switch_id, pingok in changes.items():
+            switch_id = str(switch_id)
+            if switch_id in state["status"] and state["status"][switch_id] != pingok:
+                state["status"][switch_id] = pingok
+                updates.append(self._update(state, switch_id))
+        if not updates:
+            return 0
+        state["seq"] += 1
+        state["history"].append((state["seq"], updates))
+        push = {"action": "push", "topic": "pingok", "map_id": map_id, "seq": state["seq"], "updates": updates}
+        for conn in list(state["subscribers"]):
+            try:
+                await conn.send(push)
+            except websockets.ConnectionClosed:
+                state["subscribers"].discard(conn)
+        return len(updates)
+
+    async def simulate(self, pinger, interval, timeout_ms=1000):
+        """Фоновый опрос: раз в interval с пингует свитчи карт с подписчиками и рассылает изменения"""
+        while True:
+            await asyncio.sleep(interval)
+            for map_id, state in list(self.maps.items()):
+                if not state["subscribers"] or not state["ips"]:
+                    continue
+                switch_ids = list(state["ips"])
+                results = await pinger.ping_many([state["ips"][s] for s in switch_ids], timeout_ms)
+                await self.publish(map_id, {s: ok for s, (ok, _rtt) in zip(switch_ids, results)})
+
+
+class ReferenceServer:
+    def __init__(self, root, pinger=None, delay_ms=0):
+        self.root = os.path.abspath(root)
+        self.pinger = pinger or SimulatedPinger()
+        # Искусственная задержка каждого ответа — имитация медленного канала до сервера
+        self.delay_ms = delay_ms
+        self.ping_hub = PingHub(self)
+        # Потоковые выгрузки клиентов: transfer_id -> {"buffer", "total", "updated"}; переживают переподключение
+        self.uploads = {}
+        # Билеты сеансов: ticket -> {"user", "conn", "expires"}; пока соединение живо, билет не истекает
+        self.sessions = {}
+        # Версии карт: путь на диске -> номер; читаются из файла при первом обращении
+        self.versions = {}
+        self.handlers = {
+            "hello": self.handle_hello,
+            "batch": self.handle_batch,
+            "auth_login": self.handle_auth_login,
+            "list_maps": self.handle_list_maps,
+            "subscribe": self.handle_subscribe,
+            "unsubscribe": self.handle_unsubscribe,
+            "check_ping_updates": self.handle_check_ping_updates,
+            "ping_switches": self.handle_ping_switches,
+            "ping": self.handle_ping,
+            "file_get": self.handle_file_get,
+            "file_put": self.handle_file_put,
+            "file_patch": self.handle_file_patch,
+            "csv_read": self.handle_csv_read,
+            "csv_write": self.handle_csv_write,
+            "download_image": self.handle_download_image,
+            "upload_image": self.handle_upload_image,
+            "stream_put": self.handle_stream_put,
+            "list_models": self.handle_list_models,
+            "load_model": self.handle_load_model,
+            "save_model": self.handle_save_model,
+            "delete_model": self.handle_delete_model,
+            "list_mngmt_vlan": self.handle_list_mngmt_vlan,
+            "list_masters": self.handle_list_masters,
+            "list_firmwares": self.handle_list_firmwares,
+            "list_engineers": self.handle_list_engineers,
+        }
+        for action in SAVE_LISTS:
+            self.handlers[action] = self.handle_save_list
+
+    # === ФАЙЛЫ ===
+    def resolve(self, path):
+        """Путь клиента -> путь на диске; префикс data/ отбрасывается, выход за root запрещён"""
+        path = (path or "").replace("\\", "/").lstrip("/")
+        if path.startswith("data/"):
+            path = path[len("data/"):]
+        full = os.path.abspath(os.path.join(self.root, path))
+        if full != self.root and not full.startswith(self.root + os.sep):
+            raise ValueError(f"Недопустимый путь: {path}")
+        return full
+
+    def write_file(self, path, payload):
+        """Атомарная запись: временный файл и подмена"""
+        full = self.resolve(path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        tmp = full + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, full)
+
+    def read_json(self, path, default=None):
+        full = self.resolve(path)
+        if not os.path.exists(full):
+            if default is not None:
+                return default
+            raise FileNotFoundError(f"Файл не найден: {path}")
+        with open(full, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_json(self, path, data):
+        self.write_file(path, json.dumps(data, ensure_ascii=False, indent=4).encode("utf-8"))
+
+    def is_versioned(self, path):
+        """Версию ведут только файлы карт maps/map_*.json"""
+        full = self.resolve(path)
+        return (os.path.dirname(full) == self.resolve("maps")
+                and os.path.basename(full).startswith("map_") and full.endswith(".json"))
+
+    def file_version(self, path):
+        full = self.resolve(path)
+        if full not in self.versions:
+            try:
+                data = self.read_json(path)
+                self.versions[full] = data.get("version", 0) if isinstance(data, dict) else 0
+            except (FileNotFoundError, ValueError):
+                self.versions[full] = 0
+        return self.versions[full]
+
+    def write_versioned(self, path, data):
+        """Записывает карту со следующим номером версии и возвращает его; номер ведёт сервер"""
+        version = self.file_version(path) + 1
+        data["version"] = version
+        self.write_file(path, json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"))
+        self.versions[self.resolve(path)] = version
+        return version
+
+    # === ОБРАБОТЧИКИ ===
+    async def handle_hello(self, conn, msg):
+        # Первый из предложенных клиентом кодеков, который есть и у сервера
+        codec = next((name for name in msg.get("codecs", []) if name in CODECS), "json")
+        conn.features = set(msg.get("features", [])) & set(SERVER_FEATURES)
+        reply = {
+            "request_id": msg.get("request_id"),
+            "success": True,
+            "features": sorted(conn.features),
+            "codec": codec,
+        }
+        if isinstance(msg.get("resume"), dict):
+            # Возобновление сеанса в том же обмене: вход, подписки и список карт
+            reply["resume"] = self.resume_session(conn, msg["resume"])
+        # Ответ на hello всегда в JSON, дальше — согласованный кодек
+        await conn.send(reply)
+        conn.codec = CODECS[codec]
+        return None
+
+    # === СЕАНСЫ ===
+    def issue_ticket(self, conn, user):
+        ticket = secrets.token_urlsafe(24)
+        self.sessions[ticket] = {"user": user, "conn": conn, "expires": None}
+        conn.user, conn.ticket = user.get("login"), ticket
+        return ticket
+
+    def resume_session(self, conn, resume):
+        now = time.monotonic()
+        for ticket in [t for t, s in self.sessions.items() if s["conn"] is None and s["expires"] < now]:
+            del self.sessions[ticket]
+        session = self.sessions.get(resume.get("ticket"))
+        if session is None:
+            return {"success": False, "error": "Сеанс истёк, нужен вход"}
+        session["conn"], session["expires"] = conn, None
+        conn.user, conn.ticket = session["user"].get("login"), resume["ticket"]
+        subscriptions = {
+            str(map_id): self.ping_hub.subscribe(conn, str(map_id), since_seq)
+            for map_id, since_seq in (resume.get("subscriptions") or {}).items()
+        }
+        return {
+            "success": True,
+            "user": session["user"],
+            "ticket": resume["ticket"],
+            "ticket_ttl": SESSION_TTL,
+            "subscriptions": subscriptions,
+            "files": self.map_files(),
+        }
+
+    def release_session(self, conn):
+        # Билет отключившегося клиента действует ещё SESSION_TTL
+        session = self.sessions.get(conn.ticket)
+        if session is not None and session["conn"] is conn:
+            session["conn"], session["expires"] = None, time.monotonic() + SESSION_TTL
+
+    async def handle_batch(self, conn, msg):
+        requests = msg.get("requests", [])
+        responses = await asyncio.gather(*(self.process(conn, sub) for sub in requests))
+        return {"success": True, "responses": [pack_message(r, conn.codec) for r in responses]}
+
+    async def handle_auth_login(self, conn, msg):
+        # Пароли в operators/users.json хранятся как sha256, клиент присылает такой же хеш
+        users = self.read_json("operators/users.json", [])
+        user = next((u for u in users if u.get("login") == msg.get("login")), None)
+        if user is None or user.get("password") != msg.get("password_hash"):
+            return {"success": False, "error": "Неверный логин или пароль"}
+        public = {k: v for k, v in user.items() if k != "password"}
+        ticket = self.issue_ticket(conn, public)
+        return {"success": True, "user": public, "ticket": ticket, "ticket_ttl": SESSION_TTL}
+
+    def map_files(self):
+        maps_dir = self.resolve("maps")
+        return sorted(f for f in os.listdir(maps_dir) if f.endswith(".json")) if os.path.isdir(maps_dir) else []
+
+    async def handle_list_maps(self, conn, msg):
+        return {"success": True, "files": self.map_files()}
+
+    async def handle_subscribe(self, conn, msg):
+        result = self.ping_hub.subscribe(conn, str(msg.get("map_id")), msg.get("since_seq"))
+        return {"success": True, **result}
+
+    async def handle_unsubscribe(self, conn, msg):
+        self.ping_hub.unsubscribe(conn, str(msg.get("map_id")))
+        return {"success": True}
+
+    async def handle_check_ping_updates(self, conn, msg):
+        # Опрос для клиентов без подписки: клиент шлёт {индекс: "true"/"false"}, сервер — отличия
+        statuses = self.ping_hub.statuses(str(msg.get("map_id")))
+        updates = []
+        for index, value in (msg.get("hashes") or {}).items():
+            pingok = statuses.get(int(index))
+            if pingok is not None and str(pingok).lower() != value:
+                updates.append({"index": int(index), "pingok": pingok})
+        return {"success": True, "updates": updates}
+
+    async def handle_ping_switches(self, conn, msg):
+        # Все адреса пингуются параллельно; ответ — по индексам из запроса
+        ping_data = [item for item in (msg.get("ping_data") or []) if item.get("ip")]
+        results = await self.pinger.ping_many([item["ip"] for item in ping_data], msg.get("timeout_ms") or 1000)
+        return {
+            "success": True,
+            "results": [
+                {"index": item.get("index"), "success": ok, "time": rtt}
+                for item, (ok, rtt) in zip(ping_data, results)
+            ],
+        }
+
+    async def handle_ping(self, conn, msg):
+        if not msg.get("ip"):
+            raise ValueError("IP не указан")
+        ok, rtt = await self.pinger.ping(msg["ip"], msg.get("timeout_ms") or 1000)
+        return {"success": ok, "time": rtt}
+
+    async def handle_file_get(self, conn, msg):
+        path = msg.get("path")
+        if not self.is_versioned(path):
+            return {"success": True, "data": self.read_json(path)}
+        version = self.file_version(path)
+        if version and msg.get("known_version") == version and os.path.exists(self.resolve(path)):
+            # У клиента в кеше та же версия — документ не передаём
+            return {"success": True, "not_modified": True, "version": version}
+        return {"success": True, "data": self.read_json(path), "version": version}
+
+    async def handle_file_put(self, conn, msg):
+        path, data = msg.get("path"), msg.get("data")
+        if isinstance(data, dict) and self.is_versioned(path):
+            return {"success": True, "version": self.write_versioned(path, data)}
+        payload = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+        self.write_file(path, payload)
+        return {"success": True}
+
+    async def handle_file_patch(self, conn, msg):
+        path = msg.get("path")
+        if not self.is_versioned(path):
+            raise ValueError(f"Файл не поддерживает изменения по разнице: {path}")
+        current = self.file_version(path)
+        if msg.get("base_version") != current:
+            # Клиент считал разницу от устаревшей версии — пусть пришлёт документ целиком
+            return {"success": False, "conflict": True, "version": current,
+                    "error": f"Версия устарела: {msg.get('base_version')}, на сервере {current}"}
+        try:
+            data = apply_patch(self.read_json(path), msg.get("patch") or [])
+        except (FileNotFoundError, ValueError, KeyError, TypeError) as e:
+            return {"success": False, "conflict": True, "version": current, "error": str(e)}
+        if not isinstance(data, dict):
+            return {"success": False, "conflict": True, "version": current, "error": "Документ карты не объект"}
+        return {"success": True, "version": self.write_versioned(path, data)}
+
+    async def handle_csv_read(self, conn, msg):
+        full = self.resolve(msg.get("path"))
+        if not os.path.isfile(full):
+            raise FileNotFoundError(f"Файл не найден: {msg.get('path')}")
+        with open(full, "r", newline="", encoding="utf-8") as f:
+            return {"success": True, "data": list(csv.DictReader(f))}
+
+    async def handle_csv_write(self, conn, msg):
+        rows = msg.get("data") or []
+        # Заголовок — объединение ключей всех строк в порядке появления
+        fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+        buffer = io.StringIO(newline="")
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+        self.write_file(msg.get("path"), buffer.getvalue().encode("utf-8"))
+        return {"success": True}
+
+    async def handle_download_image(self, conn, msg):
+        full = self.resolve(f"images/{os.path.basename(msg.get('filename') or '')}")
+        if not os.path.isfile(full):
+            raise FileNotFoundError(f"Изображение не найдено: {msg.get('filename')}")
+        with open(full, "rb") as f:
+            return {"success": True, "image": f.read()}
+
+    async def handle_upload_image(self, conn, msg):
+        self.write_file(f"images/{os.path.basename(msg.get('filename') or '')}", unpack_bytes(msg.get("image")))
+        return {"success": True}
+
+    async def handle_stream_put(self, conn, msg):
+        now = time.monotonic()
+        for transfer_id in [t for t, u in self.uploads.items() if now - u["updated"] > UPLOAD_TTL]:
+            del self.uploads[transfer_id]
+        upload = self.uploads.get(msg.get("transfer_id"))
+        if upload is None or upload["total"] != msg.get("total"):
+            upload = self.uploads[msg.get("transfer_id")] = {"buffer": bytearray(), "total": msg.get("total"), "updated": now}
+        return {"success": True, "offset": len(upload["buffer"])}
+
+    def receive_stream_chunk(self, msg):
+        """Фрагмент выгрузки: принимается, только если продолжает уже полученное"""
+        upload = self.uploads.get(msg.get("transfer_id"))
+        if upload is None or msg.get("offset") != len(upload["buffer"]):
+            return
+        upload["buffer"] += unpack_bytes(msg.get("data"))
+        upload["updated"] = time.monotonic()
+
+    def take_stream_upload(self, msg):
+        """Подставляет в запрос выгруженное потоком поле"""
+        stream = msg.pop("stream")
+        upload = self.uploads.get(stream.get("transfer_id"))
+        if upload is None or len(upload["buffer"]) != stream.get("total"):
+            raise ValueError("Потоковая выгрузка не завершена")
+        del self.uploads[stream["transfer_id"]]
+        msg[stream.get("field", STREAM_FIELDS[msg["action"]])] = decode_blob(upload["buffer"], stream.get("encoding"))
+
+    async def send_stream(self, conn, response, field, stream):
+        """Отдаёт поле ответа фрагментами; докачка с offset, если содержимое не изменилось"""
+        blob, encoding = encode_blob(response.pop(field))
+        version = blob_version(blob)
+        total = len(blob)
+        offset = stream.get("offset") or 0
+        if stream.get("version") != version or not 0 <= offset <= total:
+            offset = 0
+        # Если всё уже было передано, отправляется один пустой завершающий кадр
+        for start in range(offset, total, STREAM_CHUNK) or [total]:
+            chunk = {
+                "action": "stream_chunk",
+                "request_id": response["request_id"],
+                "version": version,
+                "offset": start,
+                "total": total,
+                "data": blob[start:start + STREAM_CHUNK],
+                "final": start + STREAM_CHUNK >= total,
+            }
+            if chunk["final"]:
+                chunk.update(field=field, encoding=encoding, response=response)
+            await conn.send(chunk)
+
+    async def handle_list_models(self, conn, msg):
+        return {"success": True, "models": self.read_json("models/models.json", [])}
+
+    def model_path(self, model_id):
+        model_id = os.path.basename(str(model_id or ""))
+        if not model_id:
+            raise ValueError("Не указан id модели")
+        return f"models/{model_id}.json"
+
+    async def handle_load_model(self, conn, msg):
+        return {"success": True, "model": self.read_json(self.model_path(msg.get("id")))}
+
+    async def handle_save_model(self, conn, msg):
+        model_id = msg.get("id")
+        model = msg.get("model") or {}
+        self.write_json(self.model_path(model_id), model)
+        # В models.json — только id и имя; новая модель дописывается в конец
+        models = self.read_json("models/models.json", [])
+        entry = next((m for m in models if m.get("id") == model_id), None)
+        if entry is None:
+            models.append({"id": model_id, "model_name": model.get("model_name", model_id)})
+        else:
+            entry["model_name"] = model.get("model_name", entry.get("model_name"))
+        self.write_json("models/models.json", models)
+        return {"success": True}
+
+    async def handle_delete_model(self, conn, msg):
+        model_id = msg.get("id")
+        full = self.resolve(self.model_path(model_id))
+        if os.path.exists(full):
+            os.remove(full)
+        models = self.read_json("models/models.json", [])
+        self.write_json("models/models.json", [m for m in models if m.get("id") != model_id])
+        return {"success": True}
+
+    async def handle_save_list(self, conn, msg):
+        field, path = SAVE_LISTS[msg["action"]]
+        if not isinstance(msg.get(field), list):
+            raise ValueError(f"Ожидался список в поле {field}")
+        self.write_json(path, msg[field])
+        return {"success": True}
+
+    async def handle_list_mngmt_vlan(self, conn, msg):
+        return {"success": True, "vlans": self.read_json("lists/mngmtvlan.json", [])}
+
+    async def handle_list_masters(self, conn, msg):
+        return {"success": True, "masters": self.read_json("lists/masters.json", [])}
+
+    async def handle_list_firmwares(self, conn, msg):
+        return {"success": True, "firmwares": self.read_json("lists/firmware.json", [])}
+
+    async def handle_list_engineers(self, conn, msg):
+        return {"success": True, "engineers": self.read_json("lists/engineers.json", [])}
+
+    # === ДИСПЕТЧЕР ===
+    async def process(self, conn, msg):
+        """Выполняет одно сообщение и возвращает ответ с тем же request_id"""
+        action = msg.get("action")
+        handler = self.handlers.get(action)
+        try:
+            if handler is None:
+                response = {"success": False, "error": f"Неизвестное действие: {action}"}
+            else:
+                if action in STREAM_UPLOADS and isinstance(msg.get("stream"), dict):
+                    self.take_stream_upload(msg)
+                response = await handler(conn, msg)
+        except Exception as e:
+            if not isinstance(e, (FileNotFoundError, ValueError)):
+                traceback.print_exc()
+            response = {"success": False, "error": str(e)}
+        if response is not None:
+            response["request_id"] = msg.get("request_id")
+        return response
+
+    async def respond(self, conn, msg):
+        if self.delay_ms:
+            await asyncio.sleep(self.delay_ms / 1000)
+        response = await self.process(conn, msg)
+        if response is None:
+            return
+        stream = msg.get("stream")
+        field = STREAM_FIELDS.get(msg.get("action"))
+        if isinstance(stream, dict) and response.get("success") and field in response:
+            await self.send_stream(conn, response, field, stream)
+        else:
+            await conn.send(response)
+
+    def reassemble(self, conn, msg):
+        """Копит кадры action=chunk; на последнем возвращает собранное сообщение"""
+        parts = conn.transfers.setdefault(msg["transfer_id"], {})
+        parts[msg["seq"]] = msg["data"]
+        if not msg.get("final"):
+            return None
+        data = [parts[seq] for seq in sorted(parts)]
+        del conn.transfers[msg["transfer_id"]]
+        if isinstance(data[0], str):
+            return decode_frame("".join(data), conn.codec)
+        return decode_frame(b"".join(data), conn.codec)
+
+    async def handle_connection(self, ws, path=None):
+        conn = Connection(ws)
+        print(f"Подключение: {ws.remote_address}")
+        tasks = set()
+        try:
+            async for frame in ws:
+                try:
+                    msg = decode_frame(frame, conn.codec)
+                    if msg.get("action") == "chunk":
+                        msg = self.reassemble(conn, msg)
+                        if msg is None:
+                            continue
+                    if msg.get("action") == "stream_chunk":
+                        # По порядку и без ответа: запрос с "stream" придёт после всех фрагментов
+                        self.receive_stream_chunk(msg)
+                        continue
+                except Exception as e:
+                    print(f"Некорректный кадр: {e}")
+                    continue
+
+                if msg.get("action") == "hello":
+                    # hello обрабатывается сразу: от него зависит кодек следующих кадров
+                    await self.respond(conn, msg)
+                    continue
+
+                task = asyncio.create_task(self.respond(conn, msg))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.ping_hub.drop(conn)
+            self.release_session(conn)
+            print(f"Отключение: {ws.remote_address}")
+
+    async def serve(self, host, ports, ping_interval=0):
+        """Слушает на всех ports; данные и статусы общие, как у реплик одного сервиса"""
+        servers = [await websockets.serve(self.handle_connection, host, port, max_size=None) for port in ports]
+        for port in ports:
+            print(f"Сервер слушает ws://{host}:{port}, данные: {self.root}")
+        if ping_interval:
+            asyncio.create_task(self.ping_hub.simulate(self.pinger, ping_interval))
+        try:
+            await asyncio.Future()
+        finally:
+            for server in servers:
+                server.close()
+
+
+def seed_root(root, seed):
+    """Копирует образец данных в пустой каталог сервера"""
+    if os.path.isdir(root) and os.listdir(root):
+        return
+    for name in os.listdir(seed):
+        src = os.path.join(seed, name)
+        if os.path.isdir(src):
+            shutil.copytree(src, os.path.join(root, name), dirs_exist_ok=True)
+    print(f"Данные скопированы из {seed} в {root}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Эталонный WebSocket-сервер PingerApp")
+    parser.add_argument("--root", default="server_data", help="каталог с данными сервера")
+    parser.add_argument("--seed", default=None, help="скопировать образец данных (например, BACKUP) в пустой root")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, nargs="+", default=[8081], help="один или несколько портов")
+    parser.add_argument("--ping-interval", type=float, default=0,
+                        help="пинговать свитчи карт с подписчиками раз в N с и рассылать изменения (0 — выкл.)")
+    parser.add_argument("--ping-loss", type=float, default=0.05, help="доля изначально недоступных адресов")
+    parser.add_argument("--ping-flap", type=float, default=0.01, help="вероятность смены состояния адреса при проверке")
+    parser.add_argument("--ping-rtt", type=float, default=2.0, help="средний RTT имитированного пинга, мс")
+    parser.add_argument("--ping-seed", type=int, default=0, help="seed имитации (одинаковый seed — одинаковая картина)")
+    parser.add_argument("--delay-ms", type=float, default=0, help="задержка каждого ответа, мс (имитация медленного канала)")
+    args = parser.parse_args()
+
+    os.makedirs(args.root, exist_ok=True)
+    if args.seed:
+        seed_root(args.root, args.seed)
+    try:
+        pinger = SimulatedPinger(args.ping_loss, args.ping_flap, args.ping_rtt, args.ping_seed)
+        server = ReferenceServer(args.root, pinger, args.delay_ms)
+        asyncio.run(server.serve(args.host, args.port, args.ping_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# spatial_index.py — сеточный пространственный индекс прямоугольников узлов карты
+#
+# Сцена делится на квадратные ячейки CELL_SIZE; каждый прямоугольник записан во все
+# ячейки, которые он задевает. Запрос точки смотрит одну ячейку, запрос рамки — только
+# ячейки под рамкой, поэтому наведение мыши и выделение рамкой не перебирают всю карту.
+# Без Qt: прямоугольник — кортеж (x1, y1, x2, y2), чтобы индекс можно было мерить отдельно
+# (tools/bench_spatial.py).
+
+# Сторона ячейки: порядка размера иконки узла (60 px) с запасом — узел задевает 1–4 ячейки
+CELL_SIZE = 128
+
+
+class GridIndex:
+    """Ключ -> (прямоугольник, значение) с выборкой по точке и по рамке.
+
+    Результаты возвращаются в порядке вставки — как при переборе списков карты.
+    """
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells = {}  # (cx, cy) -> set ключей
+        self._rects = {}  # ключ -> (x1, y1, x2, y2)
+        self._values = {}  # ключ -> значение
+        self._order = {}  # ключ -> порядковый номер вставки
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._rects)
+
+    def clear(self):
+        self._cells.clear()
+        self._rects.clear()
+        self._values.clear()
+        self._order.clear()
+
+    def _cell_range(self, rect):
+        size = self.cell_size
+        x1, y1, x2, y2 = rect
+        return range(int(x1 // size), int(x2 // size) + 1), range(int(y1 // size), int(y2 // size) + 1)
+
+    def insert(self, key, rect, value=None):
+        if key in self._rects:
+            self.remove(key)
+        self._rects[key] = rect
+        self._values[key] = value
+        self._seq += 1
+        self._order[key] = self._seq
+        xs, ys = self._cell_range(rect)
+        for cx in xs:
+            for cy in ys:
+                self._cells.setdefault((cx, cy), set()).add(key)
+
+    def remove(self, key):
+        rect = self._rects.pop(key, None)
+        if rect is None:
+            return
+        self._values.pop(key, None)
+        self._order.pop(key, None)
+        xs, ys = self._cell_range(rect)
+        for cx in xs:
+            for cy in ys:
+                cell = self._cells.get((cx, cy))
+                if cell is not None:
+                    cell.discard(key)
+                    if not cell:
+                        del self._cells[(cx, cy)]
+
+    def move(self, key, rect):
+        """Новый прямоугольник ключа; ячейки меняются, только если он их пересёк"""
+        old = self._rects.get(key)
+        if old is None:
+            return
+        if self._cell_range(old) == self._cell_range(rect):
+            self._rects[key] = rect
+            return
+        value, order = self._values[key], self._order[key]
+        self.remove(key)
+        self.insert(key, rect, value)
+        self._order[key] = order
+
+    def rect(self, key):
+        return self._rects.get(key)
+
+    def query_point(self, x, y):
+        """[(ключ, значение)] прямоугольников, содержащих точку (границы включительно)"""
+        size = self.cell_size
+        cell = self._cells.get((int(x // size), int(y // size)))
+        if not cell:
+            return []
+        found = []
+        for key in cell:
+            x1, y1, x2, y2 = self._rects[key]
+            if x1 <= x <= x2 and y1 <= y <= y2:
+                found.append(key)
+        return self._sorted(found)
+
+    def query_rect(self, rect, contained=False):
+        """[(ключ, значение)] прямоугольников, пересекающих рамку (contained=True — целиком внутри)"""
+        qx1, qy1, qx2, qy2 = rect
+        xs, ys = self._cell_range(rect)
+        seen = set()
+        found = []
+        # Рамка больше всей занятой области — дешевле пройти по ячейкам, которые вообще есть
+        if len(xs) * len(ys) > len(self._cells):
+            cells = (keys for (cx, cy), keys in self._cells.items() if cx in xs and cy in ys)
+        else:
+            cells = (self._cells[(cx, cy)] for cx in xs for cy in ys if (cx, cy) in self._cells)
+        for keys in cells:
+            for key in keys:
+                if key in seen:
+                    continue
+                seen.add(key)
+                x1, y1, x2, y2 = self._rects[key]
+                if contained:
+                    hit = qx1 <= x1 and qy1 <= y1 and x2 <= qx2 and y2 <= qy2
+                else:
+                    hit = x1 <= qx2 and qx1 <= x2 and y1 <= qy2 and qy1 <= y2
+                if hit:
+                    found.append(key)
+        return self._sorted(found)
+
+    def _sorted(self, keys):
+        keys.sort(key=self._order.__getitem__)
+        return [(key, self._values[key]) for key in keys]
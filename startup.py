@@ -0,0 +1,131 @@
+# startup.py — старт приложения: предзагрузка карт во время входа и замер времени до первой карты
+
+import os
+import pickle
+import time
+
+OPEN_MAPS_FILE = "open_maps.pkl"
+
+# Предзагруженный ответ старше этого срока считается устаревшим и запрашивается заново
+PREFETCH_MAX_AGE = 120
+
+
+def read_open_maps(pickle_file=OPEN_MAPS_FILE):
+    """Читает open_maps.pkl и возвращает список {"id", "name"}.
+       Допускает старые строковые записи; при любой ошибке — пустой список."""
+    if not os.path.exists(pickle_file):
+        return []
+    try:
+        with open(pickle_file, "rb") as f:
+            loaded_data = pickle.load(f)
+    except Exception as e:
+        print(f"Ошибка чтения {pickle_file}: {e}")
+        return []
+
+    open_maps = []
+    if isinstance(loaded_data, list):
+        for item in loaded_data:
+            if isinstance(item, dict) and "id" in item and "name" in item:
+                open_maps.append(item)
+            elif isinstance(item, str):
+                open_maps.append({"id": item, "name": item})
+    return open_maps
+
+
+class StartupTimer:
+    """Отметки времени от запуска процесса до первой отрисованной карты"""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.marks = {}
+        self.reported = False
+
+    def mark(self, name):
+        """Запоминает первое наступление события name (мс от старта)"""
+        if name not in self.marks:
+            self.marks[name] = (time.perf_counter() - self.t0) * 1000
+        return self.marks[name]
+
+    def summary(self):
+        return ", ".join(f"{name} {ms:.0f} мс" for name, ms in self.marks.items())
+
+    def finish(self, name):
+        """Последняя отметка: печатает сводку один раз и возвращает её"""
+        if self.reported:
+            return None
+        self.mark(name)
+        self.reported = True
+        report = self.summary()
+        print(f"Старт: {report}")
+        return report
+
+
+class MapPrefetch:
+    """Запросы списка карт и открытых карт, отправленные ещё из окна входа.
+
+    start() вызывается при каждом server_ready (ответ на hello), пока открыто окно входа:
+    запросы идут по тому же соединению, что и авторизация, и к моменту
+    создания MainWindow ответы обычно уже получены. MainWindow забирает
+    их через take_map()/take_map_list(); устаревшие и неудачные ответы
+    не отдаются — тогда окно запрашивает данные как обычно.
+    """
+
+    def __init__(self, client, timer=None, cache=None):
+        self.client = client
+        self.timer = timer
+        # Кеш карт: запрос несёт известную версию, и неизменённая карта не скачивается
+        self.cache = cache
+        self.map_list = None
+        self.maps = {}  # map_id -> RequestFuture
+        self.stats = {"sent": 0, "used": 0, "stale": 0}
+
+    def start(self):
+        if not self.client.is_negotiated():
+            return
+        if self.timer:
+            self.timer.mark("предзагрузка")
+        if not self._usable(self.map_list):
+            self.map_list = self._send("list_maps")
+        for map_info in read_open_maps():
+            map_id = map_info["id"]
+            if not self._usable(self.maps.get(map_id)):
+                path = f"maps/map_{map_id}.json"
+                params = self.cache.request_params(path) if self.cache else {"path": path}
+                self.maps[map_id] = self._send("file_get", **params)
+
+    def take_map(self, map_id):
+        """RequestFuture с картой map_id или None, если её надо запросить заново"""
+        return self._take(self.maps.pop(map_id, None))
+
+    def take_map_list(self):
+        future, self.map_list = self.map_list, None
+        return self._take(future)
+
+    def cancel(self):
+        """Отменяет невостребованные запросы (например, если вход отменён)"""
+        for future in [self.map_list, *self.maps.values()]:
+            if future is not None and not future.done():
+                future.cancel()
+        self.map_list = None
+        self.maps.clear()
+
+    def _send(self, action, **kwargs):
+        self.stats["sent"] += 1
+        return self.client.stream_request(action, **kwargs)
+
+    def _usable(self, future):
+        if future is None or future.cancelled():
+            return False
+        if time.monotonic() - future.sent_at > PREFETCH_MAX_AGE:
+            return False
+        # Таймаут или обрыв — ответа от сервера не было, повторяем запрос
+        return not (future.done() and future.result().get("transport_error"))
+
+    def _take(self, future):
+        if future is None:
+            return None
+        if not self._usable(future):
+            self.stats["stale"] += 1
+            return None
+        self.stats["used"] += 1
+        return future
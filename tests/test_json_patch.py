@@ -0,0 +1,92 @@
+# tests/test_json_patch.py — make_patch / apply_patch: разница и её применение дают новый документ
+#
+# Запуск из корня репозитория:
+#   python -m unittest discover tests
+
+import copy
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_patch import apply_patch, make_patch  # noqa: E402
+
+
+def round_trip(old, new):
+    """Применяет make_patch(old, new) к копии old, как сервер к своей версии карты"""
+    ops = make_patch(old, new)
+    # Операции уходят на сервер в JSON
+    ops = json.loads(json.dumps(ops))
+    return apply_patch(copy.deepcopy(old), ops), ops
+
+
+class RoundTripTest(unittest.TestCase):
+    def assertRoundTrip(self, old, new):
+        result, ops = round_trip(old, new)
+        # json.dumps различает 1, 1.0 и true — сравнение == их бы не заметило
+        self.assertEqual(json.dumps(result, sort_keys=True), json.dumps(new, sort_keys=True))
+        return ops
+
+    def test_equal_documents(self):
+        doc = {"switches": [{"id": 1, "xy": {"x": 1.5, "y": 2}}], "name": "карта"}
+        self.assertEqual(make_patch(doc, copy.deepcopy(doc)), [])
+
+    def test_key_order_is_not_a_change(self):
+        self.assertEqual(make_patch({"a": 1, "b": 2}, {"b": 2, "a": 1}), [])
+
+    def test_int_to_bool(self):
+        ops = self.assertRoundTrip({"a": 1}, {"a": True})
+        self.assertEqual(ops, [{"op": "replace", "path": "/a", "value": True}])
+
+    def test_int_to_float(self):
+        ops = self.assertRoundTrip({"a": 1}, {"a": 1.0})
+        self.assertEqual(ops, [{"op": "replace", "path": "/a", "value": 1.0}])
+
+    def test_nested_type_change(self):
+        ops = self.assertRoundTrip({"switches": [{"id": 1, "pingok": True}]},
+                                   {"switches": [{"id": 1, "pingok": 1}]})
+        self.assertEqual(ops, [{"op": "replace", "path": "/switches/0/pingok", "value": 1}])
+        self.assertRoundTrip([1, [0]], [1, [False]])
+
+    def test_root_replace(self):
+        self.assertRoundTrip(1, True)
+        self.assertRoundTrip({"a": 1}, [1])
+
+    def test_dict_add_remove(self):
+        self.assertRoundTrip({"a": 1, "b": {"c": 2}}, {"b": {"c": 3, "d": None}, "e": []})
+
+    def test_list_grow_and_shrink(self):
+        self.assertRoundTrip([1, 2, 3], [1, 5, 3, 4, {"x": 1}])
+        self.assertRoundTrip([1, 2, 3, 4, 5], [1, 2])
+        self.assertRoundTrip([], [[1], [2]])
+
+    def test_escaped_keys(self):
+        ops = self.assertRoundTrip({"a/b": 1, "c~d": 2}, {"a/b": 2, "c~d": 2, "~/": 3})
+        self.assertIn({"op": "replace", "path": "/a~1b", "value": 2}, ops)
+        self.assertIn({"op": "add", "path": "/~0~1", "value": 3}, ops)
+
+    def test_patch_does_not_share_values_with_new(self):
+        new = {"a": {"b": [1]}}
+        ops = make_patch({}, new)
+        new["a"]["b"].append(2)
+        self.assertEqual(ops, [{"op": "add", "path": "/a", "value": {"b": [1]}}])
+
+
+class ApplyPatchErrorsTest(unittest.TestCase):
+    def test_missing_path(self):
+        with self.assertRaises(ValueError):
+            apply_patch({"a": 1}, [{"op": "replace", "path": "/b", "value": 2}])
+
+    def test_index_out_of_range(self):
+        with self.assertRaises(ValueError):
+            apply_patch([1], [{"op": "remove", "path": "/3"}])
+
+    def test_unknown_op(self):
+        with self.assertRaises(ValueError):
+            apply_patch({"a": 1}, [{"op": "move", "path": "/a"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# tests/test_magistral_geometry.py — точки магистралей: строка карты <-> список и обратно
+#
+# Запуск из корня репозитория:
+#   python -m unittest discover tests
+
+import copy
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_patch import make_patch  # noqa: E402
+from magistral_geometry import (NODES_TEXT, dump_magistrals, format_waypoints, load_magistrals,  # noqa: E402
+                                parse_waypoints, set_waypoints)
+
+
+def make_doc():
+    # Строки в разных форматах чисел: другие клиенты пишут их по-своему
+    return {
+        "map": {"name": "test"},
+        "switches": [{"id": "1"}],
+        "magistrals": [
+            {"id": "m1", "startid": "1", "endid": "2", "nodes": "[10;20][30.25; 40]"},
+            {"id": "m2", "startid": "2", "endid": "3", "nodes": "[-5.5;+7]"},
+            {"id": "m3", "startid": "3", "endid": "1", "nodes": ""},
+        ],
+    }
+
+
+class ParseTest(unittest.TestCase):
+    def test_parse_string(self):
+        self.assertEqual(parse_waypoints("[10;20][30.25; 40]"), [[10.0, 20.0], [30.25, 40.0]])
+        self.assertEqual(parse_waypoints("[-5.5;+7]"), [[-5.5, 7.0]])
+
+    def test_parse_empty_and_list(self):
+        self.assertEqual(parse_waypoints(""), [])
+        self.assertEqual(parse_waypoints(None), [])
+        self.assertEqual(parse_waypoints([[1, 2]]), [[1.0, 2.0]])
+
+    def test_format(self):
+        self.assertEqual(format_waypoints([[10, 20], [30.25, 40]]), "[10.0;20.0][30.2;40.0]")
+
+
+class LoadDumpTest(unittest.TestCase):
+    def test_load_parses_and_keeps_text(self):
+        doc = load_magistrals(make_doc())
+        first = doc["magistrals"][0]
+        self.assertEqual(first["nodes"], [[10.0, 20.0], [30.25, 40.0]])
+        self.assertEqual(first[NODES_TEXT], "[10;20][30.25; 40]")
+
+    def test_load_twice_is_noop(self):
+        doc = load_magistrals(make_doc())
+        again = load_magistrals(copy.deepcopy(doc))
+        self.assertEqual(again, doc)
+
+    def test_unedited_dump_is_original(self):
+        original = make_doc()
+        dumped = dump_magistrals(load_magistrals(make_doc()))
+        # Ни одного изменения: сохранение без правки магистралей не раздувает разницу
+        self.assertEqual(dumped, original)
+        self.assertEqual(make_patch(original, dumped), [])
+
+    def test_dump_does_not_touch_loaded_doc(self):
+        doc = load_magistrals(make_doc())
+        before = copy.deepcopy(doc)
+        dump_magistrals(doc)
+        self.assertEqual(doc, before)
+
+    def test_moving_a_node_keeps_waypoint_text(self):
+        # Сдвиг узла меняет концы магистрали, но не её промежуточные точки
+        doc = load_magistrals(make_doc())
+        doc["switches"][0]["xy"] = {"x": 1, "y": 2}
+        self.assertEqual(dump_magistrals(doc)["magistrals"][0]["nodes"], "[10;20][30.25; 40]")
+
+    def test_edited_waypoints_are_formatted(self):
+        original = make_doc()
+        doc = load_magistrals(make_doc())
+        set_waypoints(doc["magistrals"][0], [[11.0, 20.0], [30.25, 40.0]])
+        dumped = dump_magistrals(doc)
+        self.assertEqual(dumped["magistrals"][0]["nodes"], "[11.0;20.0][30.2;40.0]")
+        self.assertNotIn(NODES_TEXT, dumped["magistrals"][0])
+        # Остальные магистрали уходят прежними строками — разница только в правленой
+        self.assertEqual(make_patch(original, dumped),
+                         [{"op": "replace", "path": "/magistrals/0/nodes", "value": "[11.0;20.0][30.2;40.0]"}])
+
+    def test_map_without_magistrals(self):
+        doc = {"map": {}, "magistrals": []}
+        self.assertIs(dump_magistrals(load_magistrals(doc)), doc)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# tests/test_spatial_index.py — GridIndex: выборки по точке и рамке против полного перебора
+#
+# Запуск из корня репозитория:
+#   python -m unittest discover tests
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spatial_index import GridIndex  # noqa: E402
+
+
+def random_rect(rnd, size=60, span=2000):
+    x, y = rnd.uniform(-200, span), rnd.uniform(-200, span)
+    return (x, y, x + rnd.uniform(1, size), y + rnd.uniform(1, size))
+
+
+class GridIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.rnd = random.Random(7)
+        self.index = GridIndex(cell_size=64)
+        # Те же прямоугольники списком в порядке вставки — эталон для перебора
+        self.rects = {}
+        for key in range(400):
+            rect = random_rect(self.rnd)
+            self.index.insert(key, rect, f"node{key}")
+            self.rects[key] = rect
+
+    def brute_point(self, x, y):
+        return [(key, f"node{key}") for key, (x1, y1, x2, y2) in self.rects.items()
+                if x1 <= x <= x2 and y1 <= y <= y2]
+
+    def brute_rect(self, rect, contained=False):
+        qx1, qy1, qx2, qy2 = rect
+        found = []
+        for key, (x1, y1, x2, y2) in self.rects.items():
+            if contained:
+                hit = qx1 <= x1 and qy1 <= y1 and x2 <= qx2 and y2 <= qy2
+            else:
+                hit = x1 <= qx2 and qx1 <= x2 and y1 <= qy2 and qy1 <= y2
+            if hit:
+                found.append((key, f"node{key}"))
+        return found
+
+    def test_query_point_matches_brute_force(self):
+        for _ in range(500):
+            x, y = self.rnd.uniform(-250, 2100), self.rnd.uniform(-250, 2100)
+            self.assertEqual(self.index.query_point(x, y), self.brute_point(x, y))
+
+    def test_point_on_border_is_inside(self):
+        x1, y1, x2, y2 = self.rects[0]
+        for x, y in ((x1, y1), (x2, y2), (x1, y2)):
+            self.assertIn((0, "node0"), self.index.query_point(x, y))
+
+    def test_query_rect_matches_brute_force(self):
+        for size in (10, 300, 5000):
+            for _ in range(100):
+                rect = random_rect(self.rnd, size=size)
+                self.assertEqual(self.index.query_rect(rect), self.brute_rect(rect))
+                self.assertEqual(self.index.query_rect(rect, contained=True), self.brute_rect(rect, contained=True))
+
+    def test_move_keeps_insertion_order(self):
+        for key in range(0, 400, 3):
+            rect = random_rect(self.rnd)
+            self.index.move(key, rect)
+            self.rects[key] = rect
+        everything = (-1000, -1000, 5000, 5000)
+        self.assertEqual([key for key, _ in self.index.query_rect(everything)], list(range(400)))
+        self.assertEqual(self.index.query_rect(everything), self.brute_rect(everything))
+
+    def test_move_within_cell_updates_rect(self):
+        self.index.move(5, (1.0, 1.0, 2.0, 2.0))
+        self.index.move(5, (3.0, 3.0, 4.0, 4.0))
+        self.assertEqual(self.index.rect(5), (3.0, 3.0, 4.0, 4.0))
+        self.assertNotIn(5, [key for key, _ in self.index.query_point(1.5, 1.5)])
+        self.assertIn(5, [key for key, _ in self.index.query_point(3.5, 3.5)])
+
+    def test_remove_and_reinsert(self):
+        self.index.remove(10)
+        self.assertIsNone(self.index.rect(10))
+        self.assertEqual(len(self.index), 399)
+        x1, y1, _, _ = self.rects[10]
+        self.assertNotIn(10, [key for key, _ in self.index.query_point(x1, y1)])
+        # Повторная вставка — как новый узел, в конец порядка
+        self.index.insert(10, self.rects[10], "node10")
+        self.assertEqual(self.index.query_rect((-1000, -1000, 5000, 5000))[-1], (10, "node10"))
+
+    def test_move_unknown_key_is_ignored(self):
+        self.index.move("missing", (0, 0, 1, 1))
+        self.assertIsNone(self.index.rect("missing"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+# tests/test_traffic_log.py — запись трафика: учётные данные не попадают в файл
+#
+# Запуск из корня репозитория:
+#   python -m unittest discover tests
+
+import gzip
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from traffic_log import REDACTED, TrafficRecorder, read_traffic, redact_secrets  # noqa: E402
+from ws_protocol import CODECS  # noqa: E402
+
+
+class BinaryJsonCodec:
+    """Бинарный кодек для теста: JSON в bytes (msgpack/cbor могут быть не установлены)"""
+    name = "test-binary"
+    binary = True
+
+    def encode(self, obj):
+        return json.dumps(obj).encode("utf-8")
+
+    def decode(self, frame):
+        return json.loads(frame)
+
+
+LOGIN = {"action": "auth_login", "request_id": "1", "login": "admin", "password_hash": "abc123"}
+HELLO = {"action": "hello", "request_id": "2", "features": ["push"],
+         "resume": {"ticket": "secret-ticket", "subscriptions": {"map1": 5}}}
+REPLY = {"request_id": "2", "success": True, "session": {"ticket": "new-ticket"}, "password": "plain"}
+
+
+class RedactSecretsTest(unittest.TestCase):
+    def test_nested_fields(self):
+        msg = json.loads(json.dumps({"batch": [LOGIN, HELLO, REPLY]}))
+        self.assertTrue(redact_secrets(msg))
+        login, hello, reply = msg["batch"]
+        self.assertEqual(login["password_hash"], REDACTED)
+        self.assertEqual(login["login"], "admin")
+        self.assertEqual(hello["resume"]["ticket"], REDACTED)
+        self.assertEqual(hello["resume"]["subscriptions"], {"map1": 5})
+        self.assertEqual(reply["session"]["ticket"], REDACTED)
+        self.assertEqual(reply["password"], REDACTED)
+
+    def test_nothing_to_redact(self):
+        msg = {"action": "ping", "ip": "10.0.0.1", "password_hash": ""}
+        self.assertFalse(redact_secrets(msg))
+        self.assertEqual(msg["password_hash"], "")
+
+
+class RecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "session.rec")
+        self.recorder = TrafficRecorder(self.path)
+
+    def tearDown(self):
+        self.recorder.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def frames(self):
+        self.recorder.close()
+        _header, records = read_traffic(self.path)
+        return [frame for _t, direction, frame in records if direction != "meta"]
+
+    def raw_file(self):
+        self.recorder.close()
+        with gzip.open(self.path, "rb") as f:
+            return f.read()
+
+    def test_json_frames(self):
+        self.recorder.record("out", json.dumps(LOGIN))
+        self.recorder.record("out", json.dumps(HELLO))
+        self.recorder.record("in", json.dumps(REPLY))
+        login, hello, reply = [json.loads(frame) for frame in self.frames()]
+        self.assertEqual(login["password_hash"], REDACTED)
+        self.assertEqual(hello["resume"]["ticket"], REDACTED)
+        self.assertEqual(reply["session"]["ticket"], REDACTED)
+        raw = self.raw_file()
+        for secret in (b"abc123", b"secret-ticket", b"new-ticket", b"plain"):
+            self.assertNotIn(secret, raw)
+
+    def test_frame_without_secrets_is_kept(self):
+        frame = json.dumps({"action": "ping", "ip": "10.0.0.1"})
+        self.recorder.record("out", frame)
+        self.assertEqual(self.frames(), [frame])
+
+    def test_binary_frames(self):
+        codec = BinaryJsonCodec()
+        self.recorder.codec = codec
+        self.recorder.record("out", codec.encode(HELLO))
+        self.recorder.record("in", codec.encode({"request_id": "3", "success": True}))
+        hello, reply = self.frames()
+        self.assertIsInstance(hello, bytes)
+        self.assertEqual(codec.decode(hello)["resume"]["ticket"], REDACTED)
+        self.assertEqual(codec.decode(reply), {"request_id": "3", "success": True})
+
+    @unittest.skipUnless("msgpack" in CODECS, "msgpack не установлен")
+    def test_msgpack_frames(self):
+        self.recorder.meta(event="connected", uri="ws://test")
+        self.recorder.meta(codec="msgpack", features=["push"])
+        self.recorder.record("out", CODECS["msgpack"].encode(LOGIN))
+        (login,) = self.frames()
+        self.assertEqual(CODECS["msgpack"].decode(login)["password_hash"], REDACTED)
+
+    def test_undecodable_frame_with_secret_is_dropped(self):
+        self.recorder.record("in", b"\xff\x00password_hash\x01")
+        self.recorder.record("out", '{"password": "abc", truncated')
+        self.assertEqual(self.frames(), [REDACTED.encode(), REDACTED])
+
+    def test_reader_rejects_classes(self):
+        self.recorder.close()
+        with gzip.open(self.path, "ab") as f:
+            pickle.dump((0.0, "in", ValueError("x")), f)
+        _header, records = read_traffic(self.path)
+        # Запись с объектом класса не загружается — чтение останавливается на ней
+        self.assertEqual(records, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
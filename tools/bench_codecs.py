@@ -0,0 +1,89 @@
+# tools/bench_codecs.py — сравнение кодеков кадров (JSON / MessagePack / CBOR)
+#
+# Запуск из корня репозитория:
+#   python tools/bench_codecs.py                       # maps/*.json или синтетическая карта
+#   python tools/bench_codecs.py path/to/map_1.json ... --images BACKUP/images/*.jpg
+#
+# Для каждого файла карты меряется ответ file_get в том виде, в каком его шлёт сервер,
+# для картинок — ответ download_image (base64 в JSON против сырых bytes).
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ws_protocol import CODECS, pack_bytes  # noqa: E402
+from tools.synthetic_map import make_map  # noqa: E402
+
+
+def measure(codec, message, repeats):
+    """Возвращает (байт в кадре, медиана encode мс, медиана decode мс)"""
+    frame = codec.encode(message)
+    size = len(frame.encode()) if isinstance(frame, str) else len(frame)
+    encode_ms, decode_ms = [], []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        frame = codec.encode(message)
+        t1 = time.perf_counter()
+        codec.decode(frame)
+        t2 = time.perf_counter()
+        encode_ms.append((t1 - t0) * 1000)
+        decode_ms.append((t2 - t1) * 1000)
+    return size, statistics.median(encode_ms), statistics.median(decode_ms)
+
+
+def print_row(label, codec, size, enc, dec, base_size):
+    ratio = size / base_size * 100 if base_size else 100
+    print(f"  {label:<28} {codec:<8} {size:>12,} B {ratio:6.1f}%  enc {enc:8.2f} мс  dec {dec:8.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение кодеков WebSocket-кадров")
+    parser.add_argument("maps", nargs="*", help="файлы карт (по умолчанию maps/*.json)")
+    parser.add_argument("--images", nargs="*", default=None, help="картинки для download_image (по умолчанию BACKUP/images/*)")
+    parser.add_argument("--synthetic", type=int, default=3000, help="число свитчей синтетической карты, если файлов нет")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"Доступные кодеки: {', '.join(CODECS)}")
+    missing = [name for name in ("msgpack", "cbor") if name not in CODECS]
+    if missing:
+        print(f"Не установлены: {', '.join(missing)} (pip install msgpack cbor2)")
+
+    map_files = args.maps or sorted(glob.glob("maps/*.json"))
+    samples = []
+    for path in map_files:
+        with open(path, "r", encoding="utf-8") as f:
+            samples.append((os.path.basename(path), json.load(f)))
+    if not samples:
+        samples.append((f"synthetic {args.synthetic} sw", make_map(switches=args.synthetic)))
+
+    print("\nfile_get (карты):")
+    for label, map_doc in samples:
+        message = {"request_id": "00000000-0000-0000-0000-000000000000", "success": True, "data": map_doc}
+        base = measure(CODECS["json"], message, 1)[0]
+        for name, codec in CODECS.items():
+            size, enc, dec = measure(codec, message, args.repeats)
+            print_row(label, name, size, enc, dec, base)
+
+    image_files = args.images if args.images is not None else sorted(glob.glob("BACKUP/images/*"))
+    if image_files:
+        print("\ndownload_image (картинки):")
+        for path in image_files:
+            with open(path, "rb") as f:
+                raw = f.read()
+            json_message = {"request_id": "0" * 36, "success": True, "image": pack_bytes(raw, CODECS["json"])}
+            base = measure(CODECS["json"], json_message, 1)[0]
+            for name, codec in CODECS.items():
+                message = {"request_id": "0" * 36, "success": True, "image": pack_bytes(raw, codec)}
+                size, enc, dec = measure(codec, message, args.repeats)
+                print_row(os.path.basename(path), name, size, enc, dec, base)
+
+
+if __name__ == "__main__":
+    main()
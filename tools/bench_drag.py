@@ -0,0 +1,131 @@
+# tools/bench_drag.py — перетаскивание узла: перерисовка всех магистралей против магистралей узла
+#
+# Запуск из корня репозитория:
+#   python tools/bench_drag.py                      # карты на 1k, 3k и 10k свитчей
+#   python tools/bench_drag.py --sizes 10000 --moves 2000
+#
+# Без Qt: меряется то, что MapCanvas делает на событие мыши до вызовов сцены, — выбор
+# магистралей и расчёт их вершин; число сегментов и подписей показывает, сколько
+# элементов сцены пришлось бы пересоздать (прежний update_magistrals) или сдвинуть
+# (update_links_for_nodes). Последняя строка — то же с точками, разобранными при
+# загрузке карты (load_magistrals), вместо разбора строки "[x;y]..." на каждое событие.
+
+import argparse
+import os
+import copy
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from magistral_geometry import load_magistrals, parse_waypoints  # noqa: E402
+from tools.synthetic_map import make_map  # noqa: E402
+
+NODE_LISTS = (("switches", "switch"), ("plan_switches", "plan_switch"), ("users", "user"),
+              ("soaps", "soap"), ("legends", "legend"))
+
+
+def nodes_by_id(map_doc):
+    found = {}
+    for list_key, ntype in NODE_LISTS:
+        for node in map_doc[list_key]:
+            found[node["id"]] = node
+    return found
+
+
+def link_points(link, nodes):
+    start, end = nodes.get(link["startid"]), nodes.get(link["endid"])
+    if not start or not end:
+        return None
+    # Строка — разбор на каждый вызов, как было в canvas; список — уже разобрано при загрузке
+    waypoints = link["nodes"] if isinstance(link["nodes"], list) else parse_waypoints(link["nodes"])
+    return [(start["xy"]["x"], start["xy"]["y"])] + waypoints + [(end["xy"]["x"], end["xy"]["y"])]
+
+
+def redraw_all(map_doc, node_id):
+    """Как прежний update_magistrals: индекс узлов и вершины каждой магистрали на каждое событие"""
+    nodes = nodes_by_id(map_doc)
+    items = 0
+    for link in map_doc["magistrals"]:
+        points = link_points(link, nodes)
+        if points:
+            items += len(points) - 1 + 4  # сегменты + две подписи (рамка и текст)
+    return items
+
+
+def redraw_adjacent(links_by_node, nodes, node_id):
+    items = 0
+    for link in links_by_node.get(node_id, ()):
+        points = link_points(link, nodes)
+        if points:
+            items += len(points) - 1 + 4
+    return items
+
+
+def timed(func, args_list):
+    """(медиана мкс на вызов, медиана результата)"""
+    samples, results = [], []
+    for args in args_list:
+        t0 = time.perf_counter()
+        results.append(func(*args))
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return statistics.median(samples), statistics.median(results)
+
+
+def bench(switches, moves, seed):
+    map_doc = make_map(switches=switches, seed=seed)
+    rnd = random.Random(seed)
+
+    def index(doc):
+        links_by_node = {}
+        for link in doc["magistrals"]:
+            links_by_node.setdefault(link["startid"], []).append(link)
+            if link["endid"] != link["startid"]:
+                links_by_node.setdefault(link["endid"], []).append(link)
+        return links_by_node
+
+    t0 = time.perf_counter()
+    nodes = nodes_by_id(map_doc)
+    links_by_node = index(map_doc)
+    index_ms = (time.perf_counter() - t0) * 1000
+
+    # Та же карта с точками магистралей списками; узлы общие, поэтому сдвиги видны обеим
+    loaded = {**map_doc, "magistrals": copy.deepcopy(map_doc["magistrals"])}
+    t0 = time.perf_counter()
+    load_magistrals(loaded)
+    load_ms = (time.perf_counter() - t0) * 1000
+    loaded_links = index(loaded)
+
+    # Каждое событие мыши сдвигает перетаскиваемый свитч на несколько пикселей
+    events = []
+    for _ in range(moves):
+        node = rnd.choice(map_doc["switches"])
+        node["xy"]["x"] += rnd.uniform(-8, 8)
+        node["xy"]["y"] += rnd.uniform(-8, 8)
+        events.append((node["id"],))
+
+    all_us, all_items = timed(lambda node_id: redraw_all(map_doc, node_id), events)
+    adj_us, adj_items = timed(lambda node_id: redraw_adjacent(links_by_node, nodes, node_id), events)
+    parsed_us, _ = timed(lambda node_id: redraw_adjacent(loaded_links, nodes, node_id), events)
+
+    print(f"{switches:>6} свитчей, {len(map_doc['magistrals']):>6} магистралей; индекс связей за {index_ms:.1f} мс")
+    print(f"  все магистрали:   {all_us:9.1f} мкс на событие, элементов сцены {all_items:8.0f}")
+    print(f"  магистрали узла:  {adj_us:9.1f} мкс на событие, элементов сцены {adj_items:8.0f} "
+          f"(x{all_us / max(adj_us, 1e-9):.0f})")
+    print(f"  точки разобраны:  {parsed_us:9.1f} мкс на событие; разбор карты при загрузке {load_ms:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перетаскивание узла: все магистрали против магистралей узла")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 3000, 10000], help="число свитчей")
+    parser.add_argument("--moves", type=int, default=300, help="событий мыши на размер")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    for switches in args.sizes:
+        bench(switches, args.moves, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# tools/bench_spatial.py — поиск узла под курсором и выделение рамкой: перебор против GridIndex
+#
+# Запуск из корня репозитория:
+#   python tools/bench_spatial.py                      # карты на 1k, 3k и 10k свитчей
+#   python tools/bench_spatial.py --sizes 10000 --queries 5000
+#
+# Прямоугольники узлов считаются так же, как MapCanvas.get_node_rect (иконка 60×60 /
+# 50×50 по центру xy, легенда — от xy на width×height), но без Qt: меряется сам поиск.
+
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spatial_index import GridIndex  # noqa: E402
+from tools.synthetic_map import make_map  # noqa: E402
+
+ICON_SIZES = {"switch": (60, 60), "plan_switch": (60, 60), "user": (50, 50), "soap": (50, 50)}
+NODE_LISTS = (("switches", "switch"), ("plan_switches", "plan_switch"), ("users", "user"),
+              ("soaps", "soap"), ("legends", "legend"))
+
+
+def node_rect(node, ntype):
+    x, y = node["xy"]["x"], node["xy"]["y"]
+    if ntype == "legend":
+        return x, y, x + float(node.get("width", 100)), y + float(node.get("height", 50))
+    w, h = ICON_SIZES[ntype]
+    return x - w / 2, y - h / 2, x + w / 2, y + h / 2
+
+
+def linear_point(map_doc, px, py):
+    """Как прежний find_node_by_position: перебор всех узлов с hypot для каждого попадания"""
+    closest, min_dist = None, float("inf")
+    for list_key, ntype in NODE_LISTS:
+        for node in map_doc[list_key]:
+            x1, y1, x2, y2 = node_rect(node, ntype)
+            if x1 <= px <= x2 and y1 <= py <= y2:
+                dist = math.hypot(px - node["xy"]["x"], py - node["xy"]["y"])
+                if dist < min_dist:
+                    closest, min_dist = (node["id"], ntype), dist
+    return closest
+
+
+def index_point(index, px, py):
+    closest, min_dist = None, float("inf")
+    for key, (node, _ntype) in index.query_point(px, py):
+        dist = math.hypot(px - node["xy"]["x"], py - node["xy"]["y"])
+        if dist < min_dist:
+            closest, min_dist = key, dist
+    return closest
+
+
+def linear_rect(map_doc, rect):
+    qx1, qy1, qx2, qy2 = rect
+    found = []
+    for list_key, ntype in NODE_LISTS:
+        for node in map_doc[list_key]:
+            x1, y1, x2, y2 = node_rect(node, ntype)
+            if qx1 <= x1 and qy1 <= y1 and x2 <= qx2 and y2 <= qy2:
+                found.append((node["id"], ntype))
+    return found
+
+
+def timed(func, args_list):
+    """(медиана мкс на вызов, результаты)"""
+    samples, results = [], []
+    for args in args_list:
+        t0 = time.perf_counter()
+        results.append(func(*args))
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return statistics.median(samples), results
+
+
+def bench(switches, queries, seed):
+    map_doc = make_map(switches=switches, seed=seed)
+    side = float(map_doc["map"]["width"])
+    rnd = random.Random(seed)
+
+    t0 = time.perf_counter()
+    index = GridIndex()
+    for list_key, ntype in NODE_LISTS:
+        for node in map_doc[list_key]:
+            index.insert((node["id"], ntype), node_rect(node, ntype), (node, ntype))
+    build_ms = (time.perf_counter() - t0) * 1000
+    nodes = len(index)
+
+    points = [(rnd.uniform(0, side), rnd.uniform(0, side)) for _ in range(queries)]
+    linear_us, linear_hits = timed(lambda x, y: linear_point(map_doc, x, y), points)
+    index_us, index_hits = timed(lambda x, y: index_point(index, x, y), points)
+    assert linear_hits == index_hits, "результаты поиска по точке расходятся"
+
+    # Рамка выделения: растёт, как при протягивании мышью, до ~1/16 площади карты
+    start = (rnd.uniform(0, side / 2), rnd.uniform(0, side / 2))
+    rects = [(start[0], start[1], start[0] + side / 4 * k / 50, start[1] + side / 4 * k / 50) for k in range(1, 51)]
+    linear_rect_us, linear_sel = timed(lambda r: linear_rect(map_doc, r), [(r,) for r in rects])
+    index_rect_us, index_sel = timed(lambda r: [key for key, _ in index.query_rect(r, contained=True)],
+                                     [(r,) for r in rects])
+    assert linear_sel == index_sel, "результаты выделения рамкой расходятся"
+
+    # Перетаскивание: узел сдвигается на несколько пикселей за событие мыши
+    moves = []
+    for _ in range(queries):
+        node = rnd.choice(map_doc["switches"])
+        node["xy"]["x"] += rnd.uniform(-8, 8)
+        node["xy"]["y"] += rnd.uniform(-8, 8)
+        moves.append(((node["id"], "switch"), node_rect(node, "switch")))
+    move_us, _ = timed(index.move, moves)
+
+    print(f"{switches:>6} свитчей, {nodes:>6} узлов; индекс строится за {build_ms:.1f} мс")
+    print(f"  узел под курсором: перебор {linear_us:9.1f} мкс, индекс {index_us:7.1f} мкс "
+          f"(x{linear_us / max(index_us, 1e-9):.0f})")
+    print(f"  выделение рамкой:  перебор {linear_rect_us:9.1f} мкс, индекс {index_rect_us:7.1f} мкс "
+          f"(x{linear_rect_us / max(index_rect_us, 1e-9):.0f})")
+    print(f"  сдвиг узла в индексе: {move_us:.2f} мкс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск узлов карты: перебор против сеточного индекса")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 3000, 10000], help="число свитчей")
+    parser.add_argument("--queries", type=int, default=2000, help="запросов точки и сдвигов на размер")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    for switches in args.sizes:
+        bench(switches, args.queries, args.seed)
+
+
+if __name__ == "__main__":
+    main()
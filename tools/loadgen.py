@@ -0,0 +1,315 @@
+# tools/loadgen.py — нагрузочный генератор: N консолей операторов против одного сервера
+#
+# Запуск из корня репозитория:
+#   python tools/loadgen.py --uri ws://127.0.0.1:8081 --consoles 30 --duration 120
+#   python tools/loadgen.py --consoles 50 --speed 10 --login admin --password secret
+#
+# Каждая консоль — отдельное соединение с тем же hello, кодеком и форматом запросов,
+# что и у WebSocketClient. Консоль открывает карту и дальше, как оператор, периодически
+# опрашивает check_ping_updates, открывает карты, сохраняет карту после перетаскивания
+# (file_put) и перечитывает таблицу неисправностей (csv_read). Периоды рабочие;
+# --speed сжимает их во столько же раз.
+#
+# Сохранения по умолчанию идут в loadgen/console_<N>.json, а не поверх рабочих карт;
+# --real-saves пишет в maps/map_<id>.json, как настоящий клиент.
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ws_protocol import CHUNK_SIZE, CODECS, JSON_CODEC, decode_frame, get_codec, iter_chunks  # noqa: E402
+from tools.synthetic_map import make_map  # noqa: E402
+
+# Возможности, которые объявляет консоль: потоковая передача и push здесь не нужны
+LOADGEN_FEATURES = ("chunked", "batch")
+
+HELLO_TIMEOUT = 3
+REQUEST_TIMEOUT = 30
+
+
+class Stats:
+    """Задержки и ошибки по действиям за время прогона"""
+
+    def __init__(self):
+        self.latencies = {}  # action -> [мс]
+        self.errors = {}     # action -> число ответов success=False
+        self.timeouts = {}   # action -> число запросов без ответа
+        self.started = time.monotonic()
+        self.finished = None
+
+    def record(self, action, ms, success):
+        self.latencies.setdefault(action, []).append(ms)
+        if not success:
+            self.errors[action] = self.errors.get(action, 0) + 1
+
+    def timeout(self, action):
+        self.timeouts[action] = self.timeouts.get(action, 0) + 1
+
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def rows(self):
+        elapsed = max(self.elapsed(), 1e-9)
+        for action in sorted(set(self.latencies) | set(self.timeouts)):
+            values = sorted(self.latencies.get(action, []))
+            yield {
+                "action": action,
+                "count": len(values),
+                "rps": len(values) / elapsed,
+                "errors": self.errors.get(action, 0),
+                "timeouts": self.timeouts.get(action, 0),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": values[-1] if values else None,
+            }
+
+    def report(self):
+        lines = [
+            f"{'действие':<20} {'ответов':>8} {'в с':>8} {'ошибок':>7} {'таймаут':>8}"
+            f" {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9} {'max мс':>9}"
+        ]
+        total = 0
+        for row in self.rows():
+            total += row["count"]
+            cells = "".join(f" {row[k]:9.1f}" if row[k] is not None else f" {'—':>9}" for k in ("p50", "p95", "p99", "max"))
+            lines.append(
+                f"{row['action']:<20} {row['count']:>8} {row['rps']:>8.1f} {row['errors']:>7} {row['timeouts']:>8}{cells}"
+            )
+        lines.append(f"Всего ответов: {total} за {self.elapsed():.1f} с ({total / max(self.elapsed(), 1e-9):.1f} в с)")
+        return "\n".join(lines)
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу; values отсортирован"""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+class Console:
+    """Одна консоль оператора: соединение, ожидающие ответы и сценарий работы"""
+
+    def __init__(self, number, args, stats, maps):
+        self.number = number
+        self.args = args
+        self.stats = stats
+        self.maps = maps  # список map_id, общий для всех консолей
+        self.random = random.Random(args.seed * 1000 + number)
+        self.ws = None
+        self.codec = JSON_CODEC
+        self.features = set()
+        self.pending = {}  # request_id -> asyncio.Future
+        self.map_id = None
+        self.map_doc = None
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.args.uri, max_size=None)
+        asyncio.create_task(self._read())
+        hello_id = str(uuid.uuid4())
+        future = self.pending[hello_id] = asyncio.get_running_loop().create_future()
+        await self.ws.send(JSON_CODEC.encode({
+            "action": "hello",
+            "request_id": hello_id,
+            "features": list(LOADGEN_FEATURES),
+            "codecs": list(CODECS),
+        }))
+        try:
+            hello = await asyncio.wait_for(future, HELLO_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Сервер без hello: остаёмся на JSON без дополнительных возможностей
+            self.pending.pop(hello_id, None)
+            return
+        if hello.get("success"):
+            self.features = set(hello.get("features", []))
+            self.codec = get_codec(hello.get("codec", "json"))
+
+    async def _read(self):
+        try:
+            async for frame in self.ws:
+                try:
+                    data = decode_frame(frame, self.codec)
+                except Exception as e:
+                    print(f"[{self.number}] Некорректный кадр: {e}")
+                    continue
+                future = self.pending.pop(data.get("request_id"), None)
+                if future is not None and not future.done():
+                    future.set_result(data)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("соединение закрыто"))
+            self.pending.clear()
+
+    async def request(self, action, **kwargs):
+        """Отправляет запрос и ждёт ответ; задержка попадает в статистику. None — ответа нет"""
+        request_id = str(uuid.uuid4())
+        future = self.pending[request_id] = asyncio.get_running_loop().create_future()
+        frame = self.codec.encode({"action": action, "request_id": request_id, **kwargs})
+        t0 = time.perf_counter()
+        if "chunked" in self.features and len(frame) > CHUNK_SIZE:
+            for chunk in iter_chunks(frame, self.codec, CHUNK_SIZE):
+                await self.ws.send(chunk)
+        else:
+            await self.ws.send(frame)
+        try:
+            data = await asyncio.wait_for(future, REQUEST_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            self.pending.pop(request_id, None)
+            self.stats.timeout(action)
+            return None
+        self.stats.record(action, (time.perf_counter() - t0) * 1000, bool(data.get("success")))
+        return data
+
+    # === СЦЕНАРИЙ ===
+    async def login(self):
+        if not self.args.login:
+            return True
+        password_hash = hashlib.sha256(self.args.password.encode()).hexdigest()
+        data = await self.request("auth_login", login=self.args.login, password_hash=password_hash)
+        return bool(data and data.get("success"))
+
+    async def open_map(self):
+        if self.maps:
+            map_id = self.random.choice(self.maps)
+            data = await self.request("file_get", path=f"maps/map_{map_id}.json")
+            if data and data.get("success"):
+                self.map_id, self.map_doc = map_id, data.get("data") or {}
+                return
+        if self.map_doc is None:
+            # На сервере нет карт — работаем с синтетической, сохранённой в свой файл
+            self.map_id = None
+            self.map_doc = make_map(f"loadgen-{self.number}", self.args.synthetic, seed=self.number)
+
+    def save_path(self):
+        if self.args.real_saves and self.map_id is not None:
+            return f"maps/map_{self.map_id}.json"
+        return f"loadgen/console_{self.number}.json"
+
+    async def check_ping(self):
+        switches = self.map_doc.get("switches", [])
+        hashes = {str(i): str(s.get("pingok", False)).lower() for i, s in enumerate(switches)}
+        data = await self.request("check_ping_updates", map_id=self.map_id or "", hashes=hashes)
+        for update in (data or {}).get("updates", []):
+            index = update.get("index")
+            if isinstance(index, int) and 0 <= index < len(switches):
+                switches[index]["pingok"] = update.get("pingok")
+
+    async def save_after_drag(self):
+        # Оператор сдвинул свитч — клиент отправляет карту целиком
+        switches = self.map_doc.get("switches", [])
+        if switches:
+            xy = self.random.choice(switches).setdefault("xy", {"x": 0, "y": 0})
+            xy["x"] = round(float(xy.get("x", 0)) + self.random.uniform(-20, 20), 1)
+            xy["y"] = round(float(xy.get("y", 0)) + self.random.uniform(-20, 20), 1)
+        await self.request("file_put", path=self.save_path(), data=self.map_doc)
+
+    async def reload_issues(self):
+        await self.request("csv_read", path="globals/issues.csv")
+
+    async def every(self, period, action, deadline):
+        """Повторяет action со случайным сдвигом ±25%, первый раз — в случайный момент периода"""
+        delay = self.random.uniform(0, period)
+        while time.monotonic() + delay < deadline:
+            await asyncio.sleep(delay)
+            await action()
+            delay = period * self.random.uniform(0.75, 1.25)
+
+    async def run(self, deadline):
+        try:
+            await self.connect()
+            if not await self.login():
+                print(f"[{self.number}] Вход не выполнен")
+                return
+            await self.request("list_maps")
+            await self.open_map()
+            speed = self.args.speed
+            await asyncio.gather(
+                self.every(self.args.ping_period / speed, self.check_ping, deadline),
+                self.every(self.args.open_period / speed, self.open_map, deadline),
+                self.every(self.args.save_period / speed, self.save_after_drag, deadline),
+                self.every(self.args.issues_period / speed, self.reload_issues, deadline),
+            )
+        except (OSError, websockets.WebSocketException) as e:
+            print(f"[{self.number}] Ошибка соединения: {e}")
+        finally:
+            if self.ws is not None:
+                await self.ws.close()
+
+
+async def fetch_maps(args):
+    """Список map_id на сервере (одним служебным соединением, в статистику не входит)"""
+    console = Console(0, args, Stats(), [])
+    try:
+        await console.connect()
+        if not await console.login():
+            return []
+        data = await console.request("list_maps") or {}
+        files = data.get("files", [])
+        return [f.replace(".json", "").replace("map_", "") for f in files if f.startswith("map_")]
+    finally:
+        if console.ws is not None:
+            await console.ws.close()
+
+
+async def run(args):
+    maps = await fetch_maps(args)
+    print(f"Сервер {args.uri}: карт {len(maps)}, консолей {args.consoles}, {args.duration:.0f} с, ускорение x{args.speed:g}")
+    stats = Stats()
+    deadline = time.monotonic() + args.duration
+    consoles = [Console(n, args, stats, maps) for n in range(1, args.consoles + 1)]
+    tasks = []
+    for console in consoles:
+        tasks.append(asyncio.create_task(console.run(deadline)))
+        # Консоли подключаются не разом, а в течение --ramp секунд
+        await asyncio.sleep(args.ramp / max(1, args.consoles))
+    await asyncio.gather(*tasks)
+    stats.finished = time.monotonic()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный генератор для WebSocket-протокола PingerApp")
+    parser.add_argument("--uri", default="ws://127.0.0.1:8081")
+    parser.add_argument("--consoles", type=int, default=10, help="число одновременных консолей")
+    parser.add_argument("--duration", type=float, default=60, help="длительность прогона, с")
+    parser.add_argument("--ramp", type=float, default=5, help="за сколько секунд подключить все консоли")
+    parser.add_argument("--speed", type=float, default=1, help="во сколько раз сжать рабочие периоды")
+    parser.add_argument("--ping-period", type=float, default=12, help="период check_ping_updates, с")
+    parser.add_argument("--open-period", type=float, default=90, help="период открытия карты, с")
+    parser.add_argument("--save-period", type=float, default=20, help="период сохранения после перетаскивания, с")
+    parser.add_argument("--issues-period", type=float, default=45, help="период перечитывания неисправностей, с")
+    parser.add_argument("--synthetic", type=int, default=500, help="свитчей в синтетической карте, если на сервере карт нет")
+    parser.add_argument("--real-saves", action="store_true", help="сохранять поверх maps/map_<id>.json, как клиент")
+    parser.add_argument("--login", default=None)
+    parser.add_argument("--password", default="")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", default=None, help="записать результаты в JSON-файл")
+    args = parser.parse_args()
+
+    try:
+        stats = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        return
+    print(stats.report())
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"uri": args.uri, "consoles": args.consoles, "elapsed": stats.elapsed(),
+                       "actions": list(stats.rows())}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+# tools/replay.py — воспроизведение записи трафика (PINGER_RECORD, см. traffic_log.py)
+#
+# Запуск из корня репозитория:
+#   python tools/replay.py session.rec --server ws://127.0.0.1:8081 --speed 4
+#   python tools/replay.py session.rec --client --speed 1
+#
+# --server: исходящие кадры записи отправляются серверу с теми же интервалами
+#   (--speed ускоряет, 0 — без пауз); сравниваются задержки ответов в записи и сейчас.
+# --client: входящие кадры записи подаются в MainWindow вместо сервера. Ответ
+#   сопоставляется с запросом по действию и порядковому номеру (n-й file_get записи —
+#   n-му file_get окна), так что окно получает тот же ввод. Меряется время обработки
+#   каждой пачки сообщений в GUI-потоке (диспетчеризация и отрисовка).
+#
+# Хеш пароля и билет сеанса в записи замаскированы (traffic_log.REDACTED): в режиме --server
+# auth_login уходит с хешем --password, а hello — без возобновления сеанса.
+
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from traffic_log import REDACTED, read_traffic  # noqa: E402
+from ws_protocol import CHUNK_SIZE, CODECS, JSON_CODEC, decode_frame, get_codec, iter_chunks, pack_bytes  # noqa: E402
+from tools.loadgen import percentile  # noqa: E402
+
+# Сколько ждать ответы после последнего кадра записи, с
+DRAIN_TIMEOUT = 30
+
+
+def pack_message(message, codec):
+    """bytes верхнего уровня — как есть для бинарного кодека, base64 для JSON"""
+    if codec.binary:
+        return message
+    return {k: pack_bytes(v, codec) if isinstance(v, (bytes, bytearray)) else v for k, v in message.items()}
+
+
+def request_ids(msg):
+    """[(action, request_id)] запроса, включая вложенные запросы пакета"""
+    if msg.get("action") in (None, "chunk", "stream_chunk") or not msg.get("request_id"):
+        return []
+    ids = [(msg["action"], msg["request_id"])]
+    for sub in msg.get("requests") or []:
+        if sub.get("request_id"):
+            ids.append((sub.get("action"), sub["request_id"]))
+    return ids
+
+
+def response_ids(msg):
+    """Все request_id, на которые ссылается входящее сообщение"""
+    ids = [msg.get("request_id")]
+    ids += [r.get("request_id") for r in msg.get("responses") or [] if isinstance(r, dict)]
+    if isinstance(msg.get("response"), dict):
+        ids.append(msg["response"].get("request_id"))
+    return [i for i in ids if i]
+
+
+def rewrite_ids(msg, mapping):
+    """Подставляет request_id по mapping во входящее сообщение (на месте)"""
+    for target in [msg, msg.get("response")] + list(msg.get("responses") or []):
+        if isinstance(target, dict) and target.get("request_id") in mapping:
+            target["request_id"] = mapping[target["request_id"]]
+    return msg
+
+
+class ChunkAssembler:
+    """Склейка исходящих кадров action=chunk в исходное сообщение"""
+
+    def __init__(self):
+        self.parts = {}
+
+    def feed(self, msg, codec):
+        if msg.get("action") != "chunk":
+            return msg
+        parts = self.parts.setdefault(msg["transfer_id"], {})
+        parts[msg["seq"]] = msg["data"]
+        if not msg.get("final"):
+            return None
+        data = [parts[seq] for seq in sorted(self.parts.pop(msg["transfer_id"]))]
+        return decode_frame("".join(data) if isinstance(data[0], str) else b"".join(data), codec)
+
+
+class RecordedSession:
+    """Запись, разобранная в сообщения: [(t, направление, сообщение)].
+
+    Кадры декодируются кодеком, который действовал в момент записи
+    (после meta с codec — согласованным, после переподключения — снова JSON).
+    Фрагменты action=chunk склеены в одно сообщение со временем последнего.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.header, records = read_traffic(path)
+        self.messages = []
+        self.disconnects = 0
+        codec = JSON_CODEC
+        assembler = ChunkAssembler()
+        for t, direction, frame in records:
+            if direction == "meta":
+                if frame.get("event") == "connected":
+                    codec = JSON_CODEC
+                elif frame.get("event") == "disconnected":
+                    self.disconnects += 1
+                elif "codec" in frame:
+                    codec = get_codec(frame["codec"])
+                    if frame["codec"] not in CODECS:
+                        print(f"Кодек записи {frame['codec']} не установлен — кадры будут нечитаемы")
+                continue
+            try:
+                msg = decode_frame(frame, codec)
+            except Exception as e:
+                print(f"Пропущен нечитаемый кадр ({direction}, {t:.3f} с): {e}")
+                continue
+            if direction == "out":
+                msg = assembler.feed(msg, codec)
+                if msg is None:
+                    continue
+            self.messages.append((t, direction, msg))
+
+    def outgoing(self):
+        return [(t, msg) for t, direction, msg in self.messages if direction == "out"]
+
+    def incoming(self):
+        return [(t, msg) for t, direction, msg in self.messages if direction == "in"]
+
+    def recorded_ids(self):
+        """action -> [request_id в порядке отправки]"""
+        ids = {}
+        for _t, msg in self.outgoing():
+            for action, request_id in request_ids(msg):
+                ids.setdefault(action, []).append(request_id)
+        return ids
+
+    def recorded_latencies(self):
+        """action -> [мс от отправки до ответа] по записи"""
+        sent, actions, latencies = {}, {}, {}
+        for t, direction, msg in self.messages:
+            if direction == "out":
+                for action, request_id in request_ids(msg):
+                    sent[request_id], actions[request_id] = t, action
+                continue
+            if msg.get("action") == "stream_chunk" and not msg.get("final"):
+                continue
+            for request_id in response_ids(msg):
+                if request_id in sent:
+                    latencies.setdefault(actions[request_id], []).append((t - sent.pop(request_id)) * 1000)
+        return latencies
+
+
+def wait_until(start, t, speed):
+    """Сколько спать до момента t записи при ускорении speed (0 — без пауз)"""
+    if not speed:
+        return 0
+    return max(0.0, start + t / speed - time.monotonic())
+
+
+def latency_table(title, columns):
+    """columns: [(заголовок, {action: [мс]})]"""
+    actions = sorted(set().union(*(c for _, c in columns)))
+    lines = [title, f"{'действие':<20}" + "".join(f" {name + ' n':>12} {'p50':>8} {'p95':>8} {'p99':>8}" for name, _ in columns)]
+    for action in actions:
+        row = f"{action:<20}"
+        for _name, values in columns:
+            v = sorted(values.get(action, []))
+            cells = [percentile(v, p) for p in (50, 95, 99)]
+            row += f" {len(v):>12}" + "".join(f" {c:8.1f}" if c is not None else f" {'—':>8}" for c in cells)
+        lines.append(row)
+    return "\n".join(lines)
+
+
+def restore_credentials(msg, password_hash):
+    """Сообщение записи с замаскированными учётными данными -> сообщение для живого сервера"""
+    if msg.get("action") == "auth_login" and msg.get("password_hash") == REDACTED:
+        if password_hash is None:
+            print("В записи auth_login без хеша пароля: задайте --password, иначе вход не пройдёт")
+        return {**msg, "password_hash": password_hash or ""}
+    if msg.get("action") == "hello" and isinstance(msg.get("resume"), dict) \
+            and msg["resume"].get("ticket") == REDACTED:
+        return {k: v for k, v in msg.items() if k != "resume"}
+    return msg
+
+
+# === ВОСПРОИЗВЕДЕНИЕ НА СЕРВЕР ===
+async def replay_to_server(session, uri, speed, password_hash=None):
+    live = {"codec": JSON_CODEC, "features": set()}
+    sent, actions, latencies = {}, {}, {}
+    hello_reply = asyncio.get_running_loop().create_future()
+
+    async def reader(ws):
+        async for frame in ws:
+            msg = decode_frame(frame, live["codec"])
+            if msg.get("action") == "stream_chunk" and not msg.get("final"):
+                continue
+            for request_id in response_ids(msg):
+                if request_id in sent:
+                    latencies.setdefault(actions[request_id], []).append((time.monotonic() - sent.pop(request_id)) * 1000)
+                    if actions[request_id] == "hello" and not hello_reply.done():
+                        hello_reply.set_result(msg)
+
+    async with websockets.connect(uri, max_size=None) as ws:
+        reading = asyncio.create_task(reader(ws))
+        start = time.monotonic()
+        for t, msg in session.outgoing():
+            await asyncio.sleep(wait_until(start, t, speed))
+            msg = restore_credentials(msg, password_hash)
+            codec = live["codec"]
+            frame = codec.encode(pack_message(msg, codec))
+            now = time.monotonic()
+            for action, request_id in request_ids(msg):
+                sent[request_id], actions[request_id] = now, action
+            if "chunked" in live["features"] and len(frame) > CHUNK_SIZE:
+                for chunk in iter_chunks(frame, codec, CHUNK_SIZE):
+                    await ws.send(chunk)
+            else:
+                await ws.send(frame)
+            if msg.get("action") == "hello":
+                # Следующие кадры кодируются тем, что выберет этот сервер
+                try:
+                    reply = await asyncio.wait_for(hello_reply, 3)
+                    live["codec"] = get_codec(reply.get("codec", "json"))
+                    live["features"] = set(reply.get("features", []))
+                except asyncio.TimeoutError:
+                    print("Сервер не ответил на hello — продолжаем в JSON")
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while sent and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        reading.cancel()
+        elapsed = time.monotonic() - start
+    if sent:
+        print(f"Без ответа: {len(sent)}")
+    return latencies, elapsed
+
+
+# === ВОСПРОИЗВЕДЕНИЕ В КЛИЕНТ ===
+def run_client(session, speed, user_login, quit_when_done):
+    from PyQt6.QtCore import pyqtSignal
+    from PyQt6.QtWidgets import QApplication
+    from ws_client import WebSocketClient
+
+    class ReplaySocket:
+        """Заменяет соединение: отдаёт входящие кадры записи и сопоставляет им запросы окна"""
+
+        latency = None
+
+        def __init__(self, client):
+            self.client = client
+            self.recorded = session.recorded_ids()
+            self.sent_count = {}        # action -> сколько таких запросов отправило окно
+            self.mapping = {}           # request_id записи -> request_id окна
+            self.live_actions = {}      # request_id окна -> action
+            self.deferred = {}          # request_id записи -> [сообщения], ждущие запроса окна
+            self.assembler = ChunkAssembler()
+            self.queue = asyncio.Queue()
+            self.producer = None
+
+        async def send(self, frame):
+            msg = self.assembler.feed(decode_frame(frame, self.client.codec), self.client.codec)
+            if msg is None:
+                return
+            for action, live_id in request_ids(msg):
+                n = self.sent_count.get(action, 0)
+                self.sent_count[action] = n + 1
+                self.live_actions[live_id] = action
+                recorded = self.recorded.get(action, [])
+                if n < len(recorded):
+                    self.mapping[recorded[n]] = live_id
+                    for waiting in self.deferred.pop(recorded[n], []):
+                        self.queue.put_nowait(waiting)
+
+        async def produce(self):
+            start = time.monotonic()
+            for t, msg in session.incoming():
+                await asyncio.sleep(wait_until(start, t, speed))
+                missing = [i for i in response_ids(msg) if i not in self.mapping]
+                if missing:
+                    # Окно ещё не отправило соответствующий запрос — отдадим, когда отправит
+                    self.deferred.setdefault(missing[0], []).append(msg)
+                else:
+                    self.queue.put_nowait(msg)
+            self.client.replay_finished.emit(time.monotonic() - start, sum(len(v) for v in self.deferred.values()))
+
+        def __aiter__(self):
+            return self._frames()
+
+        async def _frames(self):
+            self.producer = asyncio.create_task(self.produce())
+            while True:
+                msg = rewrite_ids(await self.queue.get(), self.mapping)
+                codec = self.client.codec
+                yield codec.encode(pack_message(msg, codec))
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            if self.producer is not None:
+                self.producer.cancel()
+
+    class ReplayClient(WebSocketClient):
+        """WebSocketClient, у которого соединение заменено записью.
+
+        Вся обработка (hello, кодек, потоковые ответы, очередь отправки)
+        остаётся настоящей; пачки сообщений передаются в GUI-поток отдельным
+        сигналом, чтобы замерить время их обработки окном.
+        """
+        replay_batch = pyqtSignal(list)
+        replay_finished = pyqtSignal(float, int)
+
+        def __init__(self):
+            super().__init__(uri="replay://" + os.path.basename(session.path))
+            self.socket = None
+            self.costs = {}  # состав пачки -> [мс обработки]
+            self.replay_batch.connect(self._dispatch_replayed)
+
+        def _connect(self):
+            self.socket = ReplaySocket(self)
+            return self.socket
+
+        def _flush_inbox(self):
+            self._flush_scheduled = False
+            batch, self._inbox = self._inbox, []
+            if batch:
+                self.replay_batch.emit(batch)
+
+        def _dispatch_replayed(self, batch):
+            pushes = [data for data in batch if data.get("action") == "push"]
+            rest = [data for data in batch if data.get("action") != "push"]
+            actions = {"push"} if pushes else set()
+            actions.update(self.socket.live_actions.get(data.get("request_id"), "?") for data in rest)
+            t0 = time.perf_counter()
+            if pushes:
+                self.push_received.emit(pushes)
+            if rest:
+                self.messages_received.emit(rest)
+            self.costs.setdefault("+".join(sorted(actions)), []).append((time.perf_counter() - t0) * 1000)
+
+    app = QApplication(sys.argv)
+    client = ReplayClient()
+
+    def on_finished(elapsed, unclaimed):
+        total = sum(sum(v) for v in client.costs.values())
+        print(f"Воспроизведение завершено за {elapsed:.1f} с; обработка в GUI-потоке {total:.0f} мс")
+        if unclaimed:
+            print(f"Ответов без соответствующего запроса окна: {unclaimed}")
+        print(latency_table("Обработка пачек в GUI-потоке, мс", [("пачек", client.costs)]))
+        if quit_when_done:
+            app.quit()
+
+    client.replay_finished.connect(on_finished)
+    client.start()
+
+    from pinger_app import MainWindow
+    window = MainWindow(user_login=user_login, ws_client=client)
+    window.show()
+    code = app.exec()
+    client.stop()
+    client.wait()
+    return code
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записи WebSocket-трафика PingerApp")
+    parser.add_argument("record", help="файл записи (PINGER_RECORD)")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--server", metavar="URI", help="отправить исходящие кадры записи на сервер")
+    mode.add_argument("--client", action="store_true", help="подать входящие кадры записи в MainWindow")
+    parser.add_argument("--speed", type=float, default=1, help="ускорение (1 — реальное время, 0 — без пауз)")
+    parser.add_argument("--login", default="replay", help="логин пользователя окна в режиме --client")
+    parser.add_argument("--exit", action="store_true", help="закрыть окно по окончании записи (--client)")
+    parser.add_argument("--password", help="пароль для auth_login в режиме --server (в записи он замаскирован)")
+    args = parser.parse_args()
+
+    session = RecordedSession(args.record)
+    print(f"Запись {args.record}: сообщений {len(session.messages)}, "
+          f"исходящих {len(session.outgoing())}, входящих {len(session.incoming())}, обрывов {session.disconnects}")
+
+    if args.server:
+        password_hash = hashlib.sha256(args.password.encode()).hexdigest() if args.password else None
+        latencies, elapsed = asyncio.run(replay_to_server(session, args.server, args.speed, password_hash))
+        print(f"Отправлено за {elapsed:.1f} с")
+        print(latency_table("Задержка ответа, мс", [("запись", session.recorded_latencies()), ("сейчас", latencies)]))
+        return 0
+    return run_client(session, args.speed, args.login, args.exit)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
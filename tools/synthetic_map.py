@@ -0,0 +1,76 @@
+# tools/synthetic_map.py — генератор карт для бенчмарков и нагрузочных тестов
+# Структура повторяет maps/map_<id>.json: switches / plan_switches / users / soaps / legends / magistrals
+
+import random
+from datetime import datetime
+
+
+def make_map(name="synthetic", switches=1000, seed=1):
+    """Возвращает документ карты с заданным числом управляемых свитчей.
+
+    Остальные объекты добавляются в пропорции, похожей на рабочие карты:
+    клиенты и мыльницы — примерно по десятой части от свитчей,
+    магистрали — на каждый свитч, кроме первого.
+    """
+    rnd = random.Random(seed)
+    side = max(1200, int((switches ** 0.5) * 120))
+    map_doc = {
+        "map": {
+            "name": name,
+            "width": str(side),
+            "height": str(side),
+            "mod_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "last_adm": "bench",
+        },
+        "switches": [],
+        "plan_switches": [],
+        "users": [],
+        "soaps": [],
+        "legends": [],
+        "magistrals": [],
+    }
+
+    def xy():
+        return {"x": round(rnd.uniform(40, side - 40), 1), "y": round(rnd.uniform(40, side - 40), 1)}
+
+    for i in range(1, switches + 1):
+        map_doc["switches"].append({
+            "id": str(i),
+            "name": f"sw-{i}",
+            "ip": f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+            "mac": f"00:11:22:{(i >> 16) & 255:02x}:{(i >> 8) & 255:02x}:{i & 255:02x}",
+            "model": rnd.choice(["DES-3200-10 rev C", "DES-3200-28 rev C"]),
+            "master": "Шепель А. В.",
+            "xy": xy(),
+            "pingok": rnd.random() > 0.05,
+            "notinstalled": "0",
+            "notsettings": "0",
+            "copyid": "none",
+            "ports": [
+                {"number": str(p), "description": f"user {i}-{p}", "color": "#FFC107", "bold": False}
+                for p in range(1, rnd.randint(2, 10))
+            ],
+        })
+
+    for key, count in (("users", switches // 10), ("soaps", switches // 10), ("plan_switches", switches // 20)):
+        for i in range(1, count + 1):
+            map_doc[key].append({"id": str(i), "name": f"{key[:-1]}-{i}", "xy": xy()})
+
+    for i in range(1, max(1, switches // 50) + 1):
+        map_doc["legends"].append({
+            "id": str(i), "name": f"Район {i}", "xy": xy(), "width": "200", "height": "120",
+            "textcolor": "#000", "textsize": "14", "textalign": "5",
+            "zalivka": "0", "zalivkacolor": "#fff", "bordercolor": "#000", "borderwidth": "2",
+        })
+
+    for i in range(2, switches + 1):
+        parent = rnd.randint(1, i - 1)
+        waypoints = "".join(f"[{rnd.uniform(0, side):.1f};{rnd.uniform(0, side):.1f}]" for _ in range(rnd.randint(0, 3)))
+        map_doc["magistrals"].append({
+            "id": str(i - 1), "startid": str(parent), "endid": str(i), "nodes": waypoints,
+            "color": "#000000", "width": "1", "style": "pssolid",
+            "startport": str(rnd.randint(1, 10)), "endport": str(rnd.randint(1, 10)),
+            "startportcolor": "#FFC107", "endportcolor": "#FFC107",
+        })
+
+    return map_doc
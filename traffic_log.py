@@ -0,0 +1,145 @@
+# traffic_log.py — запись WebSocket-трафика клиента в файл и чтение записи для воспроизведения
+#
+# Включается переменной окружения: PINGER_RECORD=session.rec python pinger_app.py
+# Файл — gzip с последовательностью pickle-записей (t, направление, кадр):
+#   t — секунды от начала записи, направление — "out" / "in" / "meta",
+#   кадр — как есть (str для JSON, bytes для бинарного кодека); у "meta" — словарь
+#   (подключение, отключение, согласованный кодек).
+# Первая запись — заголовок {"version", "started"}; адрес сервера — в meta при подключении.
+#
+# Учётные данные в файл не попадают: поля SECRET_FIELDS (хеш пароля auth_login, билет сеанса
+# в hello и ответах) заменяются на REDACTED ещё при записи — запись можно передавать другим.
+# Читается запись без произвольных классов pickle (read_traffic), но открывать стоит только
+# свои записи и записи коллег: файл из непроверенного источника — всё равно чужой ввод.
+
+import gzip
+import os
+import pickle
+import threading
+import time
+
+from ws_protocol import JSON_CODEC, decode_frame, get_codec
+
+RECORD_ENV = "PINGER_RECORD"
+TRAFFIC_VERSION = 1
+
+# Поля сообщений, значения которых не пишутся в запись (на любой глубине)
+SECRET_FIELDS = ("password", "password_hash", "ticket")
+REDACTED = "***"
+# Быстрая проверка кадра до разбора: без этих подстрок секретных полей в нём нет
+_SECRET_MARKERS = ("password", "ticket")
+
+# Как часто сбрасывать буфер на диск, с: при аварийном завершении теряется не больше
+FLUSH_INTERVAL = 1.0
+
+
+class TrafficRecorder:
+    """Пишет исходящие и входящие кадры с отметками времени.
+
+    record() вызывается из WS-потока; close() — из GUI-потока при выходе,
+    поэтому запись защищена блокировкой.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.t0 = time.monotonic()
+        self.frames = 0
+        self._lock = threading.Lock()
+        self._last_flush = self.t0
+        # Кодек кадров текущего соединения: нужен, чтобы разобрать кадр с секретными полями
+        self.codec = JSON_CODEC
+        self._file = gzip.open(path, "wb", compresslevel=5)
+        self._dump({"version": TRAFFIC_VERSION, "started": time.time()})
+        print(f"Запись трафика: {path}")
+
+    @classmethod
+    def from_env(cls):
+        """Рекордер, если задана PINGER_RECORD, иначе None"""
+        path = os.environ.get(RECORD_ENV)
+        return cls(path) if path else None
+
+    def record(self, direction, frame):
+        self._write((time.monotonic() - self.t0, direction, self._redact(frame)))
+
+    def meta(self, **info):
+        if info.get("event") == "connected":
+            self.codec = JSON_CODEC
+        elif "codec" in info:
+            self.codec = get_codec(info["codec"])
+        self._write((time.monotonic() - self.t0, "meta", info))
+
+    def _redact(self, frame):
+        """Кадр без значений SECRET_FIELDS; кадр без них возвращается как есть"""
+        if isinstance(frame, str):
+            if not any(marker in frame for marker in _SECRET_MARKERS):
+                return frame
+        elif not any(marker.encode() in frame for marker in _SECRET_MARKERS):
+            return frame
+        try:
+            msg = decode_frame(frame, self.codec)
+        except Exception:
+            # Не разобрать (фрагмент, чужой кодек) — кадр с возможным секретом не пишем
+            return REDACTED if isinstance(frame, str) else REDACTED.encode()
+        if not redact_secrets(msg):
+            return frame
+        return JSON_CODEC.encode(msg) if isinstance(frame, str) else self.codec.encode(msg)
+
+    def _write(self, item):
+        with self._lock:
+            if self._file is None:
+                return
+            self._dump(item)
+            self.frames += 1
+            now = time.monotonic()
+            if now - self._last_flush >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = now
+
+    def _dump(self, item):
+        pickle.dump(item, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            self._file = None
+        print(f"Запись трафика завершена: {self.frames} кадров, {self.path}")
+
+
+def redact_secrets(value):
+    """Заменяет значения SECRET_FIELDS на REDACTED (на месте); True — что-то заменено"""
+    changed = False
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in SECRET_FIELDS and item:
+                value[key] = REDACTED
+                changed = True
+            else:
+                changed = redact_secrets(item) or changed
+    elif isinstance(value, list):
+        for item in value:
+            changed = redact_secrets(item) or changed
+    return changed
+
+
+class _RecordUnpickler(pickle.Unpickler):
+    """Только встроенные значения (кортежи, словари, строки, bytes, числа): классы не загружаются,
+    поэтому подложенный файл не может выполнить код при чтении"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"В записи трафика недопустим объект {module}.{name}")
+
+
+def read_traffic(path):
+    """(заголовок, список записей (t, направление, кадр)); обрезанный хвост файла пропускается"""
+    records = []
+    with gzip.open(path, "rb") as f:
+        unpickler = _RecordUnpickler(f)
+        header = unpickler.load()
+        while True:
+            try:
+                records.append(unpickler.load())
+            except (EOFError, pickle.UnpicklingError, OSError):
+                break
+    return header, records
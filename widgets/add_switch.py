@@ -82,28 +82,13 @@ class AddSwitchDialog(QDialog):
             print("WebSocket клиент недоступен")
             return
         
-        # Счетчик ожидаемых ответов
-        self.pending_responses = 4
-        
-        # Загрузка моделей
-        request_id = self.ws_client.send_request("list_models")
-        if request_id:
-            self.parent_window.pending_requests[request_id] = self.on_models_loaded
-        
-        # Загрузка управляющих VLAN
-        request_id = self.ws_client.send_request("list_mngmt_vlan")
-        if request_id:
-            self.parent_window.pending_requests[request_id] = self.on_vlans_loaded
-        
-        # Загрузка мастеров
-        request_id = self.ws_client.send_request("list_masters")
-        if request_id:
-            self.parent_window.pending_requests[request_id] = self.on_masters_loaded
-        
-        # Загрузка прошивок
-        request_id = self.ws_client.send_request("list_firmwares")
-        if request_id:
-            self.parent_window.pending_requests[request_id] = self.on_firmwares_loaded
+        # Все четыре справочника — одним пакетом (один round trip вместо четырёх)
+        batch = self.ws_client.batch(owner=self)
+        batch.add("list_models", self.on_models_loaded)
+        batch.add("list_mngmt_vlan", self.on_vlans_loaded)
+        batch.add("list_masters", self.on_masters_loaded)
+        batch.add("list_firmwares", self.on_firmwares_loaded)
+        batch.send()
     
     def on_models_loaded(self, data):
         """Обработчик загрузки моделей"""
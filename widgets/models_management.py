@@ -3,7 +3,6 @@
 
 import os
 import json
-import base64
 import shutil
 
 from PyQt6.QtWidgets import (
@@ -14,6 +13,9 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtGui import QPixmap
 from PyQt6.QtCore import Qt
 
+from icon_cache import ICONS
+from ws_protocol import unpack_bytes
+
 class ModelsManagementDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -30,9 +32,13 @@ class ModelsManagementDialog(QDialog):
         # UI-инициализация
         self.init_ui()
 
-        # Загружаем сначала прошивки (они используются в форме), затем список моделей
-        self.load_firmware_options()
-        self.load_models()
+        # Загружаем сначала прошивки (они используются в форме), затем список моделей — одним пакетом
+        parent = self.parent()
+        batch = parent.ws_client.batch(owner=self) if parent and getattr(parent, "ws_connected", False) else None
+        self.load_firmware_options(batch)
+        self.load_models(batch)
+        if batch:
+            batch.send()
 
     def init_ui(self):
         main_layout = QVBoxLayout()
@@ -212,7 +218,7 @@ class ModelsManagementDialog(QDialog):
     # --------------------------------------------------------------------- #
     # Работа с сервера через WebSocket
     # --------------------------------------------------------------------- #
-    def load_firmware_options(self):
+    def load_firmware_options(self, batch=None):
         """Запрашивает список прошивок с сервера (data/lists/firmware.json)"""
         parent = self.parent()
         if not parent or not getattr(parent, "ws_connected", False):
@@ -220,8 +226,6 @@ class ModelsManagementDialog(QDialog):
                 parent.show_toast("Нет связи с сервером", "error")
             return
 
-        req = parent.ws_client.send_request("list_firmwares")
-
         def on_resp(data):
             if not data.get("success"):
                 parent.show_toast("Ошибка загрузки прошивок", "error")
@@ -234,9 +238,12 @@ class ModelsManagementDialog(QDialog):
                 if "model_name" in item:
                     self.firmware.addItem(item["model_name"])
 
-        parent.pending_requests[req] = on_resp
+        if batch is not None:
+            batch.add("list_firmwares", on_resp)
+        else:
+            parent.ws_client.request("list_firmwares", on_resp, owner=self)
 
-    def load_models(self):
+    def load_models(self, batch=None):
         """Запрашивает список моделей с сервера (data/models/models.json)"""
         parent = self.parent()
         if not parent or not getattr(parent, "ws_connected", False):
@@ -244,8 +251,6 @@ class ModelsManagementDialog(QDialog):
                 parent.show_toast("Нет связи с сервером", "error")
             return
 
-        req = parent.ws_client.send_request("list_models")
-
         def on_resp(data):
             if not data.get("success"):
                 parent.show_toast("Ошибка загрузки списка моделей", "error")
@@ -257,7 +262,10 @@ class ModelsManagementDialog(QDialog):
                 self.models_list.addItem(model["model_name"])
                 self.models_list.item(self.models_list.count() - 1).setData(Qt.ItemDataRole.UserRole, model["id"])
 
-        parent.pending_requests[req] = on_resp
+        if batch is not None:
+            batch.add("list_models", on_resp)
+        else:
+            parent.ws_client.request("list_models", on_resp, owner=self)
 
     def on_model_selected(self, item):
         """Загружает выбранную модель с сервера (data/models/<id>.json)"""
@@ -305,32 +313,35 @@ class ModelsManagementDialog(QDialog):
         parent.pending_requests[req] = on_resp
 
     def download_image_from_server(self, filename):
-        """Запрашивает изображение (Base64) и отображает его"""
+        """Запрашивает изображение (bytes или Base64 — зависит от кодека соединения) и отображает его"""
         parent = self.parent()
+        # Картинка модели уже скачивалась в этом запуске (или известно, что её нет)
+        known, cached = ICONS.remembered(f"image:{filename}")
+        if known:
+            if cached is None:
+                self.preview_image.clear()
+            else:
+                self.preview_image.setPixmap(cached.scaled(360, 300, Qt.AspectRatioMode.KeepAspectRatio))
+            return
         if not parent or not getattr(parent, "ws_connected", False):
             return
 
-        req = parent.ws_client.send_request("download_image", filename=filename)
-
         def on_resp(data):
-            if not data.get("success"):
-                self.preview_image.clear()
-                return
-
-            b64 = data.get("image")
-            if not b64:
+            image = data.get("image")
+            if not data.get("success") or not image:
+                if not data.get("transport_error"):
+                    # На сервере картинки нет — помним это недолго (IconCache.MISSING_TTL)
+                    ICONS.put_data(f"image:{filename}", None)
                 self.preview_image.clear()
                 return
 
             try:
-                img_bytes = base64.b64decode(b64)
-                pixmap = QPixmap()
-                pixmap.loadFromData(img_bytes)
+                pixmap = ICONS.put_data(f"image:{filename}", unpack_bytes(image)) or QPixmap()
                 self.preview_image.setPixmap(pixmap.scaled(360, 300, Qt.AspectRatioMode.KeepAspectRatio))
             except Exception:
                 self.preview_image.clear()
 
-        parent.pending_requests[req] = on_resp
+        parent.ws_client.stream_request("download_image", on_resp, owner=self, filename=filename)
 
     def upload_image_file(self):
         """Выбор изображения локально — картинка будет загружена на сервер при сохранении/добавлении модели"""
@@ -341,7 +352,7 @@ class ModelsManagementDialog(QDialog):
             self.preview_image.setPixmap(pixmap.scaled(360, 300, Qt.AspectRatioMode.KeepAspectRatio))
 
     def upload_image_to_server(self, filename):
-        """Отправляет изображение в base64 на сервер (upload_image)"""
+        """Отправляет изображение на сервер (upload_image); крупное — потоком с продолжением после обрыва"""
         parent = self.parent()
         if not parent or not getattr(parent, "ws_connected", False):
             parent.show_toast("Нет связи с сервером", "error")
@@ -349,10 +360,12 @@ class ModelsManagementDialog(QDialog):
 
         try:
             with open(self.image_path, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode()
+                image = f.read()
 
-            # fire-and-forget, сервер сохранит файл
-            parent.ws_client.send_request("upload_image", filename=filename, image=b64)
+            # fire-and-forget, сервер сохранит файл; bytes упакует сам клиент (как есть или base64)
+            parent.ws_client.stream_request("upload_image", filename=filename, image=image)
+            # Картинка модели заменена — в общем кеше теперь новая
+            ICONS.put_data(f"image:{filename}", image)
         except Exception as e:
             parent.show_toast(f"Ошибка загрузки изображения: {str(e)}", "error")
 
@@ -7,6 +7,8 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtCore import Qt, QDate
 from PyQt6.QtGui import QPixmap, QIcon, QColor
 
+from icon_cache import ICONS
+
 class PlanSwitchInfoDialog(QDialog):
     def __init__(self, plan_switch_data, parent=None):
         super().__init__(parent)
@@ -86,8 +88,8 @@ class PlanSwitchInfoDialog(QDialog):
                     for ext in [".png", ".jpg", ".jpeg", ".bmp", ".gif"]:
                         img_path = os.path.join(image_dir, f"{base_name}{ext}")
                         if os.path.exists(img_path):
-                            pixmap = QPixmap(img_path)
-                            if not pixmap.isNull():
+                            pixmap = ICONS.get(img_path)
+                            if pixmap is not None:
                                 # Растягиваем точно под размер image_label (250x200)
                                 scaled_pixmap = pixmap.scaled(
                                     200, 120,
@@ -29,13 +29,16 @@ class SwitchEditDialog(QDialog):
         # Словари для хранения загруженных данных
         self.models_list = []
         self.masters_list = []
-        self.pending_requests = {}
         self.ports_count = 24  # По умолчанию
         
         self.init_ui()
-        self.load_models()
-        self.load_masters()
-        self.load_data()
+        # Модели, мастера и данные модели свитча запрашиваются одним пакетом
+        batch = self.ws_client.batch(owner=self) if self.ws_client else None
+        self.load_models(batch)
+        self.load_masters(batch)
+        self.load_data(batch)
+        if batch:
+            batch.send()
         self.apply_styles()
         
     def init_ui(self):
@@ -198,7 +201,7 @@ class SwitchEditDialog(QDialog):
         self.remove_port_btn.clicked.connect(self.remove_port)
         self.bold_port_btn.clicked.connect(self.toggle_bold_port)
         
-    def load_models(self):
+    def load_models(self, batch=None):
         """Загрузка списка моделей из JSON через WebSocket"""
         if not self.ws_client:
             # Fallback к дефолтным значениям
@@ -212,31 +215,22 @@ class SwitchEditDialog(QDialog):
             self.model_combo.addItems(default_models)
             return
         
-        # Запрос списка моделей
-        request_id = self.ws_client.send_request(
-            "file_get",
-            path="data/models/models.json"
-        )
-        
-        if request_id:
-            def on_models_response(data):
-                if data.get("success") and data.get("data"):
-                    models_data = data.get("data", [])
-                    self.models_list = models_data
-                    
-                    # Заполняем комбобокс
-                    self.model_combo.clear()
-                    for model in models_data:
-                        self.model_combo.addItem(model.get("model_name", ""))
-                else:
-                    print(f"Ошибка загрузки моделей: {data.get('error')}")
-            
-            if hasattr(self.parent_window, 'pending_requests'):
-                self.parent_window.pending_requests[request_id] = on_models_response
+        def on_models_response(data):
+            if data.get("success") and data.get("data"):
+                models_data = data.get("data", [])
+                self.models_list = models_data
+                
+                # Заполняем комбобокс
+                self.model_combo.clear()
+                for model in models_data:
+                    self.model_combo.addItem(model.get("model_name", ""))
             else:
-                self.pending_requests[request_id] = on_models_response
+                print(f"Ошибка загрузки моделей: {data.get('error')}")
+        
+        # Запрос списка моделей
+        self.send_or_batch(batch, "file_get", on_models_response, path="data/models/models.json")
         
-    def load_masters(self):
+    def load_masters(self, batch=None):
         """Загрузка списка мастеров из JSON через WebSocket"""
         if not self.ws_client:
             # Fallback к дефолтным значениям
@@ -248,29 +242,27 @@ class SwitchEditDialog(QDialog):
             self.master_combo.addItems(default_masters)
             return
         
-        # Запрос списка мастеров
-        request_id = self.ws_client.send_request(
-            "file_get",
-            path="data/lists/masters.json"
-        )
-        
-        if request_id:
-            def on_masters_response(data):
-                if data.get("success") and data.get("data"):
-                    masters_data = data.get("data", [])
-                    self.masters_list = masters_data
-                    
-                    # Заполняем комбобокс
-                    self.master_combo.clear()
-                    for master in masters_data:
-                        self.master_combo.addItem(master.get("fio", ""))
-                else:
-                    print(f"Ошибка загрузки мастеров: {data.get('error')}")
-            
-            if hasattr(self.parent_window, 'pending_requests'):
-                self.parent_window.pending_requests[request_id] = on_masters_response
+        def on_masters_response(data):
+            if data.get("success") and data.get("data"):
+                masters_data = data.get("data", [])
+                self.masters_list = masters_data
+                
+                # Заполняем комбобокс
+                self.master_combo.clear()
+                for master in masters_data:
+                    self.master_combo.addItem(master.get("fio", ""))
             else:
-                self.pending_requests[request_id] = on_masters_response
+                print(f"Ошибка загрузки мастеров: {data.get('error')}")
+        
+        # Запрос списка мастеров
+        self.send_or_batch(batch, "file_get", on_masters_response, path="data/lists/masters.json")
+
+    def send_or_batch(self, batch, action, callback, **kwargs):
+        """Добавляет запрос в пакет, если он есть, иначе отправляет сразу"""
+        if batch is not None:
+            batch.add(action, callback, **kwargs)
+        else:
+            self.ws_client.request(action, callback, owner=self, **kwargs)
     
     def on_model_changed(self, model_name):
         """Обработчик изменения модели - загружает количество портов"""
@@ -281,33 +273,25 @@ class SwitchEditDialog(QDialog):
         # "DES-3200-10 rev C" -> "DES-3200-10_rev_C"
         model_filename = model_name.replace(" ", "_")
         
-        # Запрос данных модели
-        request_id = self.ws_client.send_request(
-            "file_get",
-            path=f"data/models/model_{model_filename}.json"
-        )
-        
-        if request_id:
-            def on_model_data_response(data):
-                if data.get("success") and data.get("data"):
-                    model_data = data.get("data", {})
-                    # Получаем ports_count как строку и конвертируем в int
-                    ports_count_str = model_data.get("ports_count", "24")
-                    try:
-                        ports_count = int(ports_count_str)
-                    except (ValueError, TypeError):
-                        ports_count = 24
-                    
-                    # Обновляем количество портов в таблице
-                    self.ports_count = ports_count
-                    self.update_ports_table_structure()
-                else:
-                    print(f"Ошибка загрузки данных модели: {data.get('error')}")
-            
-            if hasattr(self.parent_window, 'pending_requests'):
-                self.parent_window.pending_requests[request_id] = on_model_data_response
+        def on_model_data_response(data):
+            if data.get("success") and data.get("data"):
+                model_data = data.get("data", {})
+                # Получаем ports_count как строку и конвертируем в int
+                ports_count_str = model_data.get("ports_count", "24")
+                try:
+                    ports_count = int(ports_count_str)
+                except (ValueError, TypeError):
+                    ports_count = 24
+                
+                # Обновляем количество портов в таблице
+                self.ports_count = ports_count
+                self.update_ports_table_structure()
             else:
-                self.pending_requests[request_id] = on_model_data_response
+                print(f"Ошибка загрузки данных модели: {data.get('error')}")
+        
+        # Запрос данных модели; ответ после закрытия диалога отбрасывается (owner)
+        self.ws_client.request("file_get", on_model_data_response, owner=self,
+                               path=f"data/models/model_{model_filename}.json")
     
     def update_ports_table_structure(self):
         """Обновляет структуру таблицы портов при изменении модели"""
@@ -360,7 +344,7 @@ class SwitchEditDialog(QDialog):
                 
                 self.ports_table.setItem(i, 1, desc_item)
     
-    def load_data(self):
+    def load_data(self, batch=None):
         """Загрузка данных свитча в форму"""
         if not self.switch_data:
             return
@@ -388,7 +372,7 @@ class SwitchEditDialog(QDialog):
                 self.model_combo.setCurrentText(model)
             
             # ИСПРАВЛЕНО: Загружаем количество портов из модели перед загрузкой портов
-            self.load_model_ports_count(model)
+            self.load_model_ports_count(model, batch)
         else:
             # Если модели нет, загружаем порты сразу
             self.load_ports_from_data()
@@ -409,7 +393,7 @@ class SwitchEditDialog(QDialog):
         self.note_input.setPlainText(self.switch_data.get("note", ""))
         self.last_editor_input.setText(self.switch_data.get("last_editor", ""))
     
-    def load_model_ports_count(self, model_name):
+    def load_model_ports_count(self, model_name, batch=None):
         """Загружает количество портов из файла модели перед загрузкой данных"""
         if not model_name or not self.ws_client:
             # Если нет модели или ws_client, загружаем порты сразу
@@ -420,32 +404,20 @@ class SwitchEditDialog(QDialog):
         model_filename = model_name.replace(" ", "_")
         model_filename = re.sub(r'[^\w.-]', '_', model_filename)
         
-        # Запрос данных модели
-        request_id = self.ws_client.send_request(
-            "file_get",
-            path=f"data/models/model_{model_filename}.json"
-        )
-        
-        if request_id:
-            def on_model_data_response(data):
-                if data.get("success") and data.get("data"):
-                    model_data = data.get("data", {})
-                    ports_count_str = model_data.get("ports_count", "24")
-                    try:
-                        self.ports_count = int(ports_count_str)
-                    except (ValueError, TypeError):
-                        self.ports_count = 24
-                
-                # После получения количества портов загружаем порты
-                self.load_ports_from_data()
+        def on_model_data_response(data):
+            if data.get("success") and data.get("data"):
+                model_data = data.get("data", {})
+                ports_count_str = model_data.get("ports_count", "24")
+                try:
+                    self.ports_count = int(ports_count_str)
+                except (ValueError, TypeError):
+                    self.ports_count = 24
             
-            if hasattr(self.parent_window, 'pending_requests'):
-                self.parent_window.pending_requests[request_id] = on_model_data_response
-            else:
-                self.pending_requests[request_id] = on_model_data_response
-        else:
-            # Если не удалось отправить запрос, загружаем порты сразу
+            # После получения количества портов (или ошибки запроса) загружаем порты
             self.load_ports_from_data()
+        
+        # Запрос данных модели
+        self.send_or_batch(batch, "file_get", on_model_data_response, path=f"data/models/model_{model_filename}.json")
     
     def load_ports_from_data(self):
         """Загружает порты из данных свитча, показывая ВСЕ порты"""
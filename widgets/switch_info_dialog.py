@@ -4,9 +4,11 @@ from PyQt6.QtWidgets import (
 )
 from PyQt6.QtGui import QPixmap, QColor, QFont
 from PyQt6.QtCore import Qt
-import base64
 import re
 
+from icon_cache import ICONS
+from ws_protocol import unpack_bytes
+
 
 class SwitchInfoDialog(QDialog):
     """
@@ -328,6 +330,15 @@ class SwitchInfoDialog(QDialog):
 
             filename = candidates[index]
 
+            # Картинка модели уже скачивалась в этом запуске (или известно, что её нет)
+            known, cached = ICONS.remembered(f"image:{filename}")
+            if known:
+                if cached is None:
+                    try_load(index + 1)
+                else:
+                    self.image_label.setPixmap(cached.scaled(200, 150, Qt.AspectRatioMode.IgnoreAspectRatio))
+                return
+
             # Отправляем запрос на скачивание изображения через WebSocket
             req = self.parent_window.ws_client.send_request(
                 "download_image",
@@ -342,13 +353,14 @@ class SwitchInfoDialog(QDialog):
                     resp (dict): Ответ от сервера.
                 """
                 if resp.get("success") and resp.get("image"):
-                    pix = QPixmap()
-                    pix.loadFromData(base64.b64decode(resp["image"]))
+                    pix = ICONS.put_data(f"image:{filename}", unpack_bytes(resp["image"])) or QPixmap()
                     # Масштабируем изображение, игнорируя соотношение сторон, чтобы оно соответствовало размеру QLabel
                     pix = pix.scaled(200, 150, Qt.AspectRatioMode.IgnoreAspectRatio) 
                     self.image_label.setPixmap(pix)
                 else:
                     # Если изображение не найдено, пробуем следующее
+                    if not resp.get("transport_error"):
+                        ICONS.put_data(f"image:{filename}", None)
                     try_load(index + 1)
 
             # Сохраняем callback для обработки ответа по этому запросу
@@ -0,0 +1,360 @@
+# write_journal.py — журнал исходящих записей (file_put / csv_write), переживающий обрыв связи и перезапуск
+
+import copy
+import os
+import pickle
+import time
+from collections import OrderedDict
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+from file_writer import write_later
+from json_patch import make_patch, unescape_token
+
+# Через журнал идут file_put и csv_write: каждое целиком перезаписывает файл path на сервере
+# (file_put карты при поддержке сервера уходит разницей — file_patch)
+JOURNAL_FILE = "write_journal.pkl"
+
+# Повтор после таймаута, если соединение при этом не оборвалось
+RETRY_DELAY_MS = 5000
+
+# Журнал-файл пишется не чаще, чем раз в столько мс (в фоновом потоке, см. file_writer)
+SAVE_DELAY_MS = 300
+
+# Разница длиннее этого числа операций уходит полной записью (например, после удаления
+# узла из середины списка сдвигаются все следующие)
+PATCH_MAX_OPS = 500
+
+# Поля, которые сервер или каждое сохранение переписывает сами: при конфликте версий их
+# расхождение с сервером чужой правкой не считается
+CONFLICT_IGNORED = ("/version", "/map/mod_time", "/map/last_adm")
+
+_MISSING = object()
+
+
+class WriteJournal(QObject):
+    """Журнал упреждающей записи для сохранений на сервер.
+
+    Новая запись сначала ложится в journal-файл (в фоновом потоке, с fsync)
+    и только после этого уходит в сокет: сбой между отправкой и записью
+    на диск её не потеряет. Остальные перезаписи файла (ответы сервера)
+    откладываются на SAVE_DELAY_MS (flush() — при выходе).
+    Повторные записи в тот же path схлопываются: хранится и отправляется
+    только последняя версия. Запись удаляется из журнала, когда сервер
+    ответил (успехом или своей ошибкой); при таймауте и обрыве она
+    остаётся и отправляется заново по replay() — после переподключения
+    или при следующем запуске. Порядок повторной отправки — порядок
+    последних изменений, а все записи идут одним классом очереди (bulk),
+    поэтому друг друга не обгоняют. По одному path в пути не больше одного
+    запроса: более новая версия уходит после ответа на предыдущую.
+
+    Если сервер поддерживает "patch" и для path известна подтверждённая
+    версия (set_base или ответ на прошлую запись), file_put заменяется на
+    file_patch — разницу от этой версии. При неизвестной базе или слишком
+    длинной разнице документ уходит целиком. При конфликте версий (файл
+    изменили после базы) журнал берёт текущую версию сервера: если все её
+    изменения уже есть в локальном документе (например, ответ на прошлую
+    запись потерялся), уходит разница от неё; иначе запись снимается и
+    подаётся сигнал conflict — чужие изменения не затираются.
+    """
+    # Число записей, ещё не подтверждённых сервером
+    pending_changed = pyqtSignal(int)
+    # (path, version, данные): сервер подтвердил эту версию файла
+    confirmed = pyqtSignal(str, int, object)
+    # (path, текст ошибки): файл изменили на сервере, запись не отправлена
+    conflict = pyqtSignal(str, str)
+    # (ключ, seq): запись дошла до journal-файла (из потока file_writer, доставляется в GUI-поток)
+    _persisted = pyqtSignal(object, int)
+
+    def __init__(self, client, journal_file=JOURNAL_FILE):
+        super().__init__()
+        self.client = client
+        self.journal_file = journal_file
+        # (action, path) -> {"action", "path", "data", "seq", "queued_at"}
+        self.entries = OrderedDict()
+        self._in_flight = {}  # (action, path) -> seq отправленной версии
+        self._callbacks = {}  # (action, path) -> обработчики ответа для последней версии
+        # path -> (version, документ): последняя подтверждённая сервером версия, от неё считается разница
+        self.bases = {}
+        self._seq = 0
+        self._save_timer = QTimer(self)
+        self._save_timer.setSingleShot(True)
+        self._save_timer.timeout.connect(self._write)
+        self._persisted.connect(self._on_persisted)
+        self.stats = {"queued": 0, "coalesced": 0, "sent": 0, "replayed": 0, "confirmed": 0, "rejected": 0,
+                      "patched": 0, "conflicts": 0}
+        self._load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def submit(self, action, path, data, callback=None):
+        """Ставит запись в журнал и, если есть связь, отправляет, как только она на диске.
+
+        Возвращает True, если запрос уходит сейчас, False — если запись ждёт связи.
+        callback вызывается с ответом сервера на эту (или более позднюю) версию.
+        """
+        key = (action, path)
+        self._seq += 1
+        if key in self.entries:
+            self.stats["coalesced"] += 1
+            self.entries.pop(key)
+        else:
+            self._callbacks.pop(key, None)
+        # Снимок: дальнейшие правки в памяти не должны менять то, что уже в журнале.
+        # pickle заметно быстрее deepcopy, и тот же blob потом ложится в journal-файл
+        blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        self.entries[key] = {
+            "action": action,
+            "path": path,
+            "data": pickle.loads(blob),
+            "blob": blob,
+            "seq": self._seq,
+            "queued_at": time.time(),
+            "persisted": False,
+        }
+        if callback is not None:
+            self._callbacks.setdefault(key, []).append(callback)
+        self.stats["queued"] += 1
+        # Журнал — до сокета: отправка по _on_persisted, когда файл записан
+        self._save_timer.stop()
+        seq = self._seq
+        self._write().add_done_callback(lambda _future: self._persisted.emit(key, seq))
+        self.pending_changed.emit(len(self.entries))
+        return self.client.is_ready() and self.client.is_negotiated()
+
+    def _on_persisted(self, key, seq):
+        entry = self.entries.get(key)
+        if entry is None or entry["seq"] != seq:
+            # Уже заменена более новой версией — та уйдёт по своему _on_persisted
+            return
+        entry["persisted"] = True
+        self._send(key)
+
+    def pending_data(self, action, path):
+        """Неотправленная версия файла (или None) — чтобы не показать пользователю устаревшие данные сервера"""
+        entry = self.entries.get((action, path))
+        return pickle.loads(entry["blob"]) if entry else None
+
+    def set_base(self, path, version, data):
+        """Запоминает версию path, загруженную с сервера, — следующие сохранения пойдут разницей"""
+        self.bases[path] = (version, copy.deepcopy(data))
+
+    def drop_base(self, path):
+        self.bases.pop(path, None)
+
+    def clear_bases(self):
+        """Забывает все подтверждённые версии (переключение на другой сервер) — следующие записи уйдут целиком"""
+        self.bases.clear()
+
+    def replay(self):
+        """Отправляет все неподтверждённые записи по порядку (вызывать, когда соединение готово — server_ready)"""
+        sent = 0
+        for key in list(self.entries):
+            if self._send(key):
+                sent += 1
+        if sent:
+            self.stats["replayed"] += sent
+            print(f"Журнал записи: повторно отправлено {sent}")
+        return sent
+
+    def on_connection_changed(self, connected):
+        if not connected:
+            # Ответов на отправленное уже не будет — при подключении отправим заново
+            self._in_flight.clear()
+
+    def on_server_ready(self, _features):
+        # Повтор только после hello: до ответа server_features пусты — ни разницы, ни потоковой выгрузки
+        self.replay()
+
+    def _send(self, key):
+        entry = self.entries.get(key)
+        if entry is None or not entry.get("persisted", True) or not self.client.is_ready():
+            return False
+        if not self.client.is_negotiated():
+            # Соединение есть, hello ещё в пути — запись уйдёт по server_ready (replay)
+            return False
+        if key in self._in_flight:
+            # Предыдущая версия ещё в пути — эта уйдёт по её ответу
+            return True
+        seq, sent = entry["seq"], entry["data"]
+        self._in_flight[key] = seq
+        self.stats["sent"] += 1
+        patch = self._patch_for(entry)
+        if patch is not None:
+            base_version, ops = patch
+            self.stats["patched"] += 1
+            if not ops:
+                # С подтверждённой версии ничего не изменилось — отправлять нечего
+                QTimer.singleShot(0, lambda: self._on_response(key, seq, sent,
+                                                               {"success": True, "version": base_version}))
+                return True
+            self.client.request(
+                "file_patch",
+                lambda data: self._on_response(key, seq, sent, data, patched=True),
+                path=entry["path"],
+                base_version=base_version,
+                patch=ops,
+            )
+            return True
+        # Крупная карта уходит потоком: после обрыва выгрузка продолжится с полученного сервером
+        self.client.stream_request(
+            entry["action"],
+            lambda data: self._on_response(key, seq, sent, data),
+            path=entry["path"],
+            data=sent,
+        )
+        return True
+
+    def _patch_for(self, entry):
+        """(base_version, операции) для отправки разницей или None — тогда документ уходит целиком"""
+        base = self.bases.get(entry["path"])
+        if (base is None or entry["action"] != "file_put" or not isinstance(entry["data"], dict)
+                or "patch" not in self.client.server_features):
+            return None
+        version, base_data = base
+        ops = make_patch(base_data, entry["data"])
+        if len(ops) > PATCH_MAX_OPS:
+            return None
+        return version, ops
+
+    def _on_response(self, key, seq, sent, data, patched=False):
+        if self._in_flight.get(key) == seq:
+            del self._in_flight[key]
+        if data.get("transport_error"):
+            # Ответа не было — запись остаётся в журнале; при живом соединении повторяем позже
+            if self.client.is_ready():
+                QTimer.singleShot(RETRY_DELAY_MS, lambda: self._send(key))
+            return
+        if patched and data.get("conflict"):
+            # Версия на сервере ушла вперёд (или разница не применилась) — сверяемся с ней
+            self.stats["conflicts"] += 1
+            print(f"Журнал записи: {key[1]} — {data.get('error')}, запрашиваем версию сервера")
+            self._fetch_server_version(key)
+            return
+        if data.get("success") and "version" in data:
+            self.bases[key[1]] = (data["version"], sent)
+            self.confirmed.emit(key[1], data["version"], sent)
+        entry = self.entries.get(key)
+        if entry is None or entry["seq"] != seq:
+            # Пока ждали ответа, появилась более новая версия — теперь её очередь
+            self._send(key)
+            return
+        self.stats["confirmed" if data.get("success") else "rejected"] += 1
+        del self.entries[key]
+        self._save()
+        self.pending_changed.emit(len(self.entries))
+        for callback in self._callbacks.pop(key, []):
+            callback(data)
+
+    def _fetch_server_version(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return
+        # Пока сверяемся, более новые версии этого path не отправляются
+        seq = self._in_flight[key] = entry["seq"]
+        self.client.stream_request("file_get", lambda data: self._on_server_version(key, seq, data), path=key[1])
+
+    def _on_server_version(self, key, seq, data):
+        if self._in_flight.get(key) == seq:
+            del self._in_flight[key]
+        entry = self.entries.get(key)
+        if entry is None:
+            return
+        path = key[1]
+        if data.get("transport_error"):
+            # База остаётся прежней: повтор снова получит конфликт и снова сверится
+            if self.client.is_ready():
+                QTimer.singleShot(RETRY_DELAY_MS, lambda: self._send(key))
+            return
+        base = self.bases.get(path)
+        server = data.get("data")
+        if not data.get("success") or not isinstance(server, dict):
+            # Файла на сервере нет — затирать нечего, документ уходит целиком
+            self.bases.pop(path, None)
+            self._send(key)
+            return
+        version = data.get("version", server.get("version", 0))
+        self.bases[path] = (version, server)
+        if base is None or self._keeps_server_changes(base[1], server, entry["data"]):
+            self._send(key)
+            return
+        # Файл изменил кто-то другой: отправка локального документа откатила бы его правки
+        self.stats["rejected"] += 1
+        error = f"Файл {path} изменён на сервере (версия {version}), изменения не отправлены"
+        print(f"Журнал записи: {error}")
+        del self.entries[key]
+        self._save()
+        self.pending_changed.emit(len(self.entries))
+        self.conflict.emit(path, error)
+        for callback in self._callbacks.pop(key, []):
+            callback({"success": False, "conflict": True, "version": version, "error": error})
+
+    @staticmethod
+    def _keeps_server_changes(base, server, local):
+        """Есть ли в local все изменения server относительно base (кроме CONFLICT_IGNORED)"""
+        appended = {}
+        for op in make_patch(base, server):
+            path = op["path"]
+            if path.endswith("/-"):
+                # Дописанный в конец элемент: его индекс — длина списка в base плюс уже дописанные
+                parent = path[:-2]
+                index = len(_value_at(base, parent)) + appended.get(parent, 0)
+                appended[parent] = appended.get(parent, 0) + 1
+                path = f"{parent}/{index}"
+            if path in CONFLICT_IGNORED:
+                continue
+            if make_patch(_value_at(server, path), _value_at(local, path)):
+                return False
+        return True
+
+    def _load(self):
+        if not os.path.exists(self.journal_file):
+            return
+        try:
+            with open(self.journal_file, "rb") as f:
+                saved = pickle.load(f)
+            for entry in saved:
+                if "blob" in entry:
+                    entry["data"] = pickle.loads(entry["blob"])
+                else:
+                    # Журнал прежнего формата: данные без blob
+                    entry["blob"] = pickle.dumps(entry["data"], protocol=pickle.HIGHEST_PROTOCOL)
+                self.entries[(entry["action"], entry["path"])] = entry
+                self._seq = max(self._seq, entry["seq"])
+            if self.entries:
+                print(f"Журнал записи: {len(self.entries)} неотправленных изменений")
+        except Exception as e:
+            print(f"Ошибка чтения журнала записи: {e}")
+
+    def _save(self):
+        # Несколько изменений подряд (перетаскивание, ответ сервера) — одна запись файла
+        if not self._save_timer.isActive():
+            self._save_timer.start(SAVE_DELAY_MS)
+
+    def _write(self):
+        # В файл идут готовые blob записей: сериализуется только короткий список, без карт
+        records = [{k: v for k, v in entry.items() if k not in ("data", "persisted")}
+                   for entry in self.entries.values()]
+        return write_later(self.journal_file, pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL), fsync=True)
+
+    def flush(self):
+        """Ставит отложенную запись journal-файла сразу (при выходе; дождаться — file_writer.flush)"""
+        if self._save_timer.isActive():
+            self._save_timer.stop()
+            self._write()
+
+    def summary(self):
+        return (f"Журнал записи: ждут {len(self.entries)}, схлопнуто {self.stats['coalesced']}, "
+                f"повторно {self.stats['replayed']}, разницей {self.stats['patched']}, "
+                f"конфликтов {self.stats['conflicts']}")
+
+
+def _value_at(doc, path):
+    """Значение по JSON Pointer или _MISSING"""
+    for token in path[1:].split("/") if path else ():
+        token = unescape_token(token)
+        try:
+            doc = doc[int(token)] if isinstance(doc, list) else doc[token]
+        except (KeyError, IndexError, ValueError, TypeError):
+            return _MISSING
+    return doc
@@ -0,0 +1,952 @@
+# ws_client.py — WebSocket-клиент приложения: соединение, запросы, пакеты
+# Одно соединение создаётся при входе (LoginDialog) и передаётся в MainWindow
+
+import time
+import asyncio
+import concurrent.futures
+import copy
+import json
+import uuid
+import websockets
+from PyQt6.QtCore import QObject, QSettings, QThread, QTimer, pyqtSignal
+from ws_protocol import (CLIENT_FEATURES, CODECS, JSON_CODEC, STREAM_CHUNK, STREAM_FIELDS, STREAM_THRESHOLD,
+                         STREAM_UPLOADS, ConnectionHealth, ReconnectPolicy, SendScheduler, ServerPool, blob_version,
+                         decode_blob, decode_frame, encode_blob, get_codec, health_summary, pack_bytes,
+                         send_class_for, unpack_bytes)
+
+# === Адреса сервера ===
+DEFAULT_SERVERS = ["ws://192.168.0.56:8081"]
+
+
+def load_servers():
+    """Список адресов сервера из настроек (в порядке предпочтения)"""
+    servers = QSettings("Network Management System", "UserSession").value("servers")
+    if isinstance(servers, str):
+        servers = [servers]
+    return [uri for uri in servers or [] if uri] or list(DEFAULT_SERVERS)
+
+
+def save_servers(uris):
+    QSettings("Network Management System", "UserSession").setValue("servers", list(uris))
+
+
+# === Запросы к серверу ===
+class RequestFuture(QObject):
+    """Ответ на один запрос к серверу.
+
+    Результат — словарь ответа сервера. При таймауте, обрыве связи или отказе
+    отправки приходит {"success": False, "error": ..., "transport_error": True},
+    поэтому обработчики, проверяющие data.get("success"), работают без изменений.
+    Ждать результат можно через сигнал finished, add_done_callback или await.
+    """
+    finished = pyqtSignal(dict)
+
+    def __init__(self, manager, request_id, action, timeout, owner_key=None):
+        super().__init__()
+        self.manager = manager
+        self.request_id = request_id
+        self.action = action
+        self.timeout = timeout
+        self.owner_key = owner_key
+        self.sent_at = time.monotonic()
+        self.deadline = self.sent_at + timeout
+        # Параметры чтения для повторной отправки после переключения сервера (None — не повторяется)
+        self.params = None
+        self.streamed = False
+        self._future = concurrent.futures.Future()
+        self._callbacks = []
+
+    def add_done_callback(self, callback):
+        if self._future.done() and not self._future.cancelled():
+            callback(self._future.result())
+        else:
+            self._callbacks.append(callback)
+
+    def done(self):
+        return self._future.done()
+
+    def cancelled(self):
+        return self._future.cancelled()
+
+    def result(self, timeout=None):
+        return self._future.result(timeout)
+
+    def cancel(self):
+        """Отменяет ожидание: обработчики не будут вызваны, поздний ответ будет отброшен"""
+        self.manager.cancel(self.request_id)
+        self._future.cancel()
+
+    def __await__(self):
+        return asyncio.wrap_future(self._future).__await__()
+
+    def _resolve(self, data):
+        if self._future.done():
+            return
+        self._future.set_result(data)
+        for callback in self._callbacks:
+            callback(data)
+        self._callbacks.clear()
+        self.finished.emit(data)
+
+
+class RequestManager(QObject):
+    """Таблица запросов, ожидающих ответа сервера.
+
+    Живёт в GUI-потоке: ответы приходят пачками из WS-потока (messages_received),
+    просроченные запросы снимаются таймером, при обрыве связи все незавершённые
+    запросы завершаются ошибкой. Поддерживает старый протокол
+    pending_requests[request_id] = callback.
+
+    Одинаковые запросы чтения (READ_ACTIONS с теми же параметрами), пока
+    первый из них в пути, не отправляются: их future присоединяются к
+    первому и получают копию его ответа. Таймаут и отмена у каждого свои.
+
+    При обрыве, после которого клиент переподключается, чтения не
+    завершаются ошибкой, а откладываются (take_held) и отправляются заново
+    по новому соединению — возможно, к другому адресу сервера.
+    """
+
+    DEFAULT_TIMEOUT = 30
+    # Таймауты по action, с
+    ACTION_TIMEOUTS = {
+        "check_ping_updates": 10,
+        "list_maps": 15,
+        "ping": 15,
+        "ping_switches": 60,
+        "file_put": 60,
+        "file_patch": 60,
+        "csv_write": 60,
+        "upload_image": 60,
+    }
+    # Чтения без побочных эффектов: одинаковые запросы в пути объединяются
+    READ_ACTIONS = (
+        "file_get", "csv_read", "load_model", "list_maps", "list_models",
+        "list_mngmt_vlan", "list_masters", "list_firmwares", "list_engineers",
+        "download_image",
+    )
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pending = {}        # request_id -> RequestFuture
+        self._owners = {}         # id(owner) -> set(request_id)
+        self._reads = {}          # (action, параметры) -> request_id отправленного чтения
+        self._read_keys = {}      # request_id отправленного чтения -> (action, параметры)
+        self._joined = {}         # request_id отправленного чтения -> [присоединённые RequestFuture]
+        self._held = set()        # чтения (и присоединённые к ним), ждущие нового соединения
+        self.stats = {
+            "sent": 0,
+            "completed": 0,
+            "timed_out": 0,
+            "cancelled": 0,
+            "failed": 0,       # завершены ошибкой из-за обрыва связи
+            "orphaned": 0,     # ответы, для которых запроса уже (или ещё) нет
+            "not_sent": 0,     # попытки отправки без соединения
+            "merged": 0,       # чтения, присоединённые к такому же запросу в пути
+            "resent": 0,       # чтения, повторённые после переподключения
+        }
+        # action -> {"count", "total_ms", "max_ms", "last_ms"}
+        self.latency_stats = {}
+
+        self._sweep_timer = QTimer(self)
+        self._sweep_timer.timeout.connect(self._expire)
+        self._sweep_timer.start(500)
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    def create(self, action, callback=None, timeout=None, owner=None):
+        """Создаёт future для нового запроса (ещё не зарегистрированный)"""
+        if timeout is None:
+            timeout = self.ACTION_TIMEOUTS.get(action, self.DEFAULT_TIMEOUT)
+        owner_key = self._watch_owner(owner) if owner is not None else None
+        future = RequestFuture(self, str(uuid.uuid4()), action, timeout, owner_key)
+        if callback:
+            future.add_done_callback(callback)
+        return future
+
+    def track(self, future, sent=True):
+        """Регистрирует запрос; sent=False — присоединённый, в сокет он не уходит"""
+        self._pending[future.request_id] = future
+        if future.owner_key is not None:
+            self._owners.setdefault(future.owner_key, set()).add(future.request_id)
+        if sent:
+            self.stats["sent"] += 1
+            if send_class_for(future.action) in ("bulk", "upload"):
+                # Запись (file_put, save_model...) меняет данные: чтения после неё не должны
+                # получить ответ чтения, отправленного до неё, — они уходят в сокет заново
+                self._reads.clear()
+
+    def join_read(self, future, params):
+        """Присоединяет future к такому же чтению в пути (True) или запоминает его как первое (False)"""
+        if future.action not in self.READ_ACTIONS:
+            return False
+        key = (future.action, json.dumps(params, sort_keys=True, default=str))
+        leader_id = self._reads.get(key)
+        if leader_id is None:
+            self._reads[key] = future.request_id
+            self._read_keys[future.request_id] = key
+            return False
+        self._joined.setdefault(leader_id, []).append(future)
+        self.stats["merged"] += 1
+        return True
+
+    def reject_later(self, future, error):
+        """Завершает неотправленный запрос ошибкой на следующем проходе цикла событий"""
+        self.stats["not_sent"] += 1
+        QTimer.singleShot(0, lambda: future._resolve(self._error(future, error)))
+
+    def cancel(self, request_id):
+        key = self._read_keys.get(request_id)
+        if key is not None and self._reads.get(key) == request_id:
+            # Ответ отменённого чтения ещё получат присоединённые, но новые запросы уйдут заново
+            del self._reads[key]
+        future = self._discard(request_id)
+        if future and not future.done():
+            future._future.cancel()
+            self.stats["cancelled"] += 1
+
+    def cancel_owner(self, owner_key):
+        """Отменяет все запросы, привязанные к владельцу (обычно — закрытому диалогу)"""
+        for request_id in list(self._owners.pop(owner_key, ())):
+            self.cancel(request_id)
+
+    def fail_all(self, error):
+        """Завершает ошибкой все незавершённые запросы"""
+        self._held.clear()
+        self._reads.clear()
+        self._read_keys.clear()
+        self._joined.clear()
+        self.fail(list(self._pending), error)
+
+    def fail(self, request_ids, error, transport_error=True):
+        """Завершает ошибкой перечисленные запросы, если они ещё ждут ответа"""
+        for request_id in request_ids:
+            if transport_error and request_id in self._held:
+                continue  # будет отправлен заново после переподключения
+            future = self._discard(request_id)
+            if future is None:
+                continue
+            self.stats["failed"] += 1
+            data = self._error(future, error)
+            data["transport_error"] = transport_error
+            future._resolve(data)
+            self._finish_read(request_id, data)
+
+    def on_connection_changed(self, is_connected, hold_reads=False):
+        # Ответы на запросы, отправленные в разорванное соединение, уже не придут
+        if is_connected or not self._pending:
+            return
+        if not hold_reads:
+            self.fail_all("Соединение с сервером потеряно")
+            return
+        # Чтения откладываем до нового соединения, вместе с присоединёнными к ним
+        for request_id, future in self._pending.items():
+            if future.params is not None:
+                self._held.add(request_id)
+                self._held.update(f.request_id for f in self._joined.get(request_id, []))
+        self.fail(list(self._pending), "Соединение с сервером потеряно")
+
+    def take_held(self):
+        """Отложенные чтения, которые надо отправить заново (присоединённые ждут вместе с ними)"""
+        held, self._held = self._held, set()
+        futures = [self._pending[rid] for rid in held if rid in self._pending and self._pending[rid].params is not None]
+        now = time.monotonic()
+        for future in futures:
+            # Отсчёт таймаута — заново, от повторной отправки
+            future.sent_at = now
+            future.deadline = now + future.timeout
+        self.stats["resent"] += len(futures)
+        return futures
+
+    def dispatch(self, batch):
+        """Разбирает пачку ответов сервера"""
+        for data in batch:
+            request_id = data.get("request_id")
+            if request_id is None:
+                continue
+            self._finish_read(request_id, data)
+            future = self._discard(request_id)
+            if future is None:
+                self.stats["orphaned"] += 1
+                continue
+            self.stats["completed"] += 1
+            self._note_latency(future)
+            future._resolve(data)
+
+    # --- совместимость с pending_requests[request_id] = callback ---
+    def __setitem__(self, request_id, callback):
+        if request_id is None:
+            # Запрос не был отправлен (нет связи) — ответа не будет
+            return
+        future = self._pending.get(request_id)
+        if future is not None:
+            future.add_done_callback(callback)
+
+    def __contains__(self, request_id):
+        return request_id in self._pending
+
+    def __len__(self):
+        return len(self._pending)
+
+    # --- статистика ---
+    def latency_summary(self):
+        """Текстовая сводка задержек по action: среднее / максимум / последнее, мс"""
+        lines = []
+        for action, stats in sorted(self.latency_stats.items()):
+            avg = stats["total_ms"] / stats["count"]
+            lines.append(f"{action}: avg {avg:.0f} / max {stats['max_ms']:.0f} / last {stats['last_ms']:.0f} мс ({stats['count']})")
+        return "\n".join(lines)
+
+    def summary(self):
+        counters = (
+            f"В ожидании: {self.in_flight}, таймаутов: {self.stats['timed_out']}, "
+            f"потерянных ответов: {self.stats['orphaned']}, отменено: {self.stats['cancelled']}, "
+            f"объединено чтений: {self.stats['merged']}, повторено после переподключения: {self.stats['resent']}"
+        )
+        latency = self.latency_summary()
+        return f"{counters}\n{latency}" if latency else counters
+
+    # --- внутреннее ---
+    def _watch_owner(self, owner):
+        owner_key = id(owner)
+        if owner_key not in self._owners:
+            self._owners[owner_key] = set()
+            handler = lambda *_: self.cancel_owner(owner_key)
+            # QDialog.finished — закрытие диалога, destroyed — удаление любого QObject
+            finished = getattr(owner, "finished", None)
+            if finished is not None:
+                finished.connect(handler)
+            owner.destroyed.connect(handler)
+        return owner_key
+
+    def _discard(self, request_id):
+        self._held.discard(request_id)
+        future = self._pending.pop(request_id, None)
+        if future is not None and future.owner_key is not None:
+            self._owners.get(future.owner_key, set()).discard(request_id)
+        return future
+
+    def _finish_read(self, request_id, data):
+        """Ответ (или ошибка) отправленного чтения — копия каждому присоединённому запросу"""
+        key = self._read_keys.pop(request_id, None)
+        if key is not None and self._reads.get(key) == request_id:
+            del self._reads[key]
+        for follower in self._joined.pop(request_id, []):
+            if self._discard(follower.request_id) is None:
+                continue  # отменён или уже истёк
+            if data.get("transport_error"):
+                self.stats["failed"] += 1
+            else:
+                self.stats["completed"] += 1
+                self._note_latency(follower)
+            # Копия: обработчики нередко меняют полученные данные на месте
+            reply = copy.deepcopy(data)
+            reply["request_id"] = follower.request_id
+            follower._resolve(reply)
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [rid for rid, f in self._pending.items() if f.deadline <= now]
+        for request_id in expired:
+            future = self._discard(request_id)
+            if future is None:
+                continue  # присоединённое чтение, уже завершённое вместе с отправленным
+            self.stats["timed_out"] += 1
+            print(f"[WS] Request timeout: {future.action} ({future.timeout} s)")
+            data = self._error(future, "Превышено время ожидания ответа")
+            future._resolve(data)
+            # Присоединённые чтения ждали того же ответа — завершаем их тоже
+            self._finish_read(request_id, data)
+
+    def _note_latency(self, future):
+        elapsed_ms = (time.monotonic() - future.sent_at) * 1000
+        stats = self.latency_stats.setdefault(future.action, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+        stats["count"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        stats["last_ms"] = elapsed_ms
+
+    @staticmethod
+    def _error(future, error):
+        # transport_error отличает отказ клиента (ответа не было) от ошибки, присланной сервером
+        return {"request_id": future.request_id, "action": future.action, "success": False, "error": error, "transport_error": True}
+
+
+class RequestBatch:
+    """Несколько запросов, отправляемых одним кадром action=batch.
+
+    Каждый запрос получает свой RequestFuture и обработчик, как при
+    WebSocketClient.request(). Если сервер не объявил поддержку batch,
+    запросы уходят по отдельности — вызывающему коду разница не видна.
+    """
+
+    def __init__(self, client, owner=None):
+        self.client = client
+        self.owner = owner
+        self._items = []
+
+    def add(self, action, callback=None, timeout=None, **kwargs):
+        self._items.append((action, callback, timeout, kwargs))
+        return self
+
+    def __len__(self):
+        return len(self._items)
+
+    def send(self):
+        """Отправляет пакет; возвращает список RequestFuture в порядке add()"""
+        items, self._items = self._items, []
+        return self.client._send_batch(items, self.owner)
+
+
+# === WebSocket Client ===
+class WebSocketClient(QThread):
+    connected = pyqtSignal(bool)
+    # Пачка входящих сообщений, накопленных за один проход цикла событий
+    messages_received = pyqtSignal(list)
+    # Показатели соединения (словарь ConnectionHealth.snapshot)
+    health_changed = pyqtSignal(dict)
+    # Ответ на hello получен: список возможностей сервера (пустой — сервер hello не знает)
+    server_ready = pyqtSignal(list)
+    # Сообщения, которые сервер шлёт сам, без запроса (action=push)
+    push_received = pyqtSignal(list)
+    # Ход потоковой передачи: request_id, передано байт, всего байт
+    transfer_progress = pyqtSignal(str, int, int)
+    # Результат возобновления сеанса по билету (поле "resume" ответа на hello); приходит до server_ready
+    session_resumed = pyqtSignal(dict)
+
+    # Период обновления показателей соединения, с
+    HEALTH_INTERVAL = 5
+    # Сколько ждать рукопожатия и ping при выборе адреса сервера, с
+    PROBE_TIMEOUT = 3
+    # Сколько хранится недокачанный ответ в ожидании повторного запроса, с
+    PARTIAL_TTL = 600
+
+    def __init__(self, uri=None, recorder=None):
+        """uri — адрес или список адресов сервера; по умолчанию — из настроек (load_servers)"""
+        super().__init__()
+        if uri is None:
+            uri = load_servers()
+        self.pool = ServerPool([uri] if isinstance(uri, str) else uri)
+        # Адрес текущего (или следующего) подключения
+        self.uri = self.pool.uris[0]
+        self.websocket = None
+        self.loop = None
+        self.running = True
+        # Флаги для отложенной загрузки карт до установления WS-соединения
+        self.open_maps_loaded = False      # true после первой полной попытки загрузки
+        self.load_open_maps_pending = False
+        # Входящие кадры, ещё не переданные в GUI-поток
+        self._inbox = []
+        self._flush_scheduled = False
+        # Исходящие кадры с приоритетами (обслуживается в WS-потоке)
+        self.scheduler = SendScheduler()
+        # Запись трафика (TrafficRecorder) или None
+        self.recorder = recorder
+        self.scheduler.recorder = recorder
+        # Возможности сервера из ответа на hello; пусто — сервер hello не знает
+        self.server_features = set()
+        # Ответ на hello на текущем соединении получен: возможности и кодек согласованы
+        self.negotiated = False
+        self._hello_id = None
+        # Билет сеанса из auth_login (пишется в GUI-потоке) и подписки pingok {map_id: seq}
+        # для возобновления — hello отправляется из WS-потока и читает их целиком
+        self.session_ticket = None
+        self.resume_subscriptions = {}
+        self._attempt_started = None
+        # Кодек кадров, согласованный в hello (до ответа — JSON)
+        self.codec = JSON_CODEC
+        # Переподключение с нарастающей паузой и показатели соединения (пишутся в WS-потоке)
+        self.reconnect_policy = ReconnectPolicy()
+        self.health = ConnectionHealth()
+        # Потоковые передачи (WS-поток): недокачанные ответы по ключу запроса,
+        # request_id -> ключ, служебные запросы WS-потока и задачи выгрузки
+        self._downloads = {}
+        self._download_keys = {}
+        self._local_waiters = {}
+        self._upload_tasks = set()
+        # Обработчики хода передачи (GUI-поток)
+        self._progress_handlers = {}
+        self.transfer_progress.connect(self._on_transfer_progress)
+
+        # Запросы, ожидающие ответа (живут в GUI-потоке)
+        self.requests = RequestManager(self)
+        self.messages_received.connect(self.requests.dispatch)
+        self.connected.connect(self._on_connected_changed)
+        self.server_ready.connect(self._resend_held)
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._main())
+
+    async def _main(self):
+        # Будит паузу перед переподключением, когда клиент останавливают
+        self._stop_event = asyncio.Event()
+        while self.running:
+            error = ""
+            self._attempt_started = time.monotonic()
+            try:
+                self.uri = await self._choose_server()
+                async with self._connect() as ws:
+                    self.server_features = set()
+                    self.negotiated = False
+                    self.codec = JSON_CODEC
+                    self.scheduler.clear()
+                    sender = asyncio.create_task(self.scheduler.run(ws))
+                    monitor = asyncio.create_task(self._monitor_health(ws))
+                    self._send_hello()
+                    self.websocket = ws
+                    self.pool.on_connected(self.uri)
+                    self.health.on_connected()
+                    if self.recorder is not None:
+                        self.recorder.meta(event="connected", uri=self.uri)
+                    self.connected.emit(True)
+
+                    try:
+                        # Читаем непрерывно: кадр попадает в очередь сразу по приходу,
+                        # а всё, что пришло до ближайшего прохода цикла, уходит в GUI одной пачкой
+                        async for response in ws:
+                            if not self.running:
+                                break
+                            self.health.on_frame(response)
+                            if self.recorder is not None:
+                                self.recorder.record("in", response)
+                            try:
+                                data = decode_frame(response, self.codec)
+                            except Exception as e:
+                                print(f"[WS] Error decoding: {e}")
+                                continue
+                            if self._hello_id and data.get("request_id") == self._hello_id:
+                                self._on_hello(data)
+                                continue
+                            if data.get("action") == "stream_chunk":
+                                self._on_stream_chunk(data)
+                                continue
+                            waiter = self._local_waiters.pop(data.get("request_id"), None)
+                            if waiter is not None:
+                                if not waiter.done():
+                                    waiter.set_result(data)
+                                continue
+                            self._post(data)
+                    finally:
+                        sender.cancel()
+                        monitor.cancel()
+                        for task in list(self._upload_tasks):
+                            task.cancel()
+                        for waiter in self._local_waiters.values():
+                            waiter.cancel()
+                        self._local_waiters.clear()
+
+            except Exception as e:
+                print(f"[WS] Connection error: {e}")
+                error = str(e) or type(e).__name__
+            finally:
+                self._flush_inbox()
+                self.websocket = None
+                self.negotiated = False
+                if self.recorder is not None:
+                    self.recorder.meta(event="disconnected", error=error)
+                self.connected.emit(False)
+
+            # Закрытие сервером тоже ведёт сюда: пауза нужна в обоих случаях
+            self.reconnect_policy.connection_lasted(self.health.on_disconnected(error))
+            if not self.running:
+                break
+            self.pool.on_failure(self.uri)
+            if self.pool.has_standby():
+                # Есть исправный резервный адрес — переключаемся сразу
+                print(f"[WS] Переключение с {self.uri} на резервный адрес")
+                continue
+            if self.running:
+                delay = self.reconnect_policy.next_delay()
+                self.health.retry_at = time.monotonic() + delay
+                self.health_changed.emit(self.health_snapshot())
+                print(f"[WS] Повторное подключение через {delay:.1f} с")
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _choose_server(self):
+        """Возвращает самый быстрый исправный адрес пула; проверяются только адреса без свежей проверки"""
+        candidates = self.pool.candidates()
+        if len(candidates) == 1:
+            return candidates[0]
+        fresh = self.pool.probed(candidates)
+        stale = [uri for uri in candidates if uri not in fresh]
+        if stale:
+            results = await asyncio.gather(*(self._probe(uri) for uri in stale))
+            for uri, handshake_ms, rtt_ms in results:
+                self.pool.on_probe(uri, handshake_ms, rtt_ms)
+        alive = self.pool.probed(candidates)
+        uri = self.pool.best(alive or candidates)
+        if stale:
+            print(f"[WS] Выбран сервер {uri}\n{self.pool.summary()}")
+        return uri
+
+    async def _probe(self, uri):
+        """(uri, рукопожатие мс, RTT мс); None — адрес не ответил"""
+        t0 = time.monotonic()
+        try:
+            async with websockets.connect(uri, open_timeout=self.PROBE_TIMEOUT, ping_interval=None) as ws:
+                handshake_ms = (time.monotonic() - t0) * 1000
+                t1 = time.monotonic()
+                pong = await ws.ping()
+                await asyncio.wait_for(pong, self.PROBE_TIMEOUT)
+                return uri, handshake_ms, (time.monotonic() - t1) * 1000
+        except Exception:
+            return uri, None, None
+
+    def _connect(self):
+        """Асинхронный контекст соединения (подменяется при воспроизведении записи)"""
+        return websockets.connect(self.uri, ping_interval=20, ping_timeout=10)
+
+    async def _monitor_health(self, ws):
+        """Раз в HEALTH_INTERVAL с передаёт в GUI показатели; RTT — по keepalive-пингам websockets"""
+        while True:
+            self.health.rtt_ms = ws.latency * 1000 if ws.latency else None
+            self.health_changed.emit(self.health_snapshot())
+            await asyncio.sleep(self.HEALTH_INTERVAL)
+
+    def health_snapshot(self):
+        """Показатели соединения словарем (можно вызывать из любого потока)"""
+        snapshot = self.health.snapshot(self.scheduler.bytes_sent)
+        snapshot["server"] = self.uri
+        snapshot["failovers"] = self.pool.failovers
+        return snapshot
+
+    def health_summary(self):
+        return health_summary(self.health_snapshot())
+
+    def _send_hello(self):
+        """Сообщает серверу возможности и кодеки клиента; ответ не обязателен"""
+        self._hello_id = str(uuid.uuid4())
+        hello = {
+            "action": "hello",
+            "request_id": self._hello_id,
+            "features": list(CLIENT_FEATURES),
+            "codecs": list(CODECS),
+        }
+        ticket = self.session_ticket
+        if ticket:
+            hello["resume"] = {"ticket": ticket, "subscriptions": dict(self.resume_subscriptions)}
+        self.scheduler.put("interactive", JSON_CODEC.encode(hello))
+
+    def _on_hello(self, data):
+        self._hello_id = None
+        if data.get("success"):
+            self.server_features = set(data.get("features", []))
+            # С этого момента сервер шлёт бинарные кадры выбранного кодека
+            self.codec = get_codec(data.get("codec", "json"))
+            print(f"[WS] Server features: {sorted(self.server_features)}, codec: {self.codec.name}")
+        if self.recorder is not None:
+            self.recorder.meta(codec=self.codec.name, features=sorted(self.server_features))
+        resume = data.get("resume")
+        if isinstance(resume, dict):
+            if resume.get("success"):
+                self.session_ticket = resume.get("ticket") or self.session_ticket
+            else:
+                print(f"[WS] Сеанс не восстановлен: {resume.get('error')}")
+                self.session_ticket = None
+            self.session_resumed.emit(resume)
+        resumed = bool(isinstance(resume, dict) and resume.get("success"))
+        ready_ms = (time.monotonic() - self._attempt_started) * 1000 if self._attempt_started else 0.0
+        self.health.on_ready(ready_ms, resumed)
+        print(f"[WS] Готов к работе через {ready_ms:.0f} мс после начала подключения"
+              f"{' (сеанс восстановлен)' if resumed else ''}")
+        self.negotiated = True
+        self.server_ready.emit(sorted(self.server_features))
+
+    def _post(self, data):
+        """Кладёт сообщение во входящую пачку для GUI-потока (вызывать в WS-потоке)"""
+        self._inbox.append(data)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.loop.call_soon(self._flush_inbox)
+
+    def _flush_inbox(self):
+        """Передаёт в GUI-поток все кадры, накопленные с прошлого сброса, в порядке прихода.
+
+        Пачка режется только на границах push/ответ: push сразу после ответа на
+        subscribe должен дойти до PingSubscriptions уже после on_subscribed.
+        """
+        self._flush_scheduled = False
+        batch, self._inbox = self._inbox, []
+        run, run_is_push = [], False
+        for data in batch:
+            is_push = data.get("action") == "push"
+            if run and is_push != run_is_push:
+                (self.push_received if run_is_push else self.messages_received).emit(run)
+                run = []
+            run.append(data)
+            run_is_push = is_push
+        if run:
+            (self.push_received if run_is_push else self.messages_received).emit(run)
+
+    def is_ready(self):
+        return bool(self.websocket) and self.isRunning()
+
+    def is_negotiated(self):
+        """Соединение есть и hello обработан: server_features известны (потоки, разница, пачки)"""
+        return self.negotiated and self.is_ready()
+
+    def request(self, action, callback=None, timeout=None, owner=None, **kwargs):
+        """Отправляет запрос и возвращает RequestFuture.
+
+        callback вызывается в GUI-потоке ровно один раз — с ответом сервера или
+        с ошибкой (таймаут, обрыв связи, нет соединения). owner — QObject
+        (обычно диалог), при закрытии которого запрос отменяется.
+        """
+        future = self.requests.create(action, callback, timeout, owner)
+        if not self.is_ready():
+            self.requests.reject_later(future, "Нет связи с сервером")
+            return future
+        if self.requests.join_read(future, kwargs):
+            self.requests.track(future, sent=False)
+            return future
+        if action in RequestManager.READ_ACTIONS:
+            future.params = kwargs
+        self.requests.track(future)
+        self._put_request(action, future.request_id, kwargs)
+        return future
+
+    def _put_request(self, action, request_id, kwargs):
+        # Сериализуем здесь, в GUI-потоке: данные карты могут меняться после вызова
+        request = {"action": action, "request_id": request_id, **kwargs}
+        codec = self.codec
+        chunk_codec = codec if "chunked" in self.server_features else None
+        self.loop.call_soon_threadsafe(
+            self.scheduler.put, send_class_for(action), codec.encode(request), chunk_codec
+        )
+
+    def _on_connected_changed(self, is_connected):
+        # Чтения переживают обрыв, если клиент будет переподключаться
+        self.requests.on_connection_changed(is_connected, hold_reads=self.running)
+
+    def _resend_held(self, _features):
+        """Новое соединение готово: повторяет чтения, не получившие ответа до обрыва"""
+        futures = self.requests.take_held()
+        for future in futures:
+            if future.streamed and "stream" in self.server_features:
+                self.loop.call_soon_threadsafe(
+                    self._start_download, {"action": future.action, "request_id": future.request_id, **future.params}
+                )
+            else:
+                self._put_request(future.action, future.request_id, future.params)
+        if futures:
+            print(f"[WS] Повторно отправлено чтений: {len(futures)}")
+
+    def pack_bytes(self, data):
+        """Двоичные данные для поля запроса: bytes при бинарном кодеке, иначе base64"""
+        return pack_bytes(data, self.codec)
+
+    def batch(self, owner=None):
+        """Создаёт пакет запросов (см. RequestBatch)"""
+        return RequestBatch(self, owner)
+
+    def _send_batch(self, items, owner):
+        if "batch" not in self.server_features or len(items) < 2:
+            return [self.request(action, callback, timeout, owner, **kwargs) for action, callback, timeout, kwargs in items]
+
+        futures = [self.requests.create(action, callback, timeout, owner) for action, callback, timeout, _ in items]
+        if not self.is_ready():
+            for future in futures:
+                self.requests.reject_later(future, "Нет связи с сервером")
+            return futures
+
+        sub_requests = []
+        for future, (action, _, _, kwargs) in zip(futures, items):
+            if self.requests.join_read(future, kwargs):
+                self.requests.track(future, sent=False)
+                continue
+            if action in RequestManager.READ_ACTIONS:
+                future.params = kwargs
+            self.requests.track(future)
+            sub_requests.append({"action": action, "request_id": future.request_id, **kwargs})
+        if not sub_requests:
+            return futures
+        # Присоединённые к чтениям вне пакета ждут своих ответов, ошибка пакета их не касается
+        sub_ids = [request["request_id"] for request in sub_requests]
+
+        def on_batch_response(data):
+            # Ответы вложенных запросов разбираются так же, как отдельные кадры
+            self.requests.dispatch(data.get("responses") or [])
+            # Всё, на что в пакете не нашлось ответа, завершаем ошибкой пакета
+            self.requests.fail(sub_ids, data.get("error") or "Нет ответа в пакете", bool(data.get("transport_error")))
+
+        self.request("batch", on_batch_response, max(f.timeout for f in futures), owner, requests=sub_requests)
+        return futures
+
+    # === Потоковая передача ===
+    def stream_request(self, action, callback=None, timeout=None, owner=None, progress=None, **kwargs):
+        """Как request(), но крупное поле (STREAM_FIELDS) идёт потоком фрагментов.
+
+        Скачанная часть ответа сохраняется при обрыве: повторный запрос того же
+        файла продолжит с места остановки, если файл на сервере не изменился.
+        Выгрузка продолжается с того, что сервер уже получил. progress(done, total)
+        вызывается в GUI-потоке; пока идут фрагменты, таймаут запроса отодвигается.
+        Сервер без "stream" получает обычный запрос (bytes — через pack_bytes).
+        """
+        field = STREAM_FIELDS.get(action)
+        if "stream" not in self.server_features or field is None:
+            if isinstance(kwargs.get(field), (bytes, bytearray)):
+                kwargs[field] = self.pack_bytes(kwargs[field])
+            return self.request(action, callback, timeout, owner, **kwargs)
+
+        if action in STREAM_UPLOADS:
+            # Кодируем здесь, в GUI-потоке: данные (например, карта) могут меняться, пока запрос в очереди
+            value = kwargs.pop(field, None)
+            blob, encoding = encode_blob(value)
+            if len(blob) < STREAM_THRESHOLD:
+                kwargs[field] = self.pack_bytes(value) if encoding == "raw" else value
+                return self.request(action, callback, timeout, owner, **kwargs)
+
+        future = self.requests.create(action, callback, timeout, owner)
+        if not self.is_ready():
+            self.requests.reject_later(future, "Нет связи с сервером")
+            return future
+        if action not in STREAM_UPLOADS and self.requests.join_read(future, kwargs):
+            # Такое же скачивание уже идёт — ход передачи показывает первый запрос
+            self.requests.track(future, sent=False)
+            return future
+        if action not in STREAM_UPLOADS and action in RequestManager.READ_ACTIONS:
+            future.params = dict(kwargs)
+            future.streamed = True
+        self.requests.track(future)
+        if progress is not None:
+            self._progress_handlers[future.request_id] = progress
+            future.add_done_callback(lambda _: self._progress_handlers.pop(future.request_id, None))
+        message = {"action": action, "request_id": future.request_id, **kwargs}
+        if action in STREAM_UPLOADS:
+            self.loop.call_soon_threadsafe(self._start_upload, message, field, blob, encoding)
+        else:
+            self.loop.call_soon_threadsafe(self._start_download, message)
+        return future
+
+    def _on_transfer_progress(self, request_id, done, total):
+        future = self.requests._pending.get(request_id)
+        if future is not None:
+            # Данные идут — запрос жив, даже если целиком он дольше таймаута
+            future.deadline = time.monotonic() + future.timeout
+        handler = self._progress_handlers.get(request_id)
+        if handler is not None:
+            handler(done, total)
+
+    def _start_upload(self, message, field, blob, encoding):
+        task = self.loop.create_task(self._stream_upload(message, field, blob, encoding))
+        self._upload_tasks.add(task)
+        task.add_done_callback(self._upload_tasks.discard)
+
+    def _start_download(self, message):
+        action = message["action"]
+        now = time.monotonic()
+        for key in [k for k, p in self._downloads.items() if now - p["updated"] > self.PARTIAL_TTL]:
+            del self._downloads[key]
+        key = (action, tuple(sorted((k, str(v)) for k, v in message.items() if k != "request_id")))
+        partial = self._downloads.get(key)
+        if partial and partial["version"]:
+            message["stream"] = {"offset": len(partial["buffer"]), "version": partial["version"]}
+            print(f"[WS] Докачка {action} с {len(partial['buffer'])} байт")
+        else:
+            partial = self._downloads[key] = {"version": None, "buffer": bytearray(), "updated": now}
+            message["stream"] = {"offset": 0}
+        self._download_keys.pop(partial.get("request_id"), None)
+        partial["request_id"] = message["request_id"]
+        self._download_keys[message["request_id"]] = key
+        self.scheduler.put(send_class_for(action), self.codec.encode(message))
+
+    def _on_stream_chunk(self, chunk):
+        request_id = chunk.get("request_id")
+        key = self._download_keys.get(request_id)
+        partial = self._downloads.get(key)
+        if partial is None:
+            return
+        if chunk.get("version") != partial["version"] or chunk.get("offset") == 0:
+            # Файл изменился (или докачка не принята) — начинаем заново
+            partial["version"] = chunk.get("version")
+            partial["buffer"] = bytearray()
+        if chunk.get("offset") != len(partial["buffer"]):
+            del self._downloads[key], self._download_keys[request_id]
+            self._post({"request_id": request_id, "success": False, "error": "Нарушен порядок фрагментов"})
+            return
+        partial["buffer"] += unpack_bytes(chunk.get("data"))
+        partial["updated"] = time.monotonic()
+        self.transfer_progress.emit(request_id, len(partial["buffer"]), chunk.get("total", 0))
+        if not chunk.get("final"):
+            return
+
+        del self._downloads[key], self._download_keys[request_id]
+        response = dict(chunk.get("response") or {"success": True})
+        response["request_id"] = request_id
+        try:
+            # Разбор крупного JSON здесь, в WS-потоке, а не в GUI
+            response[chunk["field"]] = decode_blob(partial["buffer"], chunk.get("encoding"))
+        except Exception as e:
+            response = {"request_id": request_id, "success": False, "error": f"Ошибка разбора потока: {e}"}
+        self._post(response)
+
+    async def _local_request(self, message, timeout=30):
+        """Служебный запрос из WS-потока; ответ не уходит в GUI"""
+        message["request_id"] = str(uuid.uuid4())
+        waiter = self.loop.create_future()
+        self._local_waiters[message["request_id"]] = waiter
+        self.scheduler.put("interactive", self.codec.encode(message))
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        finally:
+            self._local_waiters.pop(message["request_id"], None)
+
+    async def _stream_upload(self, message, field, blob, encoding):
+        request_id = message["request_id"]
+        transfer_id = blob_version(blob)
+        total = len(blob)
+        try:
+            status = await self._local_request({"action": "stream_put", "transfer_id": transfer_id, "total": total})
+        except asyncio.TimeoutError:
+            self._post({"request_id": request_id, "success": False, "error": "Сервер не ответил на начало выгрузки",
+                        "transport_error": True})
+            return
+        if not status.get("success"):
+            self._post({"request_id": request_id, "success": False, "error": status.get("error")})
+            return
+        offset = status.get("offset", 0)
+        if offset:
+            print(f"[WS] Продолжение выгрузки с {offset} из {total} байт")
+
+        def frames():
+            # Кадры кодируются по мере отправки, ход передачи — по факту ухода в сокет
+            for start in range(offset, total, STREAM_CHUNK):
+                data = blob[start:start + STREAM_CHUNK]
+                yield self.codec.encode({"action": "stream_chunk", "transfer_id": transfer_id, "offset": start,
+                                         "data": pack_bytes(data, self.codec)})
+                self.transfer_progress.emit(request_id, start + len(data), total)
+
+        send_class = send_class_for(message["action"])
+        self.scheduler.put_frames(send_class, frames())
+        # Тот же класс очереди — сам запрос уйдёт после всех фрагментов
+        message["stream"] = {"transfer_id": transfer_id, "field": field, "encoding": encoding, "total": total}
+        self.scheduler.put(send_class, self.codec.encode(message))
+
+    def send_request(self, action, **kwargs):
+        """Совместимый вызов: возвращает request_id (или None без соединения),
+        обработчик регистрируется через pending_requests[request_id] = callback"""
+        if not self.is_ready():
+            self.requests.stats["not_sent"] += 1
+            return None
+        return self.request(action, **kwargs).request_id
+
+    def summary(self):
+        """Сводка по запросам и очереди отправки (для подсказки индикатора связи)"""
+        parts = [self.requests.summary(), self.scheduler.summary()]
+        if len(self.pool.uris) > 1:
+            parts.append(self.pool.summary())
+        return "\n".join(part for part in parts if part)
+
+    def stop(self):
+        self.running = False
+        # Закрываем сокет, чтобы прервать ожидание очередного кадра, и будим паузу переподключения
+        if self.loop and self.websocket:
+            asyncio.run_coroutine_threadsafe(self.websocket.close(), self.loop)
+        if self.loop and getattr(self, "_stop_event", None):
+            self.loop.call_soon_threadsafe(self._stop_event.set)
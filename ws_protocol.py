@@ -0,0 +1,535 @@
+# ws_protocol.py — общие части протокола WebSocket-клиента (без зависимостей от Qt)
+
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import random
+import time
+import uuid
+
+# Необязательные бинарные кодеки: без них клиент работает на JSON
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+# Возможности, о которых клиент сообщает серверу в hello:
+#   chunked — клиент может дробить большие сообщения на кадры action=chunk
+#   batch   — клиент может слать несколько запросов одним кадром action=batch:
+#             {"action": "batch", "request_id", "requests": [{"action", "request_id", ...}, ...]}
+#             -> {"request_id", "success": true, "responses": [{"request_id", ...}, ...]}
+#   push    — подписка на изменения pingok вместо опроса check_ping_updates:
+#             {"action": "subscribe", "request_id", "map_id", "since_seq"}
+#             -> {"request_id", "success": true, "seq", "full", "updates": [{"id", "index", "pingok"}, ...]}
+#             затем без запроса: {"action": "push", "topic": "pingok", "map_id", "seq", "updates": [...]}
+#             {"action": "unsubscribe", "request_id", "map_id"} -> {"request_id", "success": true}
+#   stream  — крупные данные (STREAM_FIELDS) идут потоком фрагментов с докачкой, см. ниже
+#   patch   — карта сохраняется разницей от подтверждённой версии (JSON Patch, см. json_patch.py):
+#             {"action": "file_patch", "request_id", "path", "base_version", "patch": [...]}
+#             -> {"request_id", "success": true, "version"}
+#             или {"success": false, "conflict": true, "version"} — тогда клиент шлёт file_put.
+#             Номер версии ("version" в корне документа карты) ведёт сервер; file_put карты тоже
+#             возвращает новый "version".
+#
+# file_get карты может нести "known_version" — версию из локального кеша (map_cache.py); если она
+# совпадает с серверной, ответ {"success": true, "not_modified": true, "version"} приходит без "data".
+# Эта часть не зависит от features: сервер, не знающий known_version, просто отдаёт карту.
+#
+# Возобновление сеанса: auth_login возвращает "ticket"; после переподключения (или при
+# новом запуске) клиент кладёт в hello "resume": {"ticket", "subscriptions": {map_id: since_seq}},
+# и ответ на hello несёт "resume": {"success", "user", "ticket", "subscriptions": {map_id:
+# ответ subscribe}, "files": ответ list_maps} — один обмен вместо входа, подписок и списка карт.
+CLIENT_FEATURES = ("chunked", "batch", "push", "stream", "patch")
+
+
+# === КОДЕКИ ===
+class JsonCodec:
+    """Текстовые кадры JSON — формат по умолчанию, понятный любому серверу"""
+    name = "json"
+    binary = False
+
+    def encode(self, obj):
+        return json.dumps(obj)
+
+    def decode(self, frame):
+        return json.loads(frame)
+
+
+class MsgpackCodec:
+    """Бинарные кадры MessagePack; bytes передаются как есть, без base64"""
+    name = "msgpack"
+    binary = True
+
+    def encode(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def decode(self, frame):
+        return msgpack.unpackb(frame, raw=False)
+
+
+class CborCodec:
+    """Бинарные кадры CBOR; bytes передаются как есть, без base64"""
+    name = "cbor"
+    binary = True
+
+    def encode(self, obj):
+        return cbor2.dumps(obj)
+
+    def decode(self, frame):
+        return cbor2.loads(frame)
+
+
+JSON_CODEC = JsonCodec()
+
+# Кодеки, доступные в этой установке, в порядке предпочтения
+CODECS = {}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+if cbor2 is not None:
+    CODECS["cbor"] = CborCodec()
+CODECS["json"] = JSON_CODEC
+
+
+def get_codec(name):
+    """Кодек по имени из ответа сервера; неизвестное имя — JSON"""
+    return CODECS.get(name, JSON_CODEC)
+
+
+def decode_frame(frame, codec):
+    """Текстовый кадр — всегда JSON, бинарный — согласованный кодек"""
+    if isinstance(frame, str):
+        return JSON_CODEC.decode(frame)
+    return codec.decode(frame)
+
+
+def pack_bytes(data, codec):
+    """Готовит двоичные данные (картинку) к отправке: bytes для бинарного кодека, base64 для JSON"""
+    if codec.binary:
+        return data
+    return base64.b64encode(data).decode()
+
+
+def unpack_bytes(value):
+    """Обратное к pack_bytes: принимает и bytes, и base64-строку"""
+    if value is None:
+        return b""
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    return base64.b64decode(value)
+
+# === КЛАССЫ ПРИОРИТЕТА ОТПРАВКИ ===
+# Порядок важен: чем раньше в списке, тем выше приоритет
+SEND_CLASSES = ("interactive", "polling", "bulk", "upload")
+
+# action -> класс; всё, чего нет в словаре, считается интерактивным чтением
+ACTION_SEND_CLASSES = {
+    "check_ping_updates": "polling",
+    "ping_switches": "polling",
+    "ping": "polling",
+    "file_put": "bulk",
+    "file_patch": "bulk",
+    "csv_write": "bulk",
+    "save_model": "bulk",
+    "delete_model": "bulk",
+    "save_operators": "bulk",
+    "save_groups": "bulk",
+    "save_masters": "bulk",
+    "save_engineers": "bulk",
+    "save_firmwares": "bulk",
+    "save_mngmt_vlan": "bulk",
+    "upload_image": "upload",
+}
+
+# Размер фрагмента при дроблении больших сообщений (символов JSON или байт бинарного кадра)
+CHUNK_SIZE = 64 * 1024
+
+
+def send_class_for(action):
+    return ACTION_SEND_CLASSES.get(action, "interactive")
+
+
+def iter_chunks(frame, codec=JSON_CODEC, chunk_size=CHUNK_SIZE):
+    """Разбивает закодированное сообщение на кадры action=chunk.
+
+    Сервер склеивает data всех кадров с одним transfer_id по порядку seq
+    и обрабатывает результат как обычное сообщение (str — JSON, bytes —
+    согласованный кодек).
+    """
+    transfer_id = str(uuid.uuid4())
+    total = (len(frame) + chunk_size - 1) // chunk_size
+    for seq in range(total):
+        yield codec.encode({
+            "action": "chunk",
+            "transfer_id": transfer_id,
+            "seq": seq,
+            "final": seq == total - 1,
+            "data": frame[seq * chunk_size:(seq + 1) * chunk_size],
+        })
+
+
+class SendScheduler:
+    """Очередь отправки с классами приоритета.
+
+    Работает в цикле событий WS-потока. Перед каждым кадром выбирается
+    самый приоритетный непустой класс, поэтому между фрагментами большой
+    выгрузки успевают уйти короткие запросы. Внутри класса порядок FIFO,
+    так что записи одного класса не обгоняют друг друга.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.queues = {cls: collections.deque() for cls in SEND_CLASSES}
+        self.metrics = {
+            cls: {"depth": 0, "max_depth": 0, "sent": 0, "frames": 0, "dropped": 0,
+                  "wait_total_ms": 0.0, "wait_max_ms": 0.0}
+            for cls in SEND_CLASSES
+        }
+        self.bytes_sent = 0
+        # TrafficRecorder: каждый отправленный кадр пишется в запись трафика
+        self.recorder = None
+        self._wakeup = asyncio.Event()
+
+    def put(self, send_class, frame, chunk_codec=None):
+        """Ставит сообщение в очередь (вызывать из потока цикла событий).
+
+        chunk_codec — кодек соединения, если сервер принимает кадры action=chunk.
+        """
+        if chunk_codec is not None and len(frame) > self.chunk_size:
+            frames = iter_chunks(frame, chunk_codec, self.chunk_size)
+        else:
+            frames = iter((frame,))
+        self.put_frames(send_class, frames)
+
+    def put_frames(self, send_class, frames):
+        """Ставит в очередь готовую последовательность кадров (итератор, кадры создаются по мере отправки)"""
+        queue = self.queues[send_class]
+        # [время постановки, итератор кадров, отправлен ли первый кадр]
+        queue.append([time.monotonic(), frames, False])
+        metrics = self.metrics[send_class]
+        metrics["depth"] = len(queue)
+        metrics["max_depth"] = max(metrics["max_depth"], len(queue))
+        self._wakeup.set()
+
+    def clear(self):
+        """Сбрасывает очередь — кадры для разорванного соединения уже не нужны"""
+        for send_class, queue in self.queues.items():
+            self.metrics[send_class]["dropped"] += len(queue)
+            self.metrics[send_class]["depth"] = 0
+            queue.clear()
+
+    def _next_job(self):
+        for send_class in SEND_CLASSES:
+            if self.queues[send_class]:
+                return send_class, self.queues[send_class][0]
+        return None, None
+
+    async def run(self, ws):
+        """Отправляет кадры в ws, пока задачу не отменят"""
+        while True:
+            send_class, job = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            metrics = self.metrics[send_class]
+            frame = next(job[1], None)
+            if frame is None:
+                self.queues[send_class].popleft()
+                metrics["depth"] = len(self.queues[send_class])
+                metrics["sent"] += 1
+                continue
+
+            if not job[2]:
+                job[2] = True
+                wait_ms = (time.monotonic() - job[0]) * 1000
+                metrics["wait_total_ms"] += wait_ms
+                metrics["wait_max_ms"] = max(metrics["wait_max_ms"], wait_ms)
+
+            await ws.send(frame)
+            if self.recorder is not None:
+                self.recorder.record("out", frame)
+            metrics["frames"] += 1
+            self.bytes_sent += len(frame)
+
+    def summary(self):
+        """Текстовая сводка: глубина очереди и ожидание по классам"""
+        lines = []
+        for send_class in SEND_CLASSES:
+            m = self.metrics[send_class]
+            if not m["sent"] and not m["depth"]:
+                continue
+            avg_wait = m["wait_total_ms"] / m["sent"] if m["sent"] else 0.0
+            lines.append(
+                f"{send_class}: в очереди {m['depth']} (max {m['max_depth']}), "
+                f"ожидание avg {avg_wait:.0f} / max {m['wait_max_ms']:.0f} мс"
+            )
+        return "\n".join(lines)
+
+
+# === ПОТОКОВАЯ ПЕРЕДАЧА ===
+# Поле с крупными данными у действий, которые умеют передавать его потоком.
+#
+# Скачивание: запрос несёт "stream": {"offset", "version"}; сервер отвечает кадрами
+#   {"action": "stream_chunk", "request_id", "version", "offset", "total", "data", "final"},
+#   последний кадр дополнительно несёт "field", "encoding" и "response" — остальные поля ответа.
+#   version — хеш содержимого: докачка с offset возможна, только пока он не изменился.
+# Выгрузка: {"action": "stream_put", "request_id", "transfer_id", "total"} -> {"offset"} — сколько
+#   байт сервер уже получил; затем кадры {"action": "stream_chunk", "transfer_id", "offset", "data"}
+#   без ответов и сам запрос с "stream": {"transfer_id", "field", "encoding", "total"} вместо поля.
+#   transfer_id — хеш содержимого, поэтому повтор того же сохранения продолжает прерванную выгрузку.
+STREAM_FIELDS = {
+    "file_get": "data",
+    "download_image": "image",
+    "file_put": "data",
+    "upload_image": "image",
+}
+STREAM_UPLOADS = ("file_put", "upload_image")
+
+# Размер фрагмента потока и порог, с которого выгрузка идёт потоком
+STREAM_CHUNK = 256 * 1024
+STREAM_THRESHOLD = 256 * 1024
+
+
+def encode_blob(value):
+    """Значение поля -> (bytes, encoding): bytes передаются как есть, остальное — JSON в UTF-8"""
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value), "raw"
+    return json.dumps(value, ensure_ascii=False).encode("utf-8"), "json"
+
+
+def decode_blob(blob, encoding):
+    if encoding == "raw":
+        return bytes(blob)
+    return json.loads(bytes(blob).decode("utf-8"))
+
+
+def blob_version(blob):
+    return hashlib.sha256(blob).hexdigest()[:32]
+
+
+# === ПЕРЕПОДКЛЮЧЕНИЕ И ЗДОРОВЬЕ СОЕДИНЕНИЯ ===
+class ReconnectPolicy:
+    """Экспоненциальная задержка переподключения с ограничением и случайным разбросом.
+
+    Половина задержки фиксирована, половина случайна: после перезапуска
+    сервера консоли операторов расходятся во времени, а не приходят разом.
+    Счётчик попыток сбрасывается, только если соединение продержалось
+    stable_after секунд, — иначе «мигающий» сервер не получит паузы.
+    """
+
+    def __init__(self, base=1.0, cap=60.0, factor=2.0, stable_after=30.0):
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.stable_after = stable_after
+        self.attempt = 0
+
+    def next_delay(self):
+        delay = min(self.cap, self.base * self.factor ** self.attempt)
+        self.attempt += 1
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def connection_lasted(self, seconds):
+        if seconds >= self.stable_after:
+            self.attempt = 0
+
+
+class ServerPool:
+    """Несколько адресов одного сервиса: выбор самого быстрого исправного и переключение.
+
+    Перед подключением клиент проверяет адреса (рукопожатие + ping) и берёт
+    тот, у кого меньше сумма времён; при равенстве — раньше указанный.
+    Адрес, к которому не удалось подключиться или с которым оборвалась связь,
+    откладывается на время, растущее с каждой неудачей подряд. Пока есть
+    неотложенные адреса, переключение происходит сразу, без паузы
+    переподключения. Результат проверки действует PROBE_TTL секунд:
+    переподключение в это время не открывает заново пробные соединения
+    ко всем адресам, а проверяет только те, чьи данные устарели.
+    """
+    FAIL_COOLDOWN = 30.0
+    MAX_COOLDOWN = 300.0
+    PROBE_TTL = 60.0
+
+    def __init__(self, uris):
+        self.uris = list(dict.fromkeys(uris))
+        self.stats = {uri: {"handshake_ms": None, "rtt_ms": None, "probed_at": None, "failures": 0,
+                            "down_until": 0.0} for uri in self.uris}
+        self.current = None
+        self.failovers = 0
+
+    def candidates(self):
+        """Адреса, которые стоит пробовать; если отложены все — все"""
+        now = time.monotonic()
+        up = [uri for uri in self.uris if self.stats[uri]["down_until"] <= now]
+        return up or list(self.uris)
+
+    def has_standby(self):
+        """Есть ли неотложенный адрес, к которому можно переключиться без паузы"""
+        now = time.monotonic()
+        return any(self.stats[uri]["down_until"] <= now for uri in self.uris)
+
+    def probed(self, uris):
+        """Адреса из uris, проверенные успешно не раньше PROBE_TTL секунд назад"""
+        now = time.monotonic()
+        return [uri for uri in uris
+                if self.stats[uri]["probed_at"] is not None and now - self.stats[uri]["probed_at"] <= self.PROBE_TTL]
+
+    def on_probe(self, uri, handshake_ms, rtt_ms):
+        stats = self.stats[uri]
+        if handshake_ms is None:
+            self.on_failure(uri)
+            return
+        stats["handshake_ms"] = handshake_ms
+        stats["rtt_ms"] = rtt_ms
+        stats["probed_at"] = time.monotonic()
+
+    def on_failure(self, uri):
+        stats = self.stats[uri]
+        stats["failures"] += 1
+        # Прежняя проверка больше не говорит, что адрес жив: после отсрочки проверим заново
+        stats["probed_at"] = None
+        cooldown = min(self.MAX_COOLDOWN, self.FAIL_COOLDOWN * 2 ** (stats["failures"] - 1))
+        stats["down_until"] = time.monotonic() + cooldown
+
+    def on_connected(self, uri):
+        stats = self.stats[uri]
+        stats["failures"] = 0
+        stats["down_until"] = 0.0
+        if self.current is not None and self.current != uri:
+            self.failovers += 1
+        self.current = uri
+
+    def best(self, uris):
+        """Самый быстрый из uris по последней проверке; непроверенные — после проверенных"""
+        def score(uri):
+            stats = self.stats[uri]
+            if stats["handshake_ms"] is None:
+                return (1, self.uris.index(uri))
+            return (0, stats["handshake_ms"] + (stats["rtt_ms"] or 0), self.uris.index(uri))
+        return min(uris, key=score)
+
+    def summary(self):
+        lines = []
+        now = time.monotonic()
+        for uri in self.uris:
+            stats = self.stats[uri]
+            mark = "●" if uri == self.current else " "
+            if stats["down_until"] > now:
+                state = f"отложен на {stats['down_until'] - now:.0f} с"
+            elif stats["handshake_ms"] is not None:
+                state = f"рукопожатие {stats['handshake_ms']:.0f} мс, RTT {stats['rtt_ms'] or 0:.0f} мс"
+            else:
+                state = "не проверен"
+            lines.append(f"{mark} {uri}: {state}")
+        return "\n".join(lines)
+
+
+class ConnectionHealth:
+    """Показатели соединения: RTT, переподключения, время на связи, трафик"""
+
+    def __init__(self):
+        self.connects = 0
+        self.reconnects = 0
+        self.failures = 0
+        self.outage_failures = 0      # неудачных попыток с последнего подключения
+        self.connected_since = None   # time.monotonic() текущего подключения
+        self.connected_total = 0.0    # секунд на связи в завершённых подключениях
+        self.started_at = time.monotonic()
+        self.rtt_ms = None
+        self.bytes_in = 0
+        self.frames_in = 0
+        self.last_error = ""
+        self.retry_at = None          # когда будет следующая попытка подключения
+        self.ready_ms = None          # от начала попытки подключения до готовности (ответ на hello)
+        self.resumed = False          # восстановлен ли сеанс по билету при последнем подключении
+
+    def on_connected(self):
+        if self.connects:
+            self.reconnects += 1
+        self.connects += 1
+        self.connected_since = time.monotonic()
+        self.outage_failures = 0
+        self.retry_at = None
+        self.rtt_ms = None
+
+    def on_disconnected(self, error=""):
+        """Возвращает длительность завершившегося подключения (0 — подключиться не удалось)"""
+        lasted = 0.0
+        if self.connected_since is not None:
+            lasted = time.monotonic() - self.connected_since
+            self.connected_total += lasted
+            self.connected_since = None
+        else:
+            self.failures += 1
+            self.outage_failures += 1
+        if error:
+            self.last_error = error
+        return lasted
+
+    def on_ready(self, ready_ms, resumed):
+        self.ready_ms = ready_ms
+        self.resumed = resumed
+
+    def on_frame(self, frame):
+        self.frames_in += 1
+        self.bytes_in += len(frame)
+
+    def snapshot(self, bytes_out=0):
+        now = time.monotonic()
+        session = now - self.connected_since if self.connected_since is not None else 0.0
+        uptime = now - self.started_at
+        return {
+            "connected": self.connected_since is not None,
+            "rtt_ms": self.rtt_ms,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "failures": self.failures,
+            "outage_failures": self.outage_failures,
+            "session_s": session,
+            "connected_total_s": self.connected_total + session,
+            "availability": (self.connected_total + session) / uptime if uptime else 0.0,
+            "bytes_in": self.bytes_in,
+            "bytes_out": bytes_out,
+            "frames_in": self.frames_in,
+            "last_error": self.last_error,
+            "retry_in_s": max(0.0, self.retry_at - now) if self.retry_at is not None else None,
+            "ready_ms": self.ready_ms,
+            "resumed": self.resumed,
+        }
+
+
+def format_bytes(n):
+    for unit in ("Б", "КБ", "МБ"):
+        if n < 1024:
+            return f"{n:.0f} {unit}"
+        n /= 1024
+    return f"{n:.1f} ГБ"
+
+
+def health_summary(h):
+    """Текстовая сводка snapshot() для подсказки индикатора связи"""
+    rtt = f"{h['rtt_ms']:.0f} мс" if h["rtt_ms"] is not None else "—"
+    lines = [
+        f"Сервер: {h['server']}" if h.get("server") else None,
+        f"RTT: {rtt}",
+        f"На связи: {h['session_s'] / 60:.0f} мин (всего {h['availability'] * 100:.0f}% времени)",
+        f"Переподключений: {h['reconnects']}, неудачных попыток: {h['failures']}",
+        f"Трафик: принято {format_bytes(h['bytes_in'])}, отправлено {format_bytes(h['bytes_out'])}",
+    ]
+    if h.get("ready_ms") is not None:
+        resumed = ", сеанс восстановлен" if h.get("resumed") else ""
+        lines.append(f"Готовность после подключения: {h['ready_ms']:.0f} мс{resumed}")
+    if h.get("failovers"):
+        lines.append(f"Переключений на резервный адрес: {h['failovers']}")
+    if h["last_error"]:
+        lines.append(f"Последняя ошибка: {h['last_error']}")
+    return "\n".join(line for line in lines if line)